@@ -0,0 +1,270 @@
+#Benchmark suite for the decode, filter, render and codec stages
+#Results are written as JSON so runs on different commits can be compared:
+#   python benchmark.py --output before.json
+#   python benchmark.py --compare before.json
+#The serial reader is fed through a pty where the OS has them, otherwise through pyserial's loop://
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import itertools
+from threading import Thread
+import numpy as np
+import cv2 as cv
+
+from constants import *
+from line_decoder import BatchLineDecoder, MsgpackLineDecoder, pack_line, LINES_PER_FRAME, PIXELS_PER_LINE
+from ir_serial_reader import IRSerialReader
+from frame_renderer import FrameRenderer, RenderSettings
+from temperature_filter import TemperatureFilter
+from frame_codec import FrameEncoder, FrameDecoder, compressors, stream_packet, DELTA_FRAME
+from frame_recorder import record_dtype
+
+
+#reproducible raw frames in 0.01 DegC: a gradient with a moving hot spot and sensor noise
+def synthetic_frames(num_frames, seed=0):
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:LINES_PER_FRAME, 0:PIXELS_PER_LINE]
+    frames = np.empty((num_frames, LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+    for n in range(num_frames):
+        hot_x = 16 + 10 * np.sin(n * 0.05)
+        hot_y = 12 + 6 * np.cos(n * 0.03)
+        hotspot = 1500 * np.exp(-((x - hot_x)**2 + (y - hot_y)**2) / 8)
+        frames[n] = 2000 + 20 * x + hotspot + rng.normal(0, 15, x.shape)
+    return frames
+
+
+def line_stream(frames):
+    return b"".join(pack_line(n, line, frame[line]) for n, frame in enumerate(frames) for line in range(LINES_PER_FRAME))
+
+
+def summarize(name, params, samples, items=1, unit="frames"):
+    samples = np.asarray(samples)
+    return {
+        "name": name,
+        "params": params,
+        "samples": len(samples),
+        "mean_ms": float(np.mean(samples) * 1000),
+        "median_ms": float(np.median(samples) * 1000),
+        "p95_ms": float(np.percentile(samples, 95) * 1000),
+        "throughput": float(items * len(samples) / np.sum(samples)),
+        "unit": "%s/s" % unit,
+    }
+
+
+#decoders on their own, chunks as ser.read(1000) returns them
+def bench_decoders(stream, chunk_size=1000):
+    chunks = [stream[i:i+chunk_size] for i in range(0, len(stream), chunk_size)]
+    lines_per_chunk = len(stream) / (len(chunks) * len(pack_line(0, 0, np.zeros(PIXELS_PER_LINE))))
+    results = []
+
+    #the decoders the reader uses, fed and timed the same way
+    for name, decoder in (("msgpack", MsgpackLineDecoder()), ("batch", BatchLineDecoder())):
+        frame_raw = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+        samples = []
+        for chunk in chunks:
+            start = time.perf_counter()
+            frame_counts, line_counts, pixels = decoder.feed(chunk)
+            frame_raw[line_counts] = pixels
+            samples.append(time.perf_counter() - start)
+        results.append(summarize("decode", {"decoder": name, "chunk_size": chunk_size}, samples, lines_per_chunk, "lines"))
+
+    return results
+
+
+#open a serial endpoint for the reader, returns (port, write function, close function)
+def open_transport():
+    if hasattr(os, "openpty"):
+        master, slave = os.openpty()
+        port = os.ttyname(slave)
+        return "pty", port, lambda data: os.write(master, data), lambda: (os.close(master), os.close(slave))
+    return "loop", "loop://", None, lambda: None
+
+
+#the whole IRSerialReader thread, from bytes written to the port to frames published in the ring
+def bench_reader(stream, num_frames, decoder, timeout=60):
+    transport, port, write, close = open_transport()
+    reader = IRSerialReader(port, BAUDRATE_DEFAULT, decoder=decoder, ring_capacity=num_frames + 1)
+    while reader.ser is None and reader.is_alive():
+        time.sleep(0.01)
+    #let the reader flush its input before sending
+    time.sleep(0.2)
+    if write is None:
+        write = reader.ser.write
+
+    def send():
+        for i in range(0, len(stream), 4096):
+            write(stream[i:i+4096])
+
+    start = time.perf_counter()
+    sender = Thread(target=send, daemon=True)
+    sender.start()
+    while reader.frames.produced < num_frames and time.perf_counter() - start < timeout:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    produced = reader.frames.produced
+
+    reader.stop()
+    sender.join(1)
+    close()
+
+    result = summarize("reader", {"decoder": decoder, "transport": transport}, [elapsed], produced * LINES_PER_FRAME, "lines")
+    result["frames_received"] = produced
+    result["frames_sent"] = num_frames
+    return result
+
+
+#every filter kernel, the filter works in place so nothing is allocated per frame
+def bench_filter(frames):
+    temperatures = frames.astype(np.float32) * 0.01
+    results = []
+    for kernel in filter_kernels:
+        temperature_filter = TemperatureFilter((24, 32), FILTER_NOISE_DEFAULT, kernel)
+        samples = []
+        for frame in temperatures:
+            start = time.perf_counter()
+            temperature_filter.filter(frame)
+            samples.append(time.perf_counter() - start)
+        results.append(summarize("filter", {"kernel": kernel}, samples))
+    return results
+
+
+#delta codec one frame at a time, as the frame server sends them, with the compression ratio against raw records
+def bench_codec(frames):
+    results = []
+    for compressor in compressors:
+        encoder = FrameEncoder(compressor)
+        decoder = FrameDecoder(compressor, frames.shape[1:])
+        encoder.encode(0, 0.0, frames[0])
+        decoder.previous = frames[0]
+        encode_samples = []
+        decode_samples = []
+        size = 0
+        for n, frame in enumerate(frames[1:], 1):
+            start = time.perf_counter()
+            packet = encoder.encode(n, 0.0, frame)[1]
+            encode_samples.append(time.perf_counter() - start)
+            size += len(packet)
+            start = time.perf_counter()
+            decoder.decode(DELTA_FRAME, packet[stream_packet.size:])
+            decode_samples.append(time.perf_counter() - start)
+        ratio = (len(frames) - 1) * record_dtype.itemsize / size
+        for name, samples in [("encode", encode_samples), ("decode", decode_samples)]:
+            result = summarize("codec", {"direction": name, "compressor": compressor}, samples)
+            result["ratio"] = ratio
+            results.append(result)
+    return results
+
+
+#full render for every resolution, interpolation, contours and ticks combination
+def bench_render(frames, frames_per_case, colorization=COLORIZATION_DEFAULT):
+    temperatures = frames.astype(np.float32) * 0.01
+    results = []
+    for resolution, interpolation, show_contours, show_ticks in itertools.product(display_resolutions, display_interpolations, [False, True], [False, True]):
+        settings = RenderSettings(display_resolution=resolution, display_interpolation=interpolation,
+                                  show_contours=show_contours, show_scale_ticks=show_ticks, colorization=colorization)
+        renderer = FrameRenderer()
+        renderer.render(temperatures[0], settings)
+        samples = []
+        for frame in temperatures[:frames_per_case]:
+            start = time.perf_counter()
+            renderer.render(frame, settings)
+            samples.append(time.perf_counter() - start)
+        params = {"resolution": resolution, "interpolation": interpolation, "contours": show_contours, "ticks": show_ticks, "colorization": colorization}
+        results.append(summarize("render", params, samples))
+    return results
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv.__version__,
+        "platform": platform.platform(),
+        "cv_threads": cv.getNumThreads(),
+    }
+
+
+def result_key(result):
+    return result["name"] + json.dumps(result["params"], sort_keys=True)
+
+
+#print the change against a previous run, returns the number of cases slower than the threshold
+def compare(results, baseline, threshold):
+    baseline_results = {result_key(result): result for result in baseline["results"]}
+    regressions = 0
+    print("%-8s %-70s %10s %10s %8s" % ("stage", "params", "base ms", "ms", "change"))
+    for result in results:
+        base = baseline_results.get(result_key(result))
+        if base is None:
+            continue
+        ratio = result["mean_ms"] / base["mean_ms"]
+        flag = ""
+        if ratio > threshold:
+            flag = " SLOWER"
+            regressions += 1
+        params = ", ".join("%s=%s" % item for item in result["params"].items())
+        print("%-8s %-70s %10.3f %10.3f %7.0f%%%s" % (result["name"], params, base["mean_ms"], result["mean_ms"], (ratio - 1) * 100, flag))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the decode, filter, render and codec stages")
+    parser.add_argument("--frames", type=int, default=500, help="synthetic frames to decode and filter")
+    parser.add_argument("--render-frames", type=int, default=30, help="frames to render per render case")
+    parser.add_argument("--stages", default="decode,reader,filter,render,codec", help="comma separated stages to run")
+    parser.add_argument("--colorization", default=COLORIZATION_DEFAULT, choices=colorizations)
+    parser.add_argument("--output", help="write the results to this JSON file instead of stdout")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    stages = args.stages.split(",")
+    frames = synthetic_frames(args.frames)
+    stream = line_stream(frames)
+
+    results = []
+    if "decode" in stages:
+        results += bench_decoders(stream)
+    if "reader" in stages:
+        reader_frames = args.frames
+        if not hasattr(os, "openpty"):
+            #loop:// moves one byte at a time, keep the stream short
+            reader_frames = min(reader_frames, 50)
+        for decoder in line_decoders:
+            results.append(bench_reader(line_stream(frames[:reader_frames]), reader_frames, decoder))
+    if "filter" in stages:
+        results += bench_filter(frames)
+    if "render" in stages:
+        results += bench_render(frames, args.render_frames, args.colorization)
+    if "codec" in stages:
+        results += bench_codec(frames)
+
+    report = {"metadata": metadata(), "results": results}
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=1)
+    elif not args.compare:
+        json.dump(report, sys.stdout, indent=1)
+        print()
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
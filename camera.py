@@ -0,0 +1,120 @@
+import math
+import time
+from collections import deque
+import numpy as np
+
+from constants import *
+from ir_serial_reader import IRSerialReader
+from process_reader import ProcessReader
+from pixel_stats import PixelStats
+from roi_alarms import AlarmEngine
+from hotspot_tracker import HotspotTracker
+from temperature_filter import TemperatureFilter
+from link_control import LinkTuner
+
+
+#columns and rows of the tile grid for a number of cameras, as square as possible
+def tile_grid(count):
+    columns = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / columns)
+    return columns, rows
+
+
+#class for one connected sensor: its reader, filter, display settings and the last rendered tile
+#the app keeps a list of these and shows them tiled in one window
+class Camera():
+    def __init__(self, port, baudrate, decoder, settings, noise_threshold=FILTER_NOISE_DEFAULT, kernel=FILTER_KERNEL_DEFAULT,
+                 sample_rate=SAMPLE_RATE_DEFAULT, auto_link=AUTO_LINK_DEFAULT, frame_policy=FRAME_POLICY_DEFAULT,
+                 reader_mode=READER_MODE_DEFAULT, alarm_regions=None, alarm_log=None):
+        self.port = port
+        self.settings = settings
+        self.filter = TemperatureFilter((24, 32), noise_threshold, kernel)
+        self.frame = np.zeros((24, 32), dtype=np.float32)
+        #rows of the last frame that really arrived, the others are from the frame before
+        self.line_mask = np.ones(24, dtype=bool)
+        #rolling stats of the unfiltered frames, and the one shown instead of the live frame
+        self.stats = PixelStats((24, 32))
+        self.stat_view = STAT_VIEW_DEFAULT
+        self.stat_map = np.zeros((24, 32), dtype=np.float32)
+        #hot blobs followed from frame to frame on the filtered frames
+        self.hotspots = HotspotTracker()
+        self.data = None
+        self.rgb = None
+        self.debug_images = {}
+        self.recorder = None
+        self.frame_timestamp = None
+        self.last_frame_time = time.perf_counter()
+        self.last_frames_produced = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        #frames filtered since the last one shown, and frames filtered but never shown
+        self.frames_pending = 0
+        self.frames_skipped = 0
+        #frames still to take for a burst capture, and the (number in the burst, data) taken since the app last saved them
+        self.burst_remaining = 0
+        self.burst_taken = 0
+        self.burst_frames = []
+        #the ring holds the frames that arrive while the display is drawing
+        if reader_mode == "process":
+            self.reader = ProcessReader(port, baudrate, decoder=decoder, ring_capacity=FRAME_RING_CAPACITY, frame_policy=frame_policy)
+        else:
+            self.reader = IRSerialReader(port, baudrate, decoder=decoder, ring_capacity=FRAME_RING_CAPACITY,
+                                         frame_policy=frame_policy)
+        #sample rate and baudrate, sent to the sensor only when they are changed or tuned
+        self.link = LinkTuner(self.reader, sample_rate, auto_link)
+        #threshold alarms on every frame, evaluated on the reader thread
+        self.alarms = AlarmEngine(alarm_regions or [], alarm_log, port)
+        if alarm_regions:
+            self.reader.frame_listeners.append(self.alarms.add_frame)
+
+    #filter every frame waiting in the reader, returns the number of frames
+    #the display only needs the newest, but the filter has to see them all, while paused the displayed data is kept
+    def update(self, paused):
+        count = 0
+        while True:
+            latest = self.reader.frames.get(out=self.frame, mask_out=self.line_mask)
+            if latest is None:
+                break
+            sequence, self.frame_timestamp, data = latest
+            self.stats.add(self.frame_timestamp, data, self.line_mask)
+            filtered = self.filter.filter(data)
+            self.hotspots.update(self.frame_timestamp, filtered)
+            #a burst takes every frame in a row, not just the ones the display gets to
+            if self.burst_remaining > 0 and not paused:
+                self.burst_frames.append((self.burst_taken, np.fliplr(filtered).copy()))
+                self.burst_taken += 1
+                self.burst_remaining -= 1
+            count += 1
+        if count == 0:
+            return 0
+
+        self.last_frame_time = time.perf_counter()
+        self.frames_pending += count
+
+        #reverse the x axis, copied as the filter reuses its buffer
+        if self.data is None:
+            self.data = np.empty((24, 32), dtype=np.float32)
+            paused = False
+        if not paused:
+            shown = self.stats.view(self.stat_view, self.stat_map)
+            if shown is None:
+                shown = filtered
+            else:
+                #pixels without a frame in the window yet show the live value
+                np.copyto(shown, filtered, where=np.isnan(shown))
+            np.copyto(self.data, np.fliplr(shown))
+        return count
+
+    #take the next count frames as a burst, the ones already taken and not saved are dropped
+    def start_burst(self, count):
+        self.burst_remaining = count
+        self.burst_taken = 0
+        self.burst_frames = []
+
+    #frame to screen latency of the newest frame, the frames filtered before it were skipped
+    def shown(self):
+        if self.frames_pending > 1:
+            self.frames_skipped += self.frames_pending - 1
+        self.frames_pending = 0
+        if self.frame_timestamp is not None:
+            self.latencies.append(time.perf_counter() - self.frame_timestamp)
+            self.frame_timestamp = None
@@ -0,0 +1,63 @@
+from threading import Thread
+from queue import Queue, Full, Empty
+import os
+import numpy as np
+import cv2 as cv
+
+
+#class to write captured images and temperature data in background threads
+#submit only queues references, the caller must not modify the arrays afterwards
+#results are collected on the writer threads and picked up with poll_results from the caller's thread
+class CaptureWriter():
+    def __init__(self, num_workers=2, queue_size=32):
+        self.jobs = Queue(queue_size)
+        self.results = Queue()
+        self.workers = [Thread(target=self._work, daemon=True) for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    #queue a capture, returns False when the queue is full and the capture is dropped
+    def submit(self, folderpath, basename, rgb, data):
+        try:
+            self.jobs.put_nowait((folderpath, basename, rgb, data))
+        except Full:
+            self.results.put((basename, "Capture queue full"))
+            return False
+        return True
+
+    #list of (basename, error) for every finished capture, error is None on success
+    def poll_results(self):
+        results = []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except Empty:
+                return results
+
+    def pending(self):
+        return self.jobs.qsize()
+
+    #write everything already queued and stop the workers
+    def stop(self):
+        for worker in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            folderpath, basename, rgb, data = job
+            try:
+                os.makedirs(folderpath, exist_ok=True)
+                filepath = os.path.join(folderpath, basename + ".png")
+                if not cv.imwrite(filepath, rgb):
+                    raise IOError("Could not write %s" % filepath)
+                #write the data to a csv file in the same folder
+                data_filepath = os.path.join(folderpath, basename + ".csv")
+                np.savetxt(data_filepath, data, delimiter=",", fmt="%.2f")
+                self.results.put((basename, None))
+            except Exception as e:
+                self.results.put((basename, str(e)))
@@ -10,6 +10,57 @@ MIN_TEMP_MANUAL_DEFAULT = 10
 MAX_TEMP_AUTORANGE_DEFAULT = True
 MIN_TEMP_AUTORANGE_DEFAULT = True
 DISPLAY_RESOLUTION_DEFAULT = "640x480"
+LINE_DECODER_DEFAULT = "msgpack"
+STALL_TIMEOUT_DEFAULT = 2
+DISPLAY_RANGE_QUANTUM_DEFAULT = 0
+OVERLAY_CACHE_SIZE = 64
+COLORIZATION_DEFAULT = "Color"
+PLAYBACK_SPEED_DEFAULT = "1x"
+CAPTURE_BURST_DEFAULT = 10
+STATUS_INTERVAL_MS = 500
+FRAME_POLL_MS = 5
+LATENCY_WINDOW = 100
+STAGE_TIMING_WINDOW = 500
+RENDER_WORKERS_DEFAULT = 2
+DISPLAY_FPS_DEFAULT = 30
+RENDER_BUSY_FRACTION = 0.7
+FRAME_RING_CAPACITY = 16
+FILTER_KERNEL_DEFAULT = "Adaptive"
+FILTER_EMA_ALPHA = 0.3
+FILTER_MEDIAN_WINDOW = 5
+FILTER_KALMAN_PROCESS_NOISE = 0.25
+FRAME_SERVER_ADDRESS_DEFAULT = "127.0.0.1:9640"
+FRAME_SERVER_WRITE_BUFFER = 16384
+FRAME_SERVER_QUEUE_LENGTH = 4
+FRAME_CODEC_COMPRESSOR_DEFAULT = "zlib"
+FRAME_CODEC_BLOCK_FRAMES = 256
+BAUDRATE_DEFAULT = 460800
+SAMPLE_RATE_DEFAULT = "16 Hz"
+AUTO_LINK_DEFAULT = False
+LINK_MAX_LOAD = 0.9
+LINK_LOSS_LIMIT = 0.01
+BAUDRATE_SWITCH_DELAY = 0.05
+FRAME_POLICY_DEFAULT = "partial"
+PARTIAL_FRAME_MIN_LINES = 18
+MAX_LOST_FRAMES = 64
+READER_MODE_DEFAULT = "thread"
+PROCESS_READER_REPORT_INTERVAL = 0.5
+PROCESS_READER_STOP_TIMEOUT = 2
+ROLLING_STATS_BUCKETS = 100
+STAT_VIEW_DEFAULT = "Live"
+ALARM_REGIONS_FILE = "alarm_regions.json"
+ALARM_HYSTERESIS_DEFAULT = 1.0
+ALARM_DEBOUNCE_DEFAULT = 3
+SHOW_HOTSPOTS_DEFAULT = False
+HOTSPOT_DELTA_DEFAULT = 2.0
+HOTSPOT_MIN_PIXELS = 2
+HOTSPOT_MATCH_DISTANCE = 3.0
+HOTSPOT_MAX_MISSED = 5
+HOTSPOT_TRAIL_LENGTH = 32
+EXPORT_FPS_DEFAULT = 8
+EXPORT_CODEC_DEFAULT = "mp4v"
+EXPORT_FRAMES_PER_WORKER = 4
+EXPORT_CAPTURE_PATTERN = "ir_cam_*.csv"
 
 color_maps = {
     "Jet": cv.COLORMAP_JET,
@@ -45,6 +96,29 @@ display_interpolations = {
     "Lanczos4": cv.INTER_LANCZOS4    
 }
 
+#display frame rate limits, the sensor can send faster than the display needs to draw
+display_fps_options = [5, 10, 15, 20, 30, 60]
+
+#temporal filters, the noise threshold sets the strength of Adaptive and Kalman
+filter_kernels = ["Adaptive", "EMA", "Median", "Kalman", "None"]
+
+#Color applies the color map at sensor resolution and rescales the color image
+#Temperature rescales the temperatures and applies the color map at display resolution
+colorizations = [
+    "Color",
+    "Temperature"
+]
+
+playback_speeds = {
+    "0.25x": 0.25,
+    "0.5x": 0.5,
+    "1x": 1,
+    "2x": 2,
+    "4x": 4,
+    "8x": 8,
+    "32x": 32
+}
+
 sample_rates = {
     "1 Hz": 1,
     "2 Hz": 2,
@@ -63,16 +137,58 @@ baudrates = [
     921600
 ]
 
+#msgpack decodes any packet layout, batch needs every pixel packed as int16 but is much faster
+line_decoders = [
+    "msgpack",
+    "batch"
+]
+
+#what the reader does with a frame that misses lines: drop it, or pass it on with a mask of the lines it got
+frame_policies = [
+    "partial",
+    "complete"
+]
+
+#the serial reader runs as a thread of the app, or in its own process so decoding does not share the GIL with the display
+reader_modes = [
+    "thread",
+    "process"
+]
+
+#sliding windows of the per pixel stats in seconds
+stat_windows = {
+    "10 s": 10,
+    "10 min": 600
+}
+
+#what the display shows: the live frame, or a stat map over one of the stat_windows
+stat_views = [
+    "Live",
+    "Mean 10 s",
+    "Std 10 s",
+    "Min 10 s",
+    "Max 10 s",
+    "Mean 10 min",
+    "Std 10 min",
+    "Min 10 min",
+    "Max 10 min"
+]
+
 help_table = [
     ["Esc, q", "Exit the program"],
     ["Space, p", "Pause the video"],
     ["M", "Change the color map"],
     ["C", "Capture the current frame"],
+    ["V", "Capture a burst of frames"],
     ["H", "Toggle the help"],
     ["D", "Change the display resolution"],
     ["I", "Change the display interpolation"],
     ["T", "Show temperature contours"],
     ["D", "Change the display resolution"],
-    ["B", "Debug temperature contours"],
-    ["k", "Toggle scale tick marks"]
+    ["B", "Debug contours and stage timing"],
+    ["k", "Toggle scale tick marks"],
+    ["O", "Show tracked hotspots"],
+    ["R", "Start/stop recording"],
+    ["S", "Save stage timing statistics"],
+    ["N", "Next camera, or click its tile"]
 ]
\ No newline at end of file
@@ -0,0 +1,402 @@
+#Software stand-in for the MLX90640 board, writes the msgpack line stream the camera sends
+#   python device_emulator.py --scene hotspots --rate 16
+#prints the port to open in the app, e.g. /dev/pts/3, or socket://127.0.0.1:9650 with --transport socket
+#   python device_emulator.py --measure --drop 0.01 --corrupt 0.001 --truncate 0.001 --jump 0.001
+#runs the serial reader with every decoder against the emulator and prints throughput and what was recovered
+#
+#The emulator also takes the control commands of link_control.py, ["rate", code] and ["baud", baudrate]
+#The link is modelled by the baudrate: lines that do not fit in the bytes the link carries are dropped, like a device that falls behind
+
+import argparse
+import json
+import logging
+import os
+import select
+import socket
+import time
+from collections import namedtuple
+from threading import Thread, Event
+import msgpack
+import numpy as np
+import serial
+
+from constants import *
+from line_decoder import pack_frame, LINES_PER_FRAME, PIXELS_PER_LINE
+from link_control import BITS_PER_BYTE
+
+#config logging to terminal
+logging.basicConfig(level=logging.INFO)
+
+#a warm spot moving on a Lissajous path, position and radius in pixels, temperature above the background in DegC
+Hotspot = namedtuple("Hotspot", ["x", "y", "radius", "temperature", "amplitude_x", "amplitude_y", "period"])
+
+#probability of every fault per line packet, frame_jump per frame
+FaultSettings = namedtuple("FaultSettings", ["drop", "corrupt", "truncate", "frame_jump"], defaults=[0, 0, 0, 0])
+
+
+#class to make the temperature frames of a synthetic scene: a background with a gradient, hotspots and sensor noise
+class Scene():
+    def __init__(self, ambient=22.0, gradient=(0.0, 0.0), hotspots=(), noise=0.15, seed=0):
+        self.ambient = ambient
+        self.gradient = gradient
+        self.hotspots = list(hotspots)
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.y, self.x = np.mgrid[0:LINES_PER_FRAME, 0:PIXELS_PER_LINE].astype(np.float32)
+        self.background = (ambient + gradient[0] * self.x + gradient[1] * self.y).astype(np.float32)
+        self.temperatures = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.float32)
+
+    #raw frame in 0.01 DegC at time t in seconds
+    def frame(self, t, out=None):
+        if out is None:
+            out = np.empty((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+        temperatures = self.temperatures
+        np.copyto(temperatures, self.background)
+        for hotspot in self.hotspots:
+            phase = 2 * np.pi * t / hotspot.period
+            x = hotspot.x + hotspot.amplitude_x * np.sin(phase)
+            y = hotspot.y + hotspot.amplitude_y * np.sin(2 * phase)
+            temperatures += hotspot.temperature * np.exp(-((self.x - x)**2 + (self.y - y)**2) / (2 * hotspot.radius**2))
+        if self.noise:
+            temperatures += self.rng.normal(0, self.noise, temperatures.shape).astype(np.float32)
+        np.rint(temperatures * 100, out=out, casting="unsafe")
+        return out
+
+
+scenes = {
+    "flat": lambda seed: Scene(seed=seed),
+    "gradient": lambda seed: Scene(gradient=(0.3, 0.2), seed=seed),
+    "hotspot": lambda seed: Scene(hotspots=[Hotspot(16, 12, 2.5, 15, 10, 6, 8)], seed=seed),
+    "hotspots": lambda seed: Scene(gradient=(0.1, 0.0), hotspots=[
+        Hotspot(10, 8, 2, 12, 6, 4, 6),
+        Hotspot(22, 16, 3, 18, 7, 5, 11),
+        Hotspot(16, 12, 1.5, 40, 12, 8, 17),
+    ], seed=seed),
+}
+
+
+#one line packet per item, in the fixed layout or as the smallest msgpack ints like the firmware may send them
+def pack_lines(frame_count, frame, encoding="fixed"):
+    if encoding == "fixed":
+        data = pack_frame(frame_count, frame)
+        size = len(data) // LINES_PER_FRAME
+        return [data[i:i + size] for i in range(0, len(data), size)]
+    return [msgpack.packb([frame_count, line] + frame[line].tolist()) for line in range(LINES_PER_FRAME)]
+
+
+#the device end of a pty, the reader opens the slave
+class PtyTransport():
+    def __init__(self):
+        import tty
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+    def read(self):
+        try:
+            return os.read(self.master, 4096)
+        except (BlockingIOError, OSError):
+            return b""
+
+    #write as much as the reader takes within the timeout, returns the bytes written
+    def write(self, data, timeout=0.1):
+        written = 0
+        deadline = time.perf_counter() + timeout
+        while written < len(data) and time.perf_counter() < deadline:
+            if not select.select([], [self.master], [], 0.01)[1]:
+                continue
+            try:
+                written += os.write(self.master, data[written:])
+            except BlockingIOError:
+                pass
+        return written
+
+    def close(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+#a TCP server the reader opens as socket://host:port, works where there are no ptys
+class SocketTransport():
+    def __init__(self, host="127.0.0.1", port=0):
+        self.server = socket.create_server((host, port))
+        self.server.settimeout(0.1)
+        self.port = "socket://%s:%d" % self.server.getsockname()[:2]
+        self.connection = None
+
+    def _accept(self):
+        if self.connection is None:
+            try:
+                self.connection, address = self.server.accept()
+                self.connection.setblocking(False)
+            except socket.timeout:
+                pass
+        return self.connection
+
+    def read(self):
+        if self._accept() is None:
+            return b""
+        try:
+            return self.connection.recv(4096)
+        except BlockingIOError:
+            return b""
+        except OSError:
+            self.connection = None
+            return b""
+
+    def write(self, data, timeout=0.1):
+        #the bytes sent before a reader connects are lost, like on an open serial line
+        if self._accept() is None:
+            return len(data)
+        written = 0
+        deadline = time.perf_counter() + timeout
+        while written < len(data) and time.perf_counter() < deadline:
+            if not select.select([], [self.connection], [], 0.01)[1]:
+                continue
+            try:
+                written += self.connection.send(data[written:])
+            except BlockingIOError:
+                pass
+            except OSError:
+                self.connection = None
+                return len(data)
+        return written
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.server.close()
+
+
+#an open pyserial port, e.g. one end of a null modem pair, or the loop:// instance of a reader in the same process
+class SerialTransport():
+    def __init__(self, ser):
+        self.ser = ser
+        self.port = ser.port
+
+    def read(self):
+        return self.ser.read(self.ser.in_waiting) if self.ser.in_waiting else b""
+
+    def write(self, data, timeout=0.1):
+        return self.ser.write(data)
+
+    def close(self):
+        pass
+
+
+def open_transport(transport):
+    if isinstance(transport, (PtyTransport, SocketTransport, SerialTransport)):
+        return transport
+    if transport == "pty":
+        return PtyTransport()
+    if transport == "socket":
+        return SocketTransport()
+    if isinstance(transport, str):
+        return SerialTransport(serial.serial_for_url(transport, BAUDRATE_DEFAULT, timeout=0))
+    return SerialTransport(transport)
+
+
+#class to play the sensor in a background thread
+#rate is in frames per second and baudrate limits the bytes per second, 0 for as fast as possible
+#faults are drawn from a seeded generator so a run with the same settings injects the same faults
+class DeviceEmulator(Thread):
+    def __init__(self, transport="pty", scene="hotspots", rate=16, baudrate=BAUDRATE_DEFAULT, faults=FaultSettings(),
+                 encoding="fixed", frames=None, seed=0):
+        Thread.__init__(self, daemon=True)
+        self.transport = open_transport(transport)
+        self.port = self.transport.port
+        self.scene = scenes[scene](seed) if isinstance(scene, str) else scene
+        self.rate = rate
+        self.baudrate = baudrate
+        self.faults = faults
+        self.encoding = encoding
+        self.max_frames = frames
+        self.rng = np.random.default_rng(seed + 1)
+        self.unpacker = msgpack.Unpacker()
+        self.request_stop = Event()
+        self.finished = Event()
+        self.stats = {
+            "frames sent": 0,
+            "lines sent": 0,
+            "bytes sent": 0,
+            "lines dropped": 0,
+            "lines overflowed": 0,
+            "lines corrupted": 0,
+            "lines truncated": 0,
+            "frame jumps": 0,
+            "commands": 0,
+        }
+
+        self.start()
+
+    def run(self):
+        frame = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+        frame_count = 0
+        start = time.perf_counter()
+        next_frame = start
+        #bytes the link may still send, refilled at the baudrate
+        credit = 0.0
+        last_credit = start
+
+        while not self.request_stop.is_set():
+            if self.max_frames is not None and self.stats["frames sent"] >= self.max_frames:
+                break
+            self._read_commands()
+
+            if self.rate:
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(min(delay, 0.05))
+                    continue
+                #a device that fell far behind does not catch up with a burst
+                next_frame = max(next_frame + 1 / self.rate, time.perf_counter() - 1)
+
+            if self.faults.frame_jump and self.rng.random() < self.faults.frame_jump:
+                frame_count += int(self.rng.integers(2, 100))
+                self.stats["frame jumps"] += 1
+
+            self.scene.frame(time.perf_counter() - start, out=frame)
+            chunks = []
+            for line in self._faulty_lines(pack_lines(frame_count, frame, self.encoding)):
+                if self.baudrate:
+                    now = time.perf_counter()
+                    credit = min(credit + (now - last_credit) * self.baudrate / BITS_PER_BYTE, self.baudrate / BITS_PER_BYTE / 10)
+                    last_credit = now
+                    if credit < len(line):
+                        self.stats["lines overflowed"] += 1
+                        continue
+                    credit -= len(line)
+                chunks.append(line)
+                self.stats["lines sent"] += 1
+
+            data = b"".join(chunks)
+            written = self.transport.write(data)
+            self.stats["bytes sent"] += written
+            self.stats["frames sent"] += 1
+            frame_count += 1
+
+        self.finished.set()
+
+    def _faulty_lines(self, lines):
+        faults = self.faults
+        if not (faults.drop or faults.corrupt or faults.truncate):
+            return lines
+        draws = self.rng.random((len(lines), 3))
+        faulty = []
+        for line, (drop, corrupt, truncate) in zip(lines, draws):
+            if drop < faults.drop:
+                self.stats["lines dropped"] += 1
+                continue
+            if corrupt < faults.corrupt:
+                line = bytearray(line)
+                line[int(self.rng.integers(len(line)))] ^= int(self.rng.integers(1, 256))
+                line = bytes(line)
+                self.stats["lines corrupted"] += 1
+            if truncate < faults.truncate:
+                line = line[:int(self.rng.integers(1, len(line)))]
+                self.stats["lines truncated"] += 1
+            faulty.append(line)
+        return faulty
+
+    def _read_commands(self):
+        data = self.transport.read()
+        if not data:
+            return
+        self.unpacker.feed(data)
+        try:
+            for command in self.unpacker:
+                self._command(command)
+        except Exception as e:
+            logging.warning("Bad command: %s" % e)
+            self.unpacker = msgpack.Unpacker()
+
+    def _command(self, command):
+        self.stats["commands"] += 1
+        name, value = command
+        if name == "rate":
+            rates = {code: sample_rate for sample_rate, code in sample_rates.items()}
+            self.rate = float(rates[value].split()[0])
+        elif name == "baud":
+            self.baudrate = value
+        logging.info("Emulator: %s %s" % (name, value))
+
+    def stop(self):
+        self.request_stop.set()
+        self.join()
+        self.transport.close()
+
+
+#run the serial reader against the emulator until every frame is sent, returns the throughput and counters
+def measure_reader(decoder, transport, faults, frames, rate=0, baudrate=0, encoding="fixed", seed=0, timeout=60):
+    from ir_serial_reader import IRSerialReader
+
+    #start sending once the reader listens
+    transport = open_transport(transport)
+    reader = IRSerialReader(transport.port, BAUDRATE_DEFAULT, decoder=decoder, ring_capacity=frames + 1)
+    while reader.ser is None and reader.is_alive():
+        time.sleep(0.01)
+    start = time.perf_counter()
+    emulator = DeviceEmulator(transport, "hotspots", rate, baudrate, faults, encoding, frames, seed)
+    emulator.finished.wait(timeout)
+    #let the reader take the last bytes
+    last = -1
+    while reader.timer.counters.get("bytes read", 0) != last and time.perf_counter() - start < timeout:
+        last = reader.timer.counters.get("bytes read", 0)
+        time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    reader.stop()
+    emulator.stop()
+
+    counters = dict(reader.timer.counters)
+    return {
+        "decoder": decoder,
+        "encoding": encoding,
+        "faults": faults._asdict(),
+        "emulator": emulator.stats,
+        "reader": counters,
+        "lines per s": counters.get("lines received", 0) / elapsed,
+        "frames recovered": counters.get("frames received", 0) / max(emulator.stats["frames sent"], 1),
+        "frames recovered with partial": (counters.get("frames received", 0) + counters.get("frames partial", 0)) / max(emulator.stats["frames sent"], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulate the MLX90640 camera board")
+    parser.add_argument("--transport", default="pty" if hasattr(os, "openpty") else "socket",
+                        help="pty, socket, or a serial port / pyserial URL to write to")
+    parser.add_argument("--scene", default="hotspots", choices=list(scenes))
+    parser.add_argument("--rate", type=float, help="frames per second, 0 for as fast as possible, default 16 or 0 with --measure")
+    parser.add_argument("--baudrate", type=int, default=BAUDRATE_DEFAULT, help="link speed in baud, 0 for unlimited")
+    parser.add_argument("--encoding", default="fixed", choices=["fixed", "msgpack"], help="int16 tags on every pixel or the smallest msgpack ints")
+    parser.add_argument("--drop", type=float, default=0, help="probability of dropping a line")
+    parser.add_argument("--corrupt", type=float, default=0, help="probability of flipping a byte in a line")
+    parser.add_argument("--truncate", type=float, default=0, help="probability of cutting a line short")
+    parser.add_argument("--jump", type=float, default=0, help="probability of a frame count jump per frame")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--frames", type=int, help="stop after this many frames")
+    parser.add_argument("--measure", action="store_true", help="run the serial reader with every decoder against the emulator")
+    args = parser.parse_args()
+
+    faults = FaultSettings(args.drop, args.corrupt, args.truncate, args.jump)
+    if args.measure:
+        rate = args.rate if args.rate is not None else 0
+        results = [measure_reader(decoder, args.transport, faults, args.frames or 2000, rate, 0, args.encoding, args.seed)
+                   for decoder in line_decoders]
+        print(json.dumps(results, indent=1))
+        return
+
+    rate = args.rate if args.rate is not None else 16
+    emulator = DeviceEmulator(args.transport, args.scene, rate, args.baudrate, faults, args.encoding, args.frames, args.seed)
+    print("Emulated camera on %s" % emulator.port, flush=True)
+    try:
+        while emulator.is_alive():
+            time.sleep(1)
+            logging.info("%s" % emulator.stats)
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
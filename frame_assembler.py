@@ -0,0 +1,124 @@
+import numpy as np
+
+from constants import *
+from line_decoder import LINES_PER_FRAME, PIXELS_PER_LINE
+from stage_timer import StageTimer
+
+
+#class to put the decoded lines together into frames, keeping track of which of the 24 lines arrived
+#a frame ends with its last line or when lines of another frame count arrive
+#a frame count out of sequence has to be confirmed by a second line before it ends the frame,
+#a single line with another count is held back and dropped as corrupt if the frame goes on instead
+#complete frames are always emitted, frames with missing lines depend on the policy:
+#"complete" drops them, "partial" emits them with at least min_lines lines, the missing rows keep their values
+#from the frame before and the mask tells which rows are new
+#emit(frame_count, raw, mask) gets the raw int16 frame and the line mask, both are reused for the next frame
+class FrameAssembler():
+    def __init__(self, emit, policy=FRAME_POLICY_DEFAULT, min_lines=PARTIAL_FRAME_MIN_LINES, timer=None):
+        self.emit = emit
+        self.policy = policy
+        self.min_lines = min_lines
+        self.timer = timer if timer is not None else StageTimer()
+        self.raw = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+        self.mask = np.zeros(LINES_PER_FRAME, dtype=bool)
+        self.frame_count = None
+        self.last_frame_count = None
+        self.last_line = -1
+        #a single line with a frame count out of sequence, waiting for a second line to confirm it
+        self.held_frame_count = None
+        self.held_line = 0
+        self.held_pixels = np.zeros(PIXELS_PER_LINE, dtype=np.int16)
+
+    #start again without counting the frame in progress as lost, e.g. after the baudrate changed
+    def reset(self):
+        self.mask[:] = False
+        self.frame_count = None
+        self.held_frame_count = None
+
+    #add the arrays returned by a line decoder
+    def add(self, frame_counts, line_counts, pixels):
+        count = len(line_counts)
+        if count == 0:
+            return
+        self.timer.count("lines received", count)
+
+        #runs of lines with the same frame count
+        ends = np.flatnonzero(frame_counts[1:] != frame_counts[:-1]) + 1
+        starts = [0] + ends.tolist()
+        ends = ends.tolist() + [count]
+        for start, end in zip(starts, ends):
+            frame_count = int(frame_counts[start])
+            if frame_count == self.frame_count:
+                self._drop_held()
+            elif frame_count == self.held_frame_count:
+                #the second line of the held count, the sensor did move on
+                self.held_frame_count = None
+                self._finish()
+                self._start(frame_count)
+                self._add_lines(self.held_line, self.held_pixels)
+            else:
+                self._drop_held()
+                if end - start == 1 and not self._in_sequence(frame_count, int(line_counts[start])):
+                    self.held_frame_count = frame_count
+                    self.held_line = int(line_counts[start])
+                    self.held_pixels[:] = pixels[start]
+                    continue
+                self._finish()
+                self._start(frame_count)
+            self._add_lines(line_counts[start:end], pixels[start:end])
+
+    #whether a line can start a frame on its own: the count after the last one, with the line index wrapped
+    #around if the frame before is still in progress, or the count of a frame that ended with a reset
+    def _in_sequence(self, frame_count, line):
+        if self.last_frame_count is None:
+            return False
+        if self.frame_count is None:
+            return frame_count - self.last_frame_count in (0, 1)
+        return frame_count == self.frame_count + 1 and line <= self.last_line
+
+    #the held line was not followed by another of its frame count
+    def _drop_held(self):
+        if self.held_frame_count is not None:
+            self.timer.count("lines corrupt")
+            self.held_frame_count = None
+
+    def _add_lines(self, lines, pixels):
+        self.raw[lines] = pixels
+        self.mask[lines] = True
+        self.last_line = int(np.max(lines))
+        #the lines come in order, nothing more arrives for this frame after its last line
+        if self.mask[-1]:
+            self._finish()
+
+    def _start(self, frame_count):
+        last = self.last_frame_count
+        if last is not None and frame_count != last + 1 and frame_count != last:
+            self.timer.count("frame count jumps")
+            skipped = frame_count - last - 1
+            #whole frames lost on the way, a jump backwards or far ahead is a restart of the sensor
+            #their lines do not count as missed, the link tuner would take a sensor hiccup for an overloaded link
+            if 0 < skipped <= MAX_LOST_FRAMES:
+                self.timer.count("frames lost", skipped)
+        self.frame_count = frame_count
+        self.last_frame_count = frame_count
+        self.last_line = -1
+
+    def _finish(self):
+        if self.frame_count is None:
+            return
+        received = int(np.count_nonzero(self.mask))
+        if received == 0:
+            self.frame_count = None
+            return
+        if received == LINES_PER_FRAME:
+            self.timer.count("frames received")
+            self.emit(self.frame_count, self.raw, self.mask)
+        else:
+            self.timer.count("lines missed", LINES_PER_FRAME - received)
+            if self.policy == "partial" and received >= self.min_lines:
+                self.timer.count("frames partial")
+                self.emit(self.frame_count, self.raw, self.mask)
+            else:
+                self.timer.count("frames incomplete")
+        self.mask[:] = False
+        self.frame_count = None
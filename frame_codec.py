@@ -0,0 +1,404 @@
+import os
+import struct
+import sys
+import time
+import zlib
+import numpy as np
+
+from constants import *
+from frame_recorder import header_dtype, record_dtype, index_dtype, make_header, TEMPERATURE_SCALE, RECORDING_EXTENSION, INDEX_EXTENSION
+
+#lossless codec for the raw int16 frames (0.01 DegC), consecutive frames of the sensor differ only by a little noise
+#every pixel is stored as its change from the previous frame, the first frame of a block as its change from the pixel before it
+#the changes are zigzag mapped to unsigned (0, -1, 1, -2, ... -> 0, 1, 2, 3, ...) and written as varints, 7 bits per byte
+#so a change of up to +-63 takes one byte instead of two, then a general purpose compressor can squeeze the rest
+#everything is done on whole arrays, a block of frames is encoded without a Python loop over pixels or frames
+
+#compressors applied on top of the varints, zstd and lz4 are used when their packages are installed
+compressors = {
+    "none": (bytes, bytes),
+    "zlib": (lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+try:
+    import zstandard
+    compressors["zstd"] = (zstandard.ZstdCompressor(level=3).compress, zstandard.ZstdDecompressor().decompress)
+except ImportError:
+    pass
+try:
+    import lz4.frame
+    compressors["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+except ImportError:
+    pass
+
+#Archive layout, all little endian:
+#header, the recording header with the compressor name and block length in the reserved bytes,
+#then the header of the packed recording as it was, so unpacking restores its start time and scale
+#then one block after another: block header [number of frames, size of the data], then the compressed data
+#the data of a block holds the varints of the sequence numbers, the timestamps and the frames, every block decodes on its own
+#timestamps are delta coded as their 64 bit patterns, so they come back bit for bit
+ARCHIVE_MAGIC = b"IRDLT002"
+#archives before the recording header was kept, unpacked with a header made anew
+ARCHIVE_MAGIC_V1 = b"IRDLT001"
+ARCHIVE_EXTENSION = ".irz"
+
+archive_header_dtype = np.dtype([("magic", "S8"), ("rows", "<u2"), ("cols", "<u2"), ("scale", "<f4"), ("compressor", "S8"), ("block_frames", "<u4"), ("reserved", "V4")])
+block_dtype = np.dtype([("count", "<u4"), ("size", "<u4")])
+
+#Stream layout for one frame at a time: the archive header with its own magic,
+#then per frame: kind, sequence, timestamp and size, then the compressed varints of the frame
+#a key frame is coded on its own, a delta frame against the frame before it
+STREAM_MAGIC = b"IRSTR001"
+stream_packet = struct.Struct("<Bqdi")
+KEY_FRAME = 0
+DELTA_FRAME = 1
+
+
+#zigzag keeps the width of the values, int32 to uint32 and int64 to uint64
+def zigzag_encode(values):
+    bits = values.dtype.itemsize * 8 - 1
+    return ((values << 1) ^ (values >> bits)).view(values.dtype.str.replace("i", "u"))
+
+
+def zigzag_decode(values):
+    signs = (values & 1).view(values.dtype.str.replace("u", "i"))
+    return (values >> 1).view(signs.dtype) ^ -signs
+
+
+def varint_encode(values):
+    #bytes per value, the 7 bit groups above the first one that are not zero
+    lengths = np.ones(values.shape, dtype=np.int32)
+    for k in range(1, 10):
+        if k * 7 >= values.dtype.itemsize * 8:
+            break
+        above = values >> (7 * k) != 0
+        if not above.any():
+            break
+        lengths += above
+    if values.size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    longest = int(lengths.max())
+    if longest == 1:
+        return values.astype(np.uint8)
+
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    out = np.empty(int(ends[-1]), dtype=np.uint8)
+    more = (lengths > 1).astype(values.dtype) << 7
+    out[starts] = (values & 0x7F) | more
+    #the longer values get one more byte per round
+    for k in range(1, longest):
+        longer = np.flatnonzero(lengths > k)
+        byte = (values[longer] >> (7 * k)) & 0x7F
+        out[starts[longer] + k] = byte | ((lengths[longer] > k + 1).astype(values.dtype) << 7)
+    return out
+
+
+#decode count varints from the start of data, returns the values and the number of bytes used
+def varint_decode(data, count, dtype=np.uint64):
+    data = np.frombuffer(data, dtype=np.uint8)
+    if count == 0:
+        return np.zeros(0, dtype=dtype), 0
+    #all values in one byte each
+    if len(data) >= count and data[:count].max() < 0x80:
+        return data[:count].astype(dtype), count
+
+    ends = np.flatnonzero(data < 0x80)[:count] + 1
+    if len(ends) < count:
+        raise ValueError("Truncated varints: %d of %d" % (len(ends), count))
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1]
+    lengths = ends - starts
+    if lengths.max() * 7 > np.dtype(dtype).itemsize * 8 + 6:
+        raise ValueError("Varint too long")
+
+    values = (data[starts] & 0x7F).astype(dtype)
+    for k in range(1, int(lengths.max())):
+        longer = np.flatnonzero(lengths > k)
+        values[longer] |= (data[starts[longer] + k] & 0x7F).astype(dtype) << (7 * k)
+    return values, int(ends[-1])
+
+
+#varints of a sequence of integers, each stored as its change from the one before
+def encode_series(values):
+    deltas = np.diff(values.astype(np.int64), prepend=np.int64(0))
+    return varint_encode(zigzag_encode(deltas))
+
+
+def decode_series(data, count):
+    values, used = varint_decode(data, count)
+    return np.cumsum(zigzag_decode(values)), used
+
+
+#varints of a block of raw frames, shape (n, rows, cols)
+#without a previous frame the first one is a key frame, coded along its rows
+#the changes of int16 values need 17 bits, so the work is done in int32
+def encode_frames(frames, previous=None):
+    frames = frames.reshape(len(frames), -1).astype(np.int32)
+    deltas = np.empty_like(frames)
+    if previous is None:
+        deltas[0, 0] = frames[0, 0]
+        np.subtract(frames[0, 1:], frames[0, :-1], deltas[0, 1:])
+    else:
+        np.subtract(frames[0], previous.reshape(-1), deltas[0])
+    np.subtract(frames[1:], frames[:-1], deltas[1:])
+    return varint_encode(zigzag_encode(deltas.reshape(-1)))
+
+
+#inverse of encode_frames, returns the frames as int16 and the number of bytes used
+def decode_frames(data, count, shape, previous=None):
+    size = shape[0] * shape[1]
+    values, used = varint_decode(data, count * size, np.uint32)
+    deltas = zigzag_decode(values).reshape(count, size)
+    if previous is None:
+        np.cumsum(deltas[0], out=deltas[0])
+    else:
+        deltas[0] += previous.reshape(-1)
+    np.cumsum(deltas, axis=0, out=deltas)
+    return deltas.astype(np.int16).reshape((count,) + tuple(shape)), used
+
+
+#class to encode a stream one frame at a time, every frame is encoded both ways
+#a consumer that got the frame before takes the delta frame, one that skipped frames takes the key frame
+class FrameEncoder():
+    def __init__(self, compressor=FRAME_CODEC_COMPRESSOR_DEFAULT):
+        self.compressor = compressor
+        self.compress = compressors[compressor][0]
+        self.previous = None
+
+    def packet(self, kind, sequence, timestamp, data):
+        data = self.compress(data.tobytes())
+        return stream_packet.pack(kind, sequence, timestamp, len(data)) + data
+
+    #returns the key frame packet and the delta frame packet, None for the first frame
+    def encode(self, sequence, timestamp, frame):
+        key = self.packet(KEY_FRAME, sequence, timestamp, encode_frames(frame[np.newaxis]))
+        delta = None
+        if self.previous is not None:
+            delta = self.packet(DELTA_FRAME, sequence, timestamp, encode_frames(frame[np.newaxis], self.previous))
+        self.previous = frame.copy()
+        return key, delta
+
+
+#class to decode the packets of FrameEncoder, read_packet takes a file-like stream
+class FrameDecoder():
+    def __init__(self, compressor=FRAME_CODEC_COMPRESSOR_DEFAULT, shape=(24, 32)):
+        self.decompress = compressors[compressor][1]
+        self.shape = tuple(shape)
+        self.previous = None
+
+    def decode(self, kind, data):
+        if kind == DELTA_FRAME and self.previous is None:
+            raise ValueError("Delta frame without a key frame")
+        previous = self.previous if kind == DELTA_FRAME else None
+        frames, used = decode_frames(self.decompress(data), 1, self.shape, previous)
+        self.previous = frames[0]
+        return self.previous
+
+    #returns sequence, timestamp and the raw frame, None at the end of the stream
+    def read_packet(self, stream):
+        head = stream.read(stream_packet.size)
+        if len(head) < stream_packet.size:
+            return None
+        kind, sequence, timestamp, size = stream_packet.unpack(head)
+        data = stream.read(size)
+        if len(data) < size:
+            return None
+        return sequence, timestamp, self.decode(kind, data)
+
+
+def make_archive_header(compressor, block_frames=0, rows=24, cols=32, scale=TEMPERATURE_SCALE, magic=ARCHIVE_MAGIC):
+    header = np.zeros(1, dtype=archive_header_dtype)
+    header["magic"] = magic
+    header["rows"] = rows
+    header["cols"] = cols
+    header["scale"] = scale
+    header["compressor"] = compressor.encode()
+    header["block_frames"] = block_frames
+    return header
+
+
+def encode_block(sequences, timestamps, frames, compressor=FRAME_CODEC_COMPRESSOR_DEFAULT):
+    data = np.concatenate([
+        encode_series(sequences),
+        encode_series(np.ascontiguousarray(timestamps, dtype="<f8").view(np.int64)),
+        encode_frames(frames),
+    ])
+    data = compressors[compressor][0](data.tobytes())
+    block = np.zeros(1, dtype=block_dtype)
+    block["count"] = len(frames)
+    block["size"] = len(data)
+    return block.tobytes() + data
+
+
+def decode_block(data, count, shape, compressor=FRAME_CODEC_COMPRESSOR_DEFAULT):
+    data = compressors[compressor][1](data)
+    sequences, used = decode_series(data, count)
+    offset = used
+    timestamps, used = decode_series(data[offset:], count)
+    offset += used
+    frames, used = decode_frames(data[offset:], count, shape)
+    return sequences, timestamps.view(np.float64), frames
+
+
+#compress a recording into an archive, returns the sizes before and after
+def pack_recording(path, archive_path, compressor=FRAME_CODEC_COMPRESSOR_DEFAULT, block_frames=FRAME_CODEC_BLOCK_FRAMES):
+    from frame_player import Recording
+
+    recording = Recording(path)
+    with open(archive_path, "wb") as archive:
+        archive.write(make_archive_header(compressor, block_frames, scale=recording.scale).tobytes())
+        archive.write(np.fromfile(path, dtype=header_dtype, count=1).tobytes())
+        for start in range(0, len(recording), block_frames):
+            records = recording.records[start:start + block_frames]
+            archive.write(encode_block(records["sequence"], recording.timestamps[start:start + block_frames], records["frame"], compressor))
+        packed_size = archive.tell()
+    return os.path.getsize(path) + os.path.getsize(path + INDEX_EXTENSION), packed_size
+
+
+#the archive header and the header of the packed recording, read from the start of an open archive
+def _read_headers(archive, archive_path):
+    header = np.frombuffer(archive.read(archive_header_dtype.itemsize), dtype=archive_header_dtype)
+    if len(header) == 0 or header["magic"][0] not in (ARCHIVE_MAGIC, ARCHIVE_MAGIC_V1):
+        raise ValueError("Not a frame archive: %s" % archive_path)
+    if header["magic"][0] == ARCHIVE_MAGIC_V1:
+        return header, make_header(int(header["rows"][0]), int(header["cols"][0]), float(header["scale"][0]))
+    recording_header = np.frombuffer(archive.read(header_dtype.itemsize), dtype=header_dtype)
+    if len(recording_header) == 0:
+        raise ValueError("Truncated archive: %s" % archive_path)
+    return header, recording_header
+
+
+#header of the recording packed into an archive
+def read_recording_header(archive_path):
+    with open(archive_path, "rb") as archive:
+        return _read_headers(archive, archive_path)[1]
+
+
+#yield the blocks of an archive as (sequences, timestamps, raw frames)
+def read_archive(archive_path):
+    with open(archive_path, "rb") as archive:
+        header, _ = _read_headers(archive, archive_path)
+        compressor = header["compressor"][0].decode()
+        shape = (int(header["rows"][0]), int(header["cols"][0]))
+        while True:
+            block = np.frombuffer(archive.read(block_dtype.itemsize), dtype=block_dtype)
+            if len(block) == 0:
+                return
+            data = archive.read(int(block["size"][0]))
+            if len(data) < block["size"][0]:
+                raise ValueError("Truncated archive: %s" % archive_path)
+            yield decode_block(data, int(block["count"][0]), shape, compressor)
+
+
+#expand an archive back into a recording with its index, the same bytes as the recording that was packed
+def unpack_archive(archive_path, path):
+    recording_header = read_recording_header(archive_path)
+    with open(path, "wb") as data_file, open(path + INDEX_EXTENSION, "wb") as index_file:
+        data_file.write(recording_header.tobytes())
+        offset = header_dtype.itemsize
+        for sequences, timestamps, frames in read_archive(archive_path):
+            records = np.zeros(len(frames), dtype=record_dtype)
+            records["sequence"] = sequences
+            records["timestamp"] = timestamps
+            records["frame"] = frames
+            index = np.zeros(len(frames), dtype=index_dtype)
+            index["sequence"] = sequences
+            index["timestamp"] = timestamps
+            index["offset"] = offset + np.arange(len(frames)) * record_dtype.itemsize
+            index["size"] = record_dtype.itemsize
+            data_file.write(records.tobytes())
+            index_file.write(index.tobytes())
+            offset += records.nbytes
+
+
+#compression ratio and MB/s of raw frames for every compressor, in blocks and one frame at a time
+def measure(sequences, timestamps, frames, block_frames=FRAME_CODEC_BLOCK_FRAMES):
+    raw_size = len(frames) * record_dtype.itemsize
+    results = []
+    for compressor in compressors:
+        start = time.perf_counter()
+        blocks = [encode_block(sequences[i:i + block_frames], timestamps[i:i + block_frames], frames[i:i + block_frames], compressor)
+                  for i in range(0, len(frames), block_frames)]
+        encode_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i, block in zip(range(0, len(frames), block_frames), blocks):
+            decoded = decode_block(block[block_dtype.itemsize:], len(frames[i:i + block_frames]), frames.shape[1:], compressor)[2]
+            if not np.array_equal(decoded, frames[i:i + block_frames]):
+                raise ValueError("Block codec is not lossless with %s" % compressor)
+        decode_time = time.perf_counter() - start
+        size = sum(len(block) for block in blocks)
+        results.append(("block " + compressor, raw_size / size, raw_size / 1e6 / encode_time, raw_size / 1e6 / decode_time))
+
+        encoder = FrameEncoder(compressor)
+        start = time.perf_counter()
+        packets = [encoder.encode(int(sequence), float(timestamp), frame)[1] for sequence, timestamp, frame in zip(sequences, timestamps, frames)]
+        encode_time = time.perf_counter() - start
+        decoder = FrameDecoder(compressor, frames.shape[1:])
+        decoder.previous = frames[0]
+        start = time.perf_counter()
+        for packet in packets[1:]:
+            decoder.decode(DELTA_FRAME, packet[stream_packet.size:])
+        decode_time = time.perf_counter() - start
+        if not np.array_equal(decoder.previous, frames[-1]):
+            raise ValueError("Stream codec is not lossless with %s" % compressor)
+        size = sum(len(packet) for packet in packets[1:])
+        stream_raw_size = (len(frames) - 1) * record_dtype.itemsize
+        results.append(("stream " + compressor, stream_raw_size / size, stream_raw_size / 1e6 / encode_time, stream_raw_size / 1e6 / decode_time))
+    return results
+
+
+#write the frames as a recording, pack and unpack it and compare the files, True when they are the same
+def check_roundtrip(sequences, timestamps, frames):
+    import filecmp
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as folderpath:
+        path = os.path.join(folderpath, "roundtrip" + RECORDING_EXTENSION)
+        records = np.zeros(len(frames), dtype=record_dtype)
+        records["sequence"] = sequences
+        records["timestamp"] = timestamps
+        records["frame"] = frames
+        index = np.zeros(len(frames), dtype=index_dtype)
+        index["sequence"] = sequences
+        index["timestamp"] = timestamps
+        index["offset"] = header_dtype.itemsize + np.arange(len(frames)) * record_dtype.itemsize
+        index["size"] = record_dtype.itemsize
+        with open(path, "wb") as data_file, open(path + INDEX_EXTENSION, "wb") as index_file:
+            data_file.write(make_header(start_time=time.time(), start_monotonic=time.monotonic()).tobytes())
+            data_file.write(records.tobytes())
+            index_file.write(index.tobytes())
+
+        pack_recording(path, path + ARCHIVE_EXTENSION)
+        unpack_archive(path + ARCHIVE_EXTENSION, path + ".restored")
+        return (filecmp.cmp(path, path + ".restored", shallow=False) and
+                filecmp.cmp(path + INDEX_EXTENSION, path + ".restored" + INDEX_EXTENSION, shallow=False))
+
+
+if __name__ == "__main__":
+    #python frame_codec.py                      ratio and speed on synthetic frames
+    #python frame_codec.py x.irrec              ratio and speed on a recording
+    #python frame_codec.py pack x.irrec [zlib]  write x.irrec.irz
+    #python frame_codec.py unpack x.irrec.irz   write x.irrec.irz.irrec
+    if len(sys.argv) > 2 and sys.argv[1] == "pack":
+        compressor = sys.argv[3] if len(sys.argv) > 3 else FRAME_CODEC_COMPRESSOR_DEFAULT
+        raw_size, packed_size = pack_recording(sys.argv[2], sys.argv[2] + ARCHIVE_EXTENSION, compressor)
+        print("%d -> %d bytes, ratio %.2f" % (raw_size, packed_size, raw_size / packed_size))
+    elif len(sys.argv) > 2 and sys.argv[1] == "unpack":
+        unpack_archive(sys.argv[2], sys.argv[2] + RECORDING_EXTENSION)
+    else:
+        if len(sys.argv) > 1:
+            from frame_player import Recording
+            recording = Recording(sys.argv[1])
+            records = np.array(recording.records)
+            sequences, timestamps, frames = records["sequence"], np.array(recording.timestamps), records["frame"]
+        else:
+            from benchmark import synthetic_frames
+            frames = synthetic_frames(2000)
+            sequences = np.arange(len(frames))
+            timestamps = time.time() + sequences / 16 + np.random.default_rng(0).normal(0, 1e-3, len(frames))
+        print("%d frames" % len(frames))
+        print("%-12s %6s %12s %12s" % ("codec", "ratio", "encode MB/s", "decode MB/s"))
+        for name, ratio, encode_speed, decode_speed in measure(sequences, timestamps, frames):
+            print("%-12s %6.2f %12.1f %12.1f" % (name, ratio, encode_speed, decode_speed))
+        print("pack and unpack restore the recording byte for byte: %s" % check_roundtrip(sequences, timestamps, frames))
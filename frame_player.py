@@ -0,0 +1,114 @@
+import os
+import time
+import numpy as np
+
+from frame_recorder import header_dtype, record_dtype, index_dtype, RECORDING_MAGIC, INDEX_EXTENSION
+
+
+#class to read a recording made by FrameRecorder without loading it
+#the records and the index are memory mapped, so memory use does not grow with the length of the recording
+class Recording():
+    def __init__(self, path):
+        self.path = path
+        header = np.fromfile(path, dtype=header_dtype, count=1)
+        if len(header) == 0 or header["magic"][0] != RECORDING_MAGIC:
+            raise ValueError("Not a recording: %s" % path)
+        self.scale = float(header["scale"][0])
+        self.start_time = float(header["start_time"][0])
+        self.start_monotonic = float(header["start_monotonic"][0])
+
+        #a recording cut short by a crash may end in a partial record
+        data_size = os.path.getsize(path) - header_dtype.itemsize
+        index_size = os.path.getsize(path + INDEX_EXTENSION)
+        count = min(data_size // record_dtype.itemsize, index_size // index_dtype.itemsize)
+        if count == 0:
+            raise ValueError("Recording is empty: %s" % path)
+
+        self.records = np.memmap(path, dtype=record_dtype, mode="r", offset=header_dtype.itemsize, shape=(count,))
+        self.index = np.memmap(path + INDEX_EXTENSION, dtype=index_dtype, mode="r", shape=(count,))
+        self.timestamps = self.index["timestamp"]
+
+    def __len__(self):
+        return len(self.index)
+
+    #temperatures of frame n in DegC
+    def frame(self, n, out=None):
+        if out is None:
+            out = np.empty((24, 32), dtype=np.float32)
+        np.multiply(self.records["frame"][n], self.scale, out=out)
+        return out
+
+    def raw_frame(self, n):
+        return self.records["frame"][n]
+
+    def timestamp(self, n):
+        return float(self.timestamps[n])
+
+    #wall clock time frame n was recorded at, None for recordings that do not keep their start time
+    def wall_time(self, n):
+        if self.start_time == 0:
+            return None
+        return self.start_time + self.timestamp(n) - self.start_monotonic
+
+    #number of the frame showing at the given recording time, the timestamps are monotonic
+    def find_time(self, timestamp):
+        n = int(np.searchsorted(self.timestamps, timestamp, side="right")) - 1
+        return min(max(n, 0), len(self) - 1)
+
+    def duration(self):
+        return self.timestamp(len(self) - 1) - self.timestamp(0)
+
+
+#class to play a recording at its original timing scaled by a speed multiplier
+#the frame to show is worked out from the clock, so at high speed frames are skipped rather than queued
+class FramePlayer():
+    def __init__(self, recording, speed=1.0):
+        self.recording = recording
+        self.speed = speed
+        self.paused = False
+        self.position = 0
+        self._rebase(0)
+
+    #play from frame n
+    def seek(self, n):
+        n = min(max(int(n), 0), len(self.recording) - 1)
+        self.position = n
+        self._rebase(n)
+
+    def set_speed(self, speed):
+        self.current_index()
+        self.speed = speed
+        self._rebase(self.position)
+
+    def set_paused(self, paused):
+        if paused == self.paused:
+            return
+        self.current_index()
+        self.paused = paused
+        self._rebase(self.position)
+
+    #frame number due now
+    def current_index(self, now=None):
+        if not self.paused:
+            if now is None:
+                now = time.perf_counter()
+            timestamp = self.start_timestamp + (now - self.start_time) * self.speed
+            self.position = max(self.recording.find_time(timestamp), self.start_position)
+        return self.position
+
+    #seconds until the next frame is due, None at the end of the recording or when paused
+    def time_to_next(self, now=None):
+        if self.paused or self.at_end():
+            return None
+        if now is None:
+            now = time.perf_counter()
+        next_time = self.start_time + (self.recording.timestamp(self.position + 1) - self.start_timestamp) / self.speed
+        return max(next_time - now, 0)
+
+    def at_end(self):
+        return self.position >= len(self.recording) - 1
+
+    def _rebase(self, n):
+        self.start_position = n
+        self.start_time = time.perf_counter()
+        self.start_timestamp = self.recording.timestamp(n)
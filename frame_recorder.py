@@ -0,0 +1,126 @@
+from threading import Thread, Event
+import time
+import logging
+import numpy as np
+
+from frame_ring import FrameRing
+
+#Recording file layout, all little endian:
+#data file: header, then one record per frame [sequence, timestamp, 24x32 int16 in 0.01 DegC]
+#index file (data file name + ".idx"): one entry per frame [sequence, timestamp, offset, size of the record]
+#every index entry has the same size, so frame n is found without reading the frames before it
+#the timestamps are monotonic clock seconds, they never go back, so seeking can search them,
+#the header keeps the wall clock and monotonic time the recording started at, zero in older recordings
+RECORDING_MAGIC = b"IRREC001"
+RECORDING_EXTENSION = ".irrec"
+INDEX_EXTENSION = ".idx"
+TEMPERATURE_SCALE = 0.01
+
+header_dtype = np.dtype([("magic", "S8"), ("rows", "<u2"), ("cols", "<u2"), ("scale", "<f4"), ("start_time", "<f8"), ("start_monotonic", "<f8")])
+record_dtype = np.dtype([("sequence", "<i8"), ("timestamp", "<f8"), ("frame", "<i2", (24, 32))])
+index_dtype = np.dtype([("sequence", "<i8"), ("timestamp", "<f8"), ("offset", "<u8"), ("size", "<u4")])
+
+
+def make_header(rows=24, cols=32, scale=TEMPERATURE_SCALE, start_time=0, start_monotonic=0):
+    header = np.zeros(1, dtype=header_dtype)
+    header["magic"] = RECORDING_MAGIC
+    header["rows"] = rows
+    header["cols"] = cols
+    header["scale"] = scale
+    header["start_time"] = start_time
+    header["start_monotonic"] = start_monotonic
+    return header
+
+
+#convert temperatures in DegC back to the sensor fixed point values
+def temperatures_to_raw(frame, out=None):
+    if out is None:
+        out = np.empty(np.shape(frame), dtype=np.int16)
+    np.rint(np.multiply(frame, 1 / TEMPERATURE_SCALE), out=out, casting="unsafe")
+    return out
+
+
+#class to record frames to a binary file in a background thread
+#add_frame is called from the serial reader thread and only copies the frame into a ring,
+#the writer thread drains the ring so the display loop never waits on the disk
+class FrameRecorder(Thread):
+    def __init__(self, path, capacity=256, flush_interval=1.0):
+        Thread.__init__(self)
+        self.path = path
+        self.index_path = path + INDEX_EXTENSION
+        self.flush_interval = flush_interval
+        self.frames = FrameRing(capacity)
+        self.frame_available = Event()
+        self.request_stop = Event()
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.record = np.zeros(1, dtype=record_dtype)
+        self.index_entry = np.zeros(1, dtype=index_dtype)
+
+        self.start()
+
+    #frame listener for IRSerialReader, the timestamp is monotonic, wall clock time can jump back on a clock change
+    #the recorded sequence numbers count the frames given to the recorder, a gap means frames were dropped
+    def add_frame(self, sequence, frame):
+        self.frames.put(frame, timestamp=time.monotonic())
+        self.frame_available.set()
+
+    def run(self):
+        try:
+            data_file = open(self.path, "wb")
+            index_file = open(self.index_path, "wb")
+        except Exception as e:
+            logging.error("Error opening recording: %s" % e)
+            return
+
+        with data_file, index_file:
+            data_file.write(make_header(start_time=time.time(), start_monotonic=time.monotonic()).tobytes())
+            offset = header_dtype.itemsize
+            last_flush = time.perf_counter()
+            frame = np.zeros((24, 32), dtype=np.float32)
+
+            while True:
+                stopping = self.request_stop.is_set()
+                self.frame_available.wait(0.1)
+                self.frame_available.clear()
+
+                while True:
+                    latest = self.frames.get(out=frame)
+                    if latest is None:
+                        break
+                    sequence, timestamp, frame = latest
+
+                    self.record["sequence"] = sequence
+                    self.record["timestamp"] = timestamp
+                    temperatures_to_raw(frame, out=self.record["frame"][0])
+                    data_file.write(self.record.tobytes())
+
+                    self.index_entry["sequence"] = sequence
+                    self.index_entry["timestamp"] = timestamp
+                    self.index_entry["offset"] = offset
+                    self.index_entry["size"] = record_dtype.itemsize
+                    index_file.write(self.index_entry.tobytes())
+
+                    offset += record_dtype.itemsize
+                    self.frames_written += 1
+
+                self.bytes_written = offset
+
+                #flush now and then so a crash loses at most a second of frames
+                if time.perf_counter() - last_flush > self.flush_interval:
+                    data_file.flush()
+                    index_file.flush()
+                    last_flush = time.perf_counter()
+
+                if stopping:
+                    break
+
+    #stop after everything already received is written
+    def stop(self):
+        self.request_stop.set()
+        self.frame_available.set()
+        self.join()
+
+    def stats(self):
+        stats = self.frames.stats()
+        return {"written": self.frames_written, "dropped": stats["dropped"], "bytes": self.bytes_written}
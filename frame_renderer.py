@@ -0,0 +1,432 @@
+from collections import namedtuple
+import time
+import numpy as np
+import cv2 as cv
+
+from constants import *
+from overlay_cache import LayerCache, make_overlay_layer
+from stage_timer import StageTimer
+from iso_contours import region_outline
+
+#immutable snapshot of everything the display depends on, safe to hand to other threads and processes
+#color map, resolution and interpolation are the names used in constants
+#hotspots are the (id, peak, trail) tuples of HotspotTracker.overlay, drawn when show_hotspots is set
+RenderSettings = namedtuple("RenderSettings", [
+    "color_map",
+    "display_resolution",
+    "display_interpolation",
+    "min_temp_autorange",
+    "max_temp_autorange",
+    "min_temp_manual",
+    "max_temp_manual",
+    "display_range_headroom",
+    "show_scale_ticks",
+    "show_contours",
+    "contour_tolerance",
+    "show_help",
+    "debug",
+    "display_range_quantum",
+    "colorization",
+    "show_hotspots",
+    "hotspots",
+], defaults=[
+    "Jet",
+    DISPLAY_RESOLUTION_DEFAULT,
+    "Cubic",
+    MIN_TEMP_AUTORANGE_DEFAULT,
+    MAX_TEMP_AUTORANGE_DEFAULT,
+    MIN_TEMP_MANUAL_DEFAULT,
+    MAX_TEMP_MANUAL_DEFAULT,
+    DISPLAY_RANGE_HEADROOM_DEFAULT,
+    SHOW_SCALE_TICKS_DEFAULT,
+    SHOW_CONTOURS_DEFAULT,
+    CONTOUR_TOLERANCE_DEFAULT,
+    False,
+    False,
+    DISPLAY_RANGE_QUANTUM_DEFAULT,
+    COLORIZATION_DEFAULT,
+    SHOW_HOTSPOTS_DEFAULT,
+    (),
+])
+
+
+#width and height for a display resolution name
+#names that are not in display_resolutions are read as "WxH", e.g. the tiles of the multi camera display
+def resolution_size(name):
+    if name in display_resolutions:
+        return display_resolutions[name]
+    return [int(value) for value in name.split("x")]
+
+
+#class to turn a 24x32 temperature frame into a BGR display image
+#needs no Tk and no window, the debug images are kept in debug_images for the caller to show
+#the scale, ticks and help text are prerendered once per settings and kept in an LRU cache
+class FrameRenderer():
+    def __init__(self, cache_size=OVERLAY_CACHE_SIZE, timer=None):
+        self.display_resolution = display_resolutions[DISPLAY_RESOLUTION_DEFAULT]
+        self.timer = timer if timer is not None else StageTimer()
+        self.debug_images = {}
+        self.layers = LayerCache(cache_size)
+        self.color_luts = {}
+
+    def render(self, data, settings):
+        data = np.reshape(data, (24, 32))
+        self.display_resolution = resolution_size(settings.display_resolution)
+        self.debug_images = {}
+
+        min_temp = np.min(data)
+        max_temp = np.max(data)
+
+        display_range, display_min_range, display_max_range = self.get_display_range(min_temp, max_temp, settings)
+
+        color_map = color_maps[settings.color_map]
+        display_interpolation = display_interpolations[settings.display_interpolation]
+
+        start = time.perf_counter()
+        if settings.colorization == "Temperature":
+            rgb = self.colorize_temperatures(data, display_min_range, display_max_range, settings)
+        else:
+            rgb = self.colorize_colors(data, display_min_range, display_max_range, settings)
+        self.timer.lap("colorize", start)
+
+        #find index of min and max temp
+        min_index = np.unravel_index(np.argmin(data), data.shape)
+        max_index = np.unravel_index(np.argmax(data), data.shape)
+
+        #swapaxis on the index
+        min_index = min_index[::-1]
+        max_index = max_index[::-1]
+
+        min_pixel_position = self.input_pixel_to_output_pixel(*min_index)
+        max_pixel_position = self.input_pixel_to_output_pixel(*max_index)
+
+        #Make temperature scale
+        temp_scale_width_px = int(20 * self.display_resolution[0] / 640)
+        temp_scale_size = (temp_scale_width_px, self.display_resolution[1])
+        temp_scale = self.layers.get(("scale", settings.color_map, settings.display_interpolation, settings.display_resolution),
+                                     lambda: self.make_temp_scale(color_map, display_interpolation, temp_scale_size))
+
+        #add the temperature scale to the left side of the image
+        rgb[:, :temp_scale_width_px] = temp_scale
+
+        min_temp_normalized_pos = self.temperature_to_scale_normalized(min_temp, display_range, display_max_range)
+        max_temp_normalized_pos = self.temperature_to_scale_normalized(max_temp, display_range, display_max_range)
+
+        min_temp_position = self.input_pixel_to_output_pixel(x=0, y=min_temp_normalized_pos)
+        max_temp_position = self.input_pixel_to_output_pixel(x=0, y=max_temp_normalized_pos)
+
+        #print min and max temp
+        text_size = 0.5
+        text_y_offset = 5
+        text_xpos = temp_scale_width_px+10
+
+        #auto ranged limits only repeat when they are snapped, otherwise caching the ticks would draw them twice
+        repeating_range = settings.display_range_quantum > 0 or not (settings.min_temp_autorange or settings.max_temp_autorange)
+        if settings.show_scale_ticks and not repeating_range:
+            self.draw_ticks(rgb, display_min_range, display_max_range, temp_scale_width_px, text_xpos, text_y_offset, text_size)
+        elif settings.show_scale_ticks:
+            #the tick labels never reach far past the scale
+            ticks_size = (min(text_xpos + 200, self.display_resolution[0]), self.display_resolution[1])
+            ticks_key = ("ticks", settings.display_resolution, self.range_key(display_min_range), self.range_key(display_max_range))
+            ticks = self.layers.get(ticks_key, lambda: make_overlay_layer(ticks_size,
+                lambda canvas: self.draw_ticks(canvas, display_min_range, display_max_range, temp_scale_width_px, text_xpos, text_y_offset, text_size),
+                self.display_resolution[0]))
+            ticks.composite(rgb)
+
+        self.draw_hotspot(min_temp_position, rgb, fg=(0, 0, 0), bg=(255, 255, 255))
+        self.draw_hotspot(max_temp_position, rgb, fg=(255, 255, 255), bg=(0, 0, 0))
+
+        cv.putText(rgb, "%.1f" % max_temp, (text_xpos, max_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
+        cv.putText(rgb, "%.1f" % max_temp, (text_xpos, max_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)
+
+        cv.putText(rgb, "%.1f" % min_temp, (text_xpos, min_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
+        cv.putText(rgb, "%.1f" % min_temp, (text_xpos, min_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)
+
+
+        if settings.show_help:
+            self.overlay("help", self.draw_help, rgb, settings)
+
+
+        #draw min and max pixel circles on the image
+        self.draw_hotspot(min_pixel_position, rgb, fg=(0, 0, 0), bg=(255, 255, 255))
+        self.draw_hotspot(max_pixel_position, rgb, fg=(255, 255, 255), bg=(0, 0, 0))
+
+
+        if settings.show_contours:
+            start = time.perf_counter()
+            self.draw_contours(data, max_temp, min_temp, max_index, min_index, rgb, settings)
+            self.timer.lap("contours", start)
+
+        if settings.show_hotspots and settings.hotspots:
+            start = time.perf_counter()
+            self.draw_tracked_hotspots(rgb, settings.hotspots)
+            self.timer.lap("hotspots", start)
+
+        #If not in help mode show the help hint at the bottom
+        if not settings.show_help:
+            self.overlay("help_hint", self.draw_help_hint, rgb, settings)
+
+        #If debugging then show it at the bottom
+        if settings.debug:
+            self.overlay("debug_hint", self.draw_debug_hint, rgb, settings)
+
+        return rgb
+
+    #apply the color map at sensor resolution, then rescale the color image to the display resolution
+    def colorize_colors(self, data, display_min_range, display_max_range, settings):
+        normalized = self.normalize_temperature_data(data, display_min_range, display_max_range)
+
+        #limit the range to 0-1
+        normalized = np.clip(normalized, 0, 1)
+
+        #convert array to CV_8UC1
+        cv_normalized = np.array(normalized * 255, dtype=np.uint8)
+
+        rgb = cv.applyColorMap(cv_normalized, color_maps[settings.color_map])
+
+        #rescale the image to the display resolution
+        display_interpolation = display_interpolations[settings.display_interpolation]
+        return cv.resize(rgb, self.display_resolution, interpolation=display_interpolation)
+
+    #rescale the single channel temperatures to the display resolution, then apply the color map
+    #every display pixel gets a color of the color map, only one 8 bit channel is resized
+    #a float or 16 bit resize takes 7 ms at 1920x1080 with Cubic against 0.7 ms for 8 bit, and the lookup costs the rest
+    def colorize_temperatures(self, data, display_min_range, display_max_range, settings):
+        normalized = self.normalize_temperature_data(data, display_min_range, display_max_range)
+        cv_normalized = np.array(np.clip(normalized, 0, 1) * 255, dtype=np.uint8)
+
+        #the 8 bit resize saturates, so the ringing of cubic and lanczos is clamped on the way
+        display_interpolation = display_interpolations[settings.display_interpolation]
+        cv_normalized = cv.resize(cv_normalized, self.display_resolution, interpolation=display_interpolation)
+
+        return cv.applyColorMap(cv_normalized, self.color_lut(settings.color_map))
+
+    #256 entry BGR lookup table of a color map, made once per color map
+    def color_lut(self, color_map_name):
+        lut = self.color_luts.get(color_map_name)
+        if lut is None:
+            lut = cv.applyColorMap(np.arange(256, dtype=np.uint8).reshape(256, 1), color_maps[color_map_name])
+            self.color_luts[color_map_name] = lut
+        return lut
+
+    #composite a cached overlay that only depends on the display resolution
+    def overlay(self, name, draw, rgb, settings):
+        layer = self.layers.get((name, settings.display_resolution), lambda: make_overlay_layer(self.display_resolution, draw))
+        layer.composite(rgb)
+
+    #cache key for a display range limit, snapped limits repeat exactly
+    def range_key(self, value):
+        return round(float(value), 6)
+
+    def draw_help(self, rgb):
+        #draw help table on the image
+        help_x = 150
+        help_y = 20
+        help_line_height = 20
+        for line in help_table:
+            cv.putText(rgb, line[0], (help_x, help_y), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            cv.putText(rgb, line[1], (help_x + 100, help_y), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+            help_y += help_line_height
+
+    def draw_help_hint(self, rgb):
+        cv.putText(rgb, "H for help", (self.display_resolution[0]-100, self.display_resolution[1] - 10), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
+
+    def draw_debug_hint(self, rgb):
+        cv.putText(rgb, "Debug mode", (self.display_resolution[0]-100, self.display_resolution[1] - 30), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
+
+    #draw a table of stage timings in the top right corner, it changes every frame so it is not cached
+    def draw_stats(self, rgb, rows):
+        column_widths = [130, 50, 50, 50, 50]
+        stats_x = rgb.shape[1] - sum(column_widths) - 10
+        stats_y = 20
+        stats_line_height = 16
+        for row in rows:
+            cell_x = stats_x
+            for cell, width in zip(row, column_widths):
+                cv.putText(rgb, cell, (cell_x, stats_y), cv.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 3)
+                cv.putText(rgb, cell, (cell_x, stats_y), cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+                cell_x += width
+            stats_y += stats_line_height
+
+    def input_pixel_to_output_pixel(self, x, y):
+        #convert input pixel to output pixel
+        #input pixel is 32x24
+        #output pixel is self.display_resolution
+        output_x = int((x+0.5) * self.display_resolution[0] / 32)
+        output_y = int((y+0.5) * self.display_resolution[1] / 24)
+        return output_x, output_y
+
+    def input_pixels_to_output_pixels(self, temp_pos):
+        out_px = (temp_pos + 0.5) * self.display_resolution[1] / 24
+        out_px = np.round(out_px).astype(np.int64)
+        return out_px
+
+    def get_display_range(self, min_temp, max_temp, settings):
+        display_min_range = settings.min_temp_manual
+        display_max_range = settings.max_temp_manual
+
+        display_range_headroom = settings.display_range_headroom
+
+        #with a quantum the auto ranged limits snap outwards, so the range and the cached ticks only change in steps
+        #the shown range is then up to a quantum wider, 0 keeps it exact
+        quantum = settings.display_range_quantum
+
+        if settings.min_temp_autorange:
+            display_min_range = min_temp - display_range_headroom
+            if quantum > 0:
+                display_min_range = np.floor(display_min_range / quantum) * quantum
+
+        if settings.max_temp_autorange:
+            display_max_range = max_temp + display_range_headroom
+            if quantum > 0:
+                display_max_range = np.ceil(display_max_range / quantum) * quantum
+
+        display_range = display_max_range - display_min_range
+        return display_range, display_min_range, display_max_range
+
+
+    def normalize_temperature_data(self, data, min_temp, max_temp):
+        normalized = (data - min_temp) / (max_temp - min_temp)
+        return normalized
+
+    def temperature_to_scale_normalized(self, normalized_temp, display_range, display_max_range):
+        normalized_scale = display_range / 23
+        display_scale_temp = (display_max_range - normalized_temp) / normalized_scale
+        return display_scale_temp
+
+    def draw_hotspot(self, position, rgb, fg=(255, 255, 255), bg=(0, 0, 0)):
+        xres = rgb.shape[1]
+        circle_size = int(xres*0.005) + 4
+        cv.circle(rgb, position, circle_size, bg, 4)
+        cv.circle(rgb, position, circle_size, fg, 2)
+
+    def make_temp_scale(self, color_map, display_interpolation, temp_scale_size):
+        #make the a color temperature scale from 255 to 0
+        temp_scale = np.linspace(start=255, stop=0, num=24).T
+
+        #convert the scale to CV_8UC1
+        temp_scale = np.array(temp_scale, dtype=np.uint8)
+
+        #rescale the temperature scale to the display resolution
+        temp_scale = cv.resize(temp_scale, (temp_scale_size[0], temp_scale_size[1]), interpolation=display_interpolation)
+
+        #convert the temperature scale to a color map
+        temp_scale = cv.applyColorMap(temp_scale, color_map)
+
+        return temp_scale
+
+
+    #outline the pixels within the tolerance of the max and min temperature that are connected to the hottest and coldest pixel
+    #the outlines are worked out on the sensor grid and drawn as vectors, so the cost does not depend on the display resolution
+    def draw_contours(self, data, max_temp, min_temp, max_index, min_index, rgb, settings):
+        temp_range = max_temp - min_temp
+
+        contour_tolerance = settings.contour_tolerance
+        contour_tolerance = np.clip(contour_tolerance, 0, 100)
+        contour_tolerance *= 0.01
+
+        #data with temperature above 90% of the range
+        high_temperatures = data > (max_temp - contour_tolerance * temp_range)
+
+        #data with temperature below 10% of the range
+        low_temperatures = data < (min_temp + contour_tolerance * temp_range)
+
+        #choose the regions containing the max and min pixel
+        high_temperatures = self.connected_region(high_temperatures, max_index)
+        low_temperatures = self.connected_region(low_temperatures, min_index)
+
+        high_segments, high_smoothed = region_outline(high_temperatures)
+        low_segments, low_smoothed = region_outline(low_temperatures)
+
+        #draw the contours on the image
+        self.draw_segments(rgb, high_segments, (255, 255, 255))
+        self.draw_segments(rgb, low_segments, (0, 0, 0))
+
+        if settings.debug:
+            #keep the high and low temperature regions for the caller to show
+            self.debug_images["High Temperatures"] = cv.resize(np.uint8(high_smoothed * 255), self.display_resolution, interpolation=cv.INTER_NEAREST)
+            self.debug_images["Low Temperatures"] = cv.resize(np.uint8(low_smoothed * 255), self.display_resolution, interpolation=cv.INTER_NEAREST)
+
+    #the pixels of the mask 8-connected to the pixel at index (x, y)
+    def connected_region(self, mask, index):
+        x, y = index
+        if not mask[y, x]:
+            return np.zeros(mask.shape, dtype=bool)
+        count, labels = cv.connectedComponents(mask.astype(np.uint8), connectivity=8)
+        return labels == labels[y, x]
+
+    #draw segments in sensor pixel coordinates, with 4 bits of sub-pixel precision
+    def draw_segments(self, rgb, segments, color):
+        if len(segments) == 0:
+            return
+        scale = np.array([self.display_resolution[0] / 32, self.display_resolution[1] / 24], dtype=np.float32)
+        points = np.rint((segments + 0.5) * scale * 16).astype(np.int32)
+        cv.polylines(rgb, list(points), False, color, 2, cv.LINE_8, 4)
+
+    #trail, marker and "#id peak" label of every tracked hotspot, the trails are in sensor pixel coordinates
+    def draw_tracked_hotspots(self, rgb, hotspots):
+        scale = np.array([self.display_resolution[0] / 32, self.display_resolution[1] / 24], dtype=np.float32)
+        for track_id, peak, trail in hotspots:
+            points = np.rint((np.array(trail, dtype=np.float32) + 0.5) * scale * 16).astype(np.int32)
+            if len(points) > 1:
+                cv.polylines(rgb, [points], False, (255, 255, 255), 1, cv.LINE_AA, 4)
+            position = self.input_pixel_to_output_pixel(*trail[-1])
+            cv.drawMarker(rgb, position, (0, 0, 0), cv.MARKER_CROSS, 12, 3)
+            cv.drawMarker(rgb, position, (255, 255, 255), cv.MARKER_CROSS, 12, 1)
+            label = "#%d %.1f" % (track_id, peak)
+            cv.putText(rgb, label, (position[0] + 8, position[1] - 8), cv.FONT_HERSHEY_SIMPLEX, 0.4, (0, 0, 0), 3)
+            cv.putText(rgb, label, (position[0] + 8, position[1] - 8), cv.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+
+    def draw_ticks(self, rgb, display_min_range, display_max_range, temp_scale_width_px, text_xpos, text_y_offset, text_size):
+        display_range = display_max_range - display_min_range
+
+        #Find the nearest decade to the temperatue range
+        decade = 5 ** int(np.log(display_range)/np.log(5))
+
+        #Floor the min display range to the nearest decade
+        display_min_tick = np.floor(display_min_range / decade) * decade
+
+        #Ceil the max display range to the nearest decade
+        display_max_tick = np.ceil(display_max_range / decade) * decade
+
+        #make a range of ticks from min to max with decade spacing
+        num_ticks = int((display_max_tick - display_min_tick) / decade)
+        tick_temperatures = np.linspace(display_min_tick, display_max_tick, num_ticks+1)
+
+        # Convert temperature input scale to display output scale
+        tick_scale_positions = self.temperature_to_scale_normalized(tick_temperatures, display_range, display_max_range)
+
+        #Convert the display scale positions to pixel positions
+        tick_positions_px = self.input_pixels_to_output_pixels(tick_scale_positions)
+
+        if decade < 1:
+            format = "%.1f"
+        else:
+            format = "%.0f"
+
+        #Draw the ticks on the image
+        for tick_position, tick_temperature in zip(tick_positions_px, tick_temperatures):
+            cv.line(rgb, (0, tick_position), (temp_scale_width_px, tick_position), (255, 255, 255), 3)
+            cv.putText(rgb, format % tick_temperature, (text_xpos+10, tick_position+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
+            cv.putText(rgb, format % tick_temperature, (text_xpos+10, tick_position+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)
+
+
+if __name__ == "__main__":
+    #compare the two colorization modes at every display resolution and interpolation
+
+    rng = np.random.default_rng(0)
+    frames = (20 + 5 * rng.random((100, 24, 32))).astype(np.float32)
+    renderer = FrameRenderer()
+
+    print("%-10s %-9s %12s %12s" % ("resolution", "interp", "Color ms", "Temperature ms"))
+    for resolution in display_resolutions:
+        for interpolation in display_interpolations:
+            times = []
+            for colorization in colorizations:
+                settings = RenderSettings(display_resolution=resolution, display_interpolation=interpolation, colorization=colorization)
+                renderer.render(frames[0], settings)
+                start = time.perf_counter()
+                for frame in frames:
+                    renderer.render(frame, settings)
+                times.append((time.perf_counter() - start) * 1000 / len(frames))
+            print("%-10s %-9s %12.2f %12.2f" % (resolution, interpolation, *times))
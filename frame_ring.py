@@ -0,0 +1,180 @@
+from threading import Lock
+from multiprocessing import shared_memory
+import time
+import numpy as np
+
+#class to hand frames from the reader thread to consumers through a bounded ring of preallocated slots
+#every published frame gets the next sequence number, when the ring is full the oldest frame is dropped
+#the producer never waits for a consumer, frames are always copied out under a short lock
+#every frame has a mask of the rows it really has, all true unless the producer says otherwise
+class FrameRing():
+    def __init__(self, capacity=4, shape=(24, 32), dtype=np.float32):
+        if capacity < 2:
+            raise ValueError("Frame ring needs at least 2 slots")
+        self.capacity = capacity
+        self.slots = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.sequences = np.full(capacity, -1, dtype=np.int64)
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.masks = np.ones((capacity, shape[0]), dtype=bool)
+        self.lock = Lock()
+
+        #sequence number of the next frame to publish and of the oldest unconsumed frame
+        self.head = 0
+        self.tail = 0
+
+        self.produced = 0
+        self.consumed = 0
+        self.dropped = 0
+
+    #sequence number of the newest published frame, -1 before the first frame
+    @property
+    def sequence(self):
+        return self.head - 1
+
+    #number of published frames not consumed yet
+    def __len__(self):
+        with self.lock:
+            return self.head - self.tail
+
+    #slot for the producer to fill in place before calling publish
+    #if the ring is full the oldest frame is dropped now so no consumer can read the slot while it is written
+    def write_slot(self):
+        with self.lock:
+            if self.head - self.tail == self.capacity:
+                self.tail += 1
+                self.dropped += 1
+        return self.slots[self.head % self.capacity]
+
+    #publish the frame written into write_slot, returns its sequence number
+    def publish(self, timestamp=None, mask=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        with self.lock:
+            index = self.head % self.capacity
+            self.sequences[index] = self.head
+            self.timestamps[index] = timestamp
+            if mask is None:
+                self.masks[index] = True
+            else:
+                self.masks[index] = mask
+            self.head += 1
+            self.produced += 1
+            return self.head - 1
+
+    #copy a frame into the ring and publish it
+    def put(self, frame, timestamp=None):
+        np.copyto(self.write_slot(), np.reshape(frame, self.slots.shape[1:]), casting="unsafe")
+        return self.publish(timestamp)
+
+    #consume the oldest unconsumed frame, returns (sequence, timestamp, frame) or None when empty
+    #the row mask is copied into mask_out when given
+    def get(self, out=None, mask_out=None):
+        with self.lock:
+            if self.head == self.tail:
+                return None
+            result = self._copy_out(self.tail, out, mask_out)
+            self.tail += 1
+            self.consumed += 1
+            return result
+
+    #consume the newest frame, older unconsumed frames are counted as dropped
+    #returns (sequence, timestamp, frame) or None when there is no new frame
+    def get_latest(self, out=None, mask_out=None):
+        with self.lock:
+            if self.head == self.tail:
+                return None
+            self.dropped += self.head - 1 - self.tail
+            result = self._copy_out(self.head - 1, out, mask_out)
+            self.tail = self.head
+            self.consumed += 1
+            return result
+
+    def _copy_out(self, sequence, out, mask_out=None):
+        index = sequence % self.capacity
+        if mask_out is not None:
+            np.copyto(mask_out, self.masks[index])
+        if out is None:
+            out = self.slots[index].copy()
+        else:
+            np.copyto(out, self.slots[index])
+        return sequence, self.timestamps[index], out
+
+    def stats(self):
+        with self.lock:
+            return {"produced": self.produced, "consumed": self.consumed, "dropped": self.dropped, "pending": self.head - self.tail}
+
+
+#property for a counter of the shared ring kept in its control array
+def _control_field(index):
+    return property(lambda self: int(self.control[index]), lambda self, value: self.control.__setitem__(index, value))
+
+
+#FrameRing with its slots and counters in a multiprocessing.shared_memory block, for a producer in another process
+#the ring is created with a lock from the multiprocessing context and attached in the other process by name
+#every FrameRing method works unchanged, the head, tail and counters live in the control array
+class SharedFrameRing(FrameRing):
+    head = _control_field(0)
+    tail = _control_field(1)
+    produced = _control_field(2)
+    consumed = _control_field(3)
+    dropped = _control_field(4)
+
+    def __init__(self, capacity=4, shape=(24, 32), dtype=np.float32, name=None, lock=None):
+        if capacity < 2:
+            raise ValueError("Frame ring needs at least 2 slots")
+        self.capacity = capacity
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.lock = lock if lock is not None else Lock()
+
+        #control, sequences, timestamps, slots and masks one after another, each 8 byte aligned
+        layout = [(5, np.int64), (capacity, np.int64), (capacity, np.float64), ((capacity,) + self.shape, self.dtype), ((capacity, self.shape[0]), bool)]
+        sizes = [(int(np.prod(size)) * np.dtype(item).itemsize + 7) // 8 * 8 for size, item in layout]
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=sum(sizes))
+        else:
+            #a child process shares the resource tracker of its parent, the block stays registered once
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+
+        arrays = []
+        offset = 0
+        for (size, item), nbytes in zip(layout, sizes):
+            arrays.append(np.ndarray(size, dtype=item, buffer=self.shm.buf, offset=offset))
+            offset += nbytes
+        self.control, self.sequences, self.timestamps, self.slots, self.masks = arrays
+        if name is None:
+            self.control[:] = 0
+            self.sequences[:] = -1
+            self.masks[:] = True
+        self.closed = False
+
+    #copy the frame with a sequence number without consuming it, for readers that need every frame
+    #returns (sequence, timestamp, frame) or None when the frame was overwritten or not published yet
+    def read(self, sequence, out=None, mask_out=None):
+        with self.lock:
+            if self.closed or sequence >= self.head or self.sequences[sequence % self.capacity] != sequence:
+                return None
+            return self._copy_out(sequence, out, mask_out)
+
+    def get(self, out=None, mask_out=None):
+        if self.closed:
+            return None
+        return FrameRing.get(self, out, mask_out)
+
+    def get_latest(self, out=None, mask_out=None):
+        if self.closed:
+            return None
+        return FrameRing.get_latest(self, out, mask_out)
+
+    #unmap the block, the counters stay readable, only the creator unlinks it
+    def close(self, unlink=False):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.control = self.control.copy()
+            self.slots = self.sequences = self.timestamps = self.masks = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
@@ -0,0 +1,257 @@
+#Headless server that reads the thermal camera and streams the frames to local clients
+#   python frame_server.py --tcp 127.0.0.1:9640
+#   python frame_server.py --unix /tmp/ir_cam.sock
+#The serial port, baudrate and line decoder default to the ones in ir_cam.ini
+#
+#Stream format with --codec raw, the same layout as a recording (frame_recorder.py) without the index:
+#one header when the client connects, then one record per frame [sequence, timestamp, 24x32 int16 in 0.01 DegC]
+#with --codec delta the frames are delta coded packets of frame_codec.py, about half the size
+#a client gets a key frame first and after every frame it skipped, otherwise the delta to its previous frame
+#A slow client is never queued more than a few frames: while it is still receiving,
+#newer frames push out the oldest ones waiting for it and the skipped ones are counted
+
+import argparse
+import asyncio
+import configparser
+import logging
+import os
+import socket
+import time
+from collections import deque
+import numpy as np
+
+from constants import *
+from ir_serial_reader import IRSerialReader
+from process_reader import ProcessReader
+from roi_alarms import AlarmEngine, AlarmLog, load_regions
+from frame_recorder import make_header, temperatures_to_raw, header_dtype, record_dtype, RECORDING_MAGIC
+from frame_codec import FrameEncoder, FrameDecoder, make_archive_header, archive_header_dtype, compressors, STREAM_MAGIC
+
+#config logging to terminal
+logging.basicConfig(level=logging.INFO)
+
+
+#one connected client, the frames waiting to be sent and its counters
+#the queue is short, when a client falls behind the oldest frames are dropped
+class FrameClient():
+    def __init__(self, writer, number, queue_length=FRAME_SERVER_QUEUE_LENGTH):
+        self.writer = writer
+        peer = writer.get_extra_info("peername")
+        if isinstance(peer, tuple):
+            self.name = "#%d %s:%d" % (number, peer[0], peer[1])
+        else:
+            self.name = "#%d" % number
+        self.pending = deque(maxlen=queue_length)
+        self.frame_ready = asyncio.Event()
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        #the next frame must be a key frame
+        self.resync = True
+
+    #called on the event loop for every frame, with the frame coded on its own and as a delta
+    def offer(self, key, delta):
+        if len(self.pending) == self.pending.maxlen:
+            self.frames_skipped += 1
+            self.resync = True
+        self.pending.append((key, delta))
+        self.frame_ready.set()
+
+    def next_packet(self):
+        key, delta = self.pending.popleft()
+        if self.resync or delta is None:
+            self.resync = False
+            return key
+        return delta
+
+
+#class to fan the frames of one reader out to any number of clients with asyncio
+#the reader thread encodes every frame once, the event loop hands the same bytes to every client
+class FrameServer():
+    def __init__(self, reader, codec="raw", compressor=FRAME_CODEC_COMPRESSOR_DEFAULT, write_buffer=FRAME_SERVER_WRITE_BUFFER):
+        self.reader = reader
+        self.write_buffer = write_buffer
+        self.clients = set()
+        self.loop = None
+        self.encoder = None
+        if codec == "delta":
+            self.encoder = FrameEncoder(compressor)
+            self.header = make_archive_header(compressor, magic=STREAM_MAGIC).tobytes()
+        else:
+            self.header = make_header().tobytes()
+        self.record = np.zeros(1, dtype=record_dtype)
+        self.frames_published = 0
+        self.clients_connected = 0
+
+    #frame listener for IRSerialReader, runs on the reader thread
+    def add_frame(self, sequence, frame):
+        self.record["sequence"] = sequence
+        self.record["timestamp"] = time.time()
+        temperatures_to_raw(frame, out=self.record["frame"][0])
+        if self.encoder is not None:
+            key, delta = self.encoder.encode(sequence, float(self.record["timestamp"][0]), self.record["frame"][0])
+        else:
+            key = delta = self.record.tobytes()
+        try:
+            self.loop.call_soon_threadsafe(self.publish, key, delta)
+        except RuntimeError:
+            #the event loop is closed
+            pass
+
+    def publish(self, key, delta):
+        self.frames_published += 1
+        for client in self.clients:
+            client.offer(key, delta)
+
+    async def handle_client(self, reader, writer):
+        #small write buffer, drain waits as soon as a client falls behind
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        self.clients_connected += 1
+        client = FrameClient(writer, self.clients_connected)
+        logging.info("Client connected: %s" % (client.name,))
+        self.clients.add(client)
+        #clients send nothing, the read ends when the client closes the connection
+        closed = asyncio.ensure_future(self._until_closed(reader))
+        try:
+            writer.write(self.header)
+            sending = await self._unless_closed(writer.drain(), closed)
+            while sending:
+                if not await self._unless_closed(client.frame_ready.wait(), closed):
+                    break
+                client.frame_ready.clear()
+                while sending and client.pending:
+                    packet = client.next_packet()
+                    writer.write(packet)
+                    client.frames_sent += 1
+                    client.bytes_sent += len(packet)
+                    sending = await self._unless_closed(writer.drain(), closed)
+            logging.info("Client %s disconnected" % (client.name,))
+        except (ConnectionError, OSError) as e:
+            logging.info("Client %s disconnected: %s" % (client.name, e))
+        finally:
+            closed.cancel()
+            self.clients.discard(client)
+            logging.info("Client %s: sent %d frames in %d bytes, skipped %d" % (client.name, client.frames_sent, client.bytes_sent, client.frames_skipped))
+            writer.close()
+
+    async def _until_closed(self, reader):
+        while await reader.read(4096):
+            pass
+
+    #wait for a frame or a drain, or for the client to close the connection first, returns False when it did
+    #a reset connection raises its error
+    async def _unless_closed(self, awaitable, closed):
+        task = asyncio.ensure_future(awaitable)
+        done, _ = await asyncio.wait((task, closed), return_when=asyncio.FIRST_COMPLETED)
+        if closed in done:
+            task.cancel()
+            closed.result()
+            return False
+        task.result()
+        return True
+
+    async def report(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            clients = ", ".join("%s sent %d skipped %d" % (client.name, client.frames_sent, client.frames_skipped) for client in self.clients)
+            logging.info("Frames %d, clients: %s" % (self.frames_published, clients or "none"))
+            if not self.reader.is_alive():
+                logging.error("Serial reader stopped")
+                return
+
+    async def serve(self, tcp=None, unix=None, report_interval=10):
+        self.loop = asyncio.get_running_loop()
+        self.reader.frame_listeners.append(self.add_frame)
+        if unix is not None:
+            if os.path.exists(unix):
+                os.remove(unix)
+            server = await asyncio.start_unix_server(self.handle_client, path=unix)
+            logging.info("Serving frames on %s" % unix)
+        else:
+            host, port = tcp.rsplit(":", 1)
+            server = await asyncio.start_server(self.handle_client, host, int(port))
+            logging.info("Serving frames on %s" % tcp)
+
+        async with server:
+            #run until the reader stops, e.g. the sensor was unplugged
+            await self.report(report_interval)
+
+
+#blocking client for consumers that do not use asyncio, yields (sequence, timestamp, temperatures in DegC)
+def receive_frames(tcp=None, unix=None):
+    if unix is not None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix)
+    else:
+        host, port = tcp.rsplit(":", 1)
+        sock = socket.create_connection((host, int(port)))
+
+    with sock, sock.makefile("rb") as stream:
+        header = np.frombuffer(stream.read(header_dtype.itemsize), dtype=header_dtype)
+        if len(header) == 0:
+            raise ValueError("Not a frame stream")
+        scale = float(header["scale"][0])
+        if header["magic"][0] == STREAM_MAGIC:
+            header = header.view(archive_header_dtype)
+            decoder = FrameDecoder(header["compressor"][0].decode(), (int(header["rows"][0]), int(header["cols"][0])))
+            while True:
+                packet = decoder.read_packet(stream)
+                if packet is None:
+                    return
+                sequence, timestamp, frame = packet
+                yield sequence, timestamp, frame * np.float32(scale)
+        if header["magic"][0] != RECORDING_MAGIC:
+            raise ValueError("Not a frame stream")
+        while True:
+            data = stream.read(record_dtype.itemsize)
+            if len(data) < record_dtype.itemsize:
+                return
+            record = np.frombuffer(data, dtype=record_dtype)[0]
+            yield int(record["sequence"]), float(record["timestamp"]), record["frame"] * np.float32(scale)
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read("ir_cam.ini")
+    port = config.get("Serial", "port", fallback="")
+    line_decoder = config.get("Serial", "line_decoder", fallback=LINE_DECODER_DEFAULT)
+    frame_policy = config.get("Serial", "frame_policy", fallback=FRAME_POLICY_DEFAULT)
+    reader_mode = config.get("Serial", "reader", fallback=READER_MODE_DEFAULT)
+    baudrate = config.getint("Serial", "baudrate", fallback=BAUDRATE_DEFAULT)
+
+    parser = argparse.ArgumentParser(description="Stream thermal camera frames to local clients")
+    parser.add_argument("--port", default=port, help="serial port or pyserial URL of the sensor")
+    parser.add_argument("--baudrate", type=int, default=baudrate)
+    parser.add_argument("--decoder", default=line_decoder, choices=line_decoders)
+    parser.add_argument("--frame-policy", default=frame_policy, choices=frame_policies, help="drop frames with missing lines or pass them on")
+    parser.add_argument("--reader", default=reader_mode, choices=reader_modes, help="run the serial reader as a thread or in its own process")
+    parser.add_argument("--alarms", help="JSON file of alarm regions, see roi_alarms.py, the events are logged to --alarm-log")
+    parser.add_argument("--alarm-log", default="alarms.csv", help="CSV file for the alarm events")
+    parser.add_argument("--tcp", default=FRAME_SERVER_ADDRESS_DEFAULT, help="host:port to listen on")
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--codec", default="raw", choices=["raw", "delta"], help="raw records or delta coded frames")
+    parser.add_argument("--compressor", default=FRAME_CODEC_COMPRESSOR_DEFAULT, choices=list(compressors), help="compressor for --codec delta")
+    parser.add_argument("--report-interval", type=float, default=10, help="seconds between statistics in the log")
+    args = parser.parse_args()
+
+    if args.reader == "process":
+        reader = ProcessReader(args.port, args.baudrate, decoder=args.decoder, frame_policy=args.frame_policy)
+    else:
+        reader = IRSerialReader(args.port, args.baudrate, decoder=args.decoder, frame_policy=args.frame_policy)
+    server = FrameServer(reader, args.codec, args.compressor)
+    alarm_log = None
+    if args.alarms:
+        alarm_log = AlarmLog(args.alarm_log)
+        reader.frame_listeners.append(AlarmEngine(load_regions(args.alarms), alarm_log, args.port).add_frame)
+    try:
+        asyncio.run(server.serve(tcp=args.tcp, unix=args.unix, report_interval=args.report_interval))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.stop()
+        if alarm_log is not None:
+            alarm_log.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+from collections import deque
+import numpy as np
+import cv2 as cv
+
+from constants import *
+
+
+#hot blobs of a frame on the sensor grid: pixels hotter than the median of the frame by delta, 8-connected
+#returns arrays of the temperature weighted centroid x and y, the area in pixels and the peak temperature of every blob
+def detect_hotspots(data, delta=HOTSPOT_DELTA_DEFAULT, min_pixels=HOTSPOT_MIN_PIXELS):
+    values = np.ravel(data)
+    #median without sorting the whole frame
+    threshold = np.partition(values, len(values) // 2)[len(values) // 2] + delta
+    mask = (data > threshold).astype(np.uint8)
+    count, labels, stats, _ = cv.connectedComponentsWithStats(mask, connectivity=8)
+    if count <= 1:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty, empty, empty
+
+    #only the blob pixels, sorted by blob, label 0 is the background
+    labels = labels.ravel()
+    pixels = np.flatnonzero(labels)
+    pixels = pixels[np.argsort(labels[pixels], kind="stable")]
+    blob_labels = labels[pixels]
+    starts = np.flatnonzero(np.diff(blob_labels, prepend=0))
+    blob_values = values[pixels]
+    #weights above the threshold, so the centroid moves towards the hottest part of the blob
+    weights = blob_values - threshold
+    total = np.add.reduceat(weights, starts)
+    ys, xs = np.divmod(pixels, data.shape[1])
+    x = np.add.reduceat(weights * xs, starts) / total
+    y = np.add.reduceat(weights * ys, starts) / total
+    peak = np.maximum.reduceat(blob_values, starts)
+    area = stats[blob_labels[starts], cv.CC_STAT_AREA].astype(np.float64)
+
+    keep = area >= min_pixels
+    return x[keep], y[keep], area[keep], peak[keep]
+
+
+#one tracked hotspot, the trail keeps (time, x, y, area, peak) of its last frames in sensor coordinates
+class HotspotTrack():
+    def __init__(self, track_id, timestamp, x, y, area, peak, trail_length=HOTSPOT_TRAIL_LENGTH):
+        self.id = track_id
+        self.trail = deque(maxlen=trail_length)
+        self.velocity = (0.0, 0.0)
+        self.missed = 0
+        self.frames = 0
+        self.add(timestamp, x, y, area, peak)
+
+    def add(self, timestamp, x, y, area, peak):
+        if self.trail:
+            last_time, last_x, last_y = self.trail[-1][:3]
+            if timestamp > last_time:
+                self.velocity = ((x - last_x) / (timestamp - last_time), (y - last_y) / (timestamp - last_time))
+        self.trail.append((timestamp, x, y, area, peak))
+        self.missed = 0
+        self.frames += 1
+
+    #where the hotspot should be at a time, moving on as it did between its last two frames
+    def predict(self, timestamp):
+        last_time, x, y = self.trail[-1][:3]
+        return x + self.velocity[0] * (timestamp - last_time), y + self.velocity[1] * (timestamp - last_time)
+
+    @property
+    def position(self):
+        return self.trail[-1][1:3]
+
+    @property
+    def area(self):
+        return self.trail[-1][3]
+
+    @property
+    def peak(self):
+        return self.trail[-1][4]
+
+    #change of the area in pixels per second and of the peak in DegC per second over the trail
+    def growth_rate(self):
+        return self._rate(3)
+
+    def heating_rate(self):
+        return self._rate(4)
+
+    def _rate(self, field):
+        first, last = self.trail[0], self.trail[-1]
+        if last[0] <= first[0]:
+            return 0.0
+        return (last[field] - first[field]) / (last[0] - first[0])
+
+
+#class to follow the hotspots of one sensor from frame to frame with stable ids
+#every frame the blobs are matched to the predicted positions of the tracks, nearest pairs first, up to max_distance pixels
+#blobs left over start new tracks, tracks without a blob for more than max_missed frames are dropped
+#everything runs on the 32x24 grid, so it keeps up with the sensor at any display resolution
+class HotspotTracker():
+    def __init__(self, delta=HOTSPOT_DELTA_DEFAULT, min_pixels=HOTSPOT_MIN_PIXELS, max_distance=HOTSPOT_MATCH_DISTANCE,
+                 max_missed=HOTSPOT_MAX_MISSED):
+        self.delta = delta
+        self.min_pixels = min_pixels
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = 1
+        self.last_timestamp = None
+
+    #timestamp of the frame, the time it was taken for live frames and the recorded time for playback
+    #a frame shown again is not tracked twice, a frame from before the last one, e.g. after seeking back, starts again
+    def update(self, timestamp, data):
+        if self.last_timestamp is not None:
+            if timestamp == self.last_timestamp:
+                return self.visible()
+            if timestamp < self.last_timestamp:
+                self.reset()
+        self.last_timestamp = timestamp
+        xs, ys, areas, peaks = detect_hotspots(data, self.delta, self.min_pixels)
+
+        matched_tracks = set()
+        matched_blobs = set()
+        if self.tracks and len(xs):
+            predicted = np.array([track.predict(timestamp) for track in self.tracks])
+            distances = np.hypot(predicted[:, 0, np.newaxis] - xs, predicted[:, 1, np.newaxis] - ys)
+            for flat in np.argsort(distances, axis=None):
+                track_index, blob_index = divmod(int(flat), len(xs))
+                if distances[track_index, blob_index] > self.max_distance:
+                    break
+                if track_index in matched_tracks or blob_index in matched_blobs:
+                    continue
+                self.tracks[track_index].add(timestamp, xs[blob_index], ys[blob_index], areas[blob_index], peaks[blob_index])
+                matched_tracks.add(track_index)
+                matched_blobs.add(blob_index)
+
+        tracks = []
+        for index, track in enumerate(self.tracks):
+            if index not in matched_tracks:
+                track.missed += 1
+                if track.missed > self.max_missed:
+                    continue
+            tracks.append(track)
+        for blob_index in range(len(xs)):
+            if blob_index not in matched_blobs:
+                tracks.append(HotspotTrack(self.next_id, timestamp, xs[blob_index], ys[blob_index], areas[blob_index], peaks[blob_index]))
+                self.next_id += 1
+        self.tracks = tracks
+        return self.visible()
+
+    def reset(self):
+        self.tracks = []
+        self.last_timestamp = None
+
+    #tracks seen in the last frame
+    def visible(self):
+        return [track for track in self.tracks if track.missed == 0]
+
+    #(id, peak, trail of (x, y)) of the visible tracks, mirrored like the display and ready for RenderSettings
+    def overlay(self, columns=32):
+        return tuple((track.id, float(track.peak), tuple((columns - 1 - x, y) for _, x, y, _, _ in track.trail)) for track in self.visible())
+
+    #header and one row per visible track for the debug table, growth in px/s and heating in DegC/s over the trail
+    def table(self):
+        rows = [["hotspot", "peak", "px", "px/s", "C/s"]]
+        for track in self.visible():
+            rows.append(["#%d" % track.id, "%.1f" % track.peak, "%d" % track.area, "%+.1f" % track.growth_rate(), "%+.2f" % track.heating_rate()])
+        return rows
+
+
+if __name__ == "__main__":
+    #per frame cost with moving hotspots, and how often a track keeps its id
+    import time
+
+    rng = np.random.default_rng(0)
+    ys, xs = np.indices((24, 32))
+    frames = []
+    for index in range(2000):
+        t = index / 16
+        frame = 25 + rng.normal(0, 0.15, (24, 32))
+        #one hotspot circling in every quadrant, heating up and cooling down
+        for spot in range(4):
+            cx = 8 + 16 * (spot % 2) + 3 * np.cos(t * (0.5 + spot * 0.2))
+            cy = 6 + 12 * (spot // 2) + 3 * np.sin(t * (0.5 + spot * 0.2))
+            frame += (5 + spot + np.sin(t * 0.1)) * np.exp(-((xs - cx) ** 2 + (ys - cy) ** 2) / 3)
+        frames.append(frame.astype(np.float32))
+
+    tracker = HotspotTracker()
+    start = time.perf_counter()
+    for index, frame in enumerate(frames):
+        tracker.update(index / 16, frame)
+    elapsed = time.perf_counter() - start
+    print("%.1f us per frame, %d tracks started for 4 hotspots, %d visible at the end" % (elapsed / len(frames) * 1e6, tracker.next_id - 1, len(tracker.visible())))
+    for row in tracker.table():
+        print("".join("%-9s" % cell for cell in row))
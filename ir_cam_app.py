@@ -12,6 +12,7 @@
 
 from serial.tools.list_ports import comports
 import time
+from threading import Event
 import tkinter as tk
 from tkinter import ttk
 from tkinter import filedialog
@@ -21,50 +22,80 @@ import configparser
 import os
 import logging
 
-from ir_serial_reader import IRSerialReader
+from frame_renderer import RenderSettings
+from frame_recorder import FrameRecorder, RECORDING_EXTENSION
+from frame_player import Recording, FramePlayer
+from capture_writer import CaptureWriter
+from stage_timer import StageTimer
+from temperature_filter import TemperatureFilter
+from camera import Camera, tile_grid
+from render_pool import RenderPool
+from render_scheduler import RenderScheduler
+from roi_alarms import AlarmEngine, AlarmLog, load_regions
+from hotspot_tracker import HotspotTracker
 
 from constants import *
 
 #config logging to terminal
 logging.basicConfig(level=logging.INFO)
 
-#class to do per pixel adaptive filtering
-class TemperatureFilter():
-    def __init__(self, shape, noise_threshold=1.5):
-        self.filtered = np.zeros(shape, dtype=np.float32)
-        self.noise_threshold = noise_threshold
-        
-    def filter(self, data):
-        deltas = data - self.filtered
-        deltas2 = np.square(deltas)
-        gains = deltas2 / (deltas2 + self.noise_threshold**2)
-        self.filtered = self.filtered + (gains * deltas)
-        return self.filtered
-        
-        
-
 class IRCamApp(tk.Tk):
-    def __init__(self, port="", color_map="jet", *args, **kwargs):
+    def __init__(self, port="", color_map="jet", line_decoder=LINE_DECODER_DEFAULT, display_fps=DISPLAY_FPS_DEFAULT,
+                 baudrate=BAUDRATE_DEFAULT, sample_rate=SAMPLE_RATE_DEFAULT, auto_link=AUTO_LINK_DEFAULT,
+                 frame_policy=FRAME_POLICY_DEFAULT, reader_mode=READER_MODE_DEFAULT, range_quantum=DISPLAY_RANGE_QUANTUM_DEFAULT,
+                 *args, **kwargs):
         tk.Tk.__init__(self, *args, **kwargs)
         self.request_disconnect = False
         self.title("IR Camera")
         self.geometry()
         self.port = port
         self.color_map_default = color_map
+        self.line_decoder = line_decoder
+        self.frame_policy = frame_policy
+        self.reader_mode = reader_mode
+        #snap the auto ranged display limits to this step, 0 shows the exact range
+        self.range_quantum = range_quantum
         self.display_resolution = display_resolutions["640x480"]
-        self.unpacker = None
-        self.ir_serial_reader = None
-        self.baudrate = 460800
-        self.frame_counter = 0
-        self.line_counter = -1
+        self.cameras = []
+        self.selected_camera_index = 0
+        self.mosaic = None
+        self.baudrate = baudrate
+        self.sample_rate = sample_rate
+        self.auto_link = auto_link
         self.show_help = False
         self.debug = False
         self.loaded_data = None
+        self.player = None
+        self.playback_after_id = None
         self.paused = False
-        self.last_data = None
+        self.last_data = np.zeros((24, 32), dtype=np.float32)
+        self.status_after_id = None
 
-        self.frame = np.zeros((24, 32), dtype=np.float32)
-        self.filter = TemperatureFilter((24, 32))
+        self.filter = TemperatureFilter((24, 32), kernel=FILTER_KERNEL_DEFAULT)
+        #hotspots of the loaded captures and recordings, the cameras track their own
+        self.hotspots = HotspotTracker()
+        #timing of every stage from the serial read to the screen, shared with the reader thread
+        self.timer = StageTimer(STAGE_TIMING_WINDOW)
+        self.stats_rows = None
+        self.stats_time = 0
+        self.render_pool = RenderPool(RENDER_WORKERS_DEFAULT, timer=self.timer)
+        self.scheduler = RenderScheduler(display_fps)
+        self.render_after_id = None
+        self.pending_cameras = []
+        self.last_ticks = 0
+        #set by the reader threads when a frame is in a ring, polled by the Tk main loop
+        self.frame_signal = Event()
+        self.frame_poll_after_id = None
+        self.capture_writer = CaptureWriter()
+        #alarm regions from ALARM_REGIONS_FILE if there is one, the events of every camera go to one log
+        self.alarm_regions = None
+        self.alarm_log = None
+        self._load_alarm_regions()
+        #a burst of loaded frames, the cameras keep their own, keyed on the frame so no frame is saved twice
+        self.burst_remaining = 0
+        self.burst_basename = None
+        self.burst_index = 0
+        self.burst_sequence = None
 
         #connect destroy event to stop the serial reader
         self.protocol("WM_DELETE_WINDOW", self.on_closing)
@@ -73,14 +104,53 @@ class IRCamApp(tk.Tk):
         self.create_widgets()
         
         
+    #snapshot of the display settings for the renderer
+    def render_settings(self):
+        return RenderSettings(
+            color_map=self.color_map_var.get(),
+            display_resolution=self.display_resolution_var.get(),
+            display_interpolation=self.display_interpolation_var.get(),
+            min_temp_autorange=self.display_min_temp_autorange_var.get(),
+            max_temp_autorange=self.display_max_temp_autorange_var.get(),
+            min_temp_manual=self.display_min_temp_manual_var.get(),
+            max_temp_manual=self.display_max_temp_manual_var.get(),
+            display_range_headroom=self.display_range_headroom_var.get(),
+            display_range_quantum=self.range_quantum,
+            show_scale_ticks=self.show_scale_ticks_var.get(),
+            show_contours=self.show_contours_var.get(),
+            contour_tolerance=self.contour_tolerance_var.get(),
+            show_hotspots=self.show_hotspots_var.get(),
+            show_help=self.show_help,
+            debug=self.debug,
+            colorization=self.colorization_var.get(),
+        )
+        
     #on delete window event handler to stop servies
     def on_closing(self):
         self.request_disconnect = True
-        if self.ir_serial_reader is not None:
-            if self.ir_serial_reader.is_alive():
-                self.ir_serial_reader.stop()
+        self._close_cameras()
+        self.stop_playback()
+        self.capture_writer.stop()
+        self.render_pool.stop()
+        if self.alarm_log is not None:
+            self.alarm_log.stop()
         self.destroy()
         
+    def _load_alarm_regions(self):
+        if not os.path.exists(ALARM_REGIONS_FILE):
+            return
+        try:
+            regions = load_regions(ALARM_REGIONS_FILE)
+            #compile once to find bad regions now rather than on connect
+            AlarmEngine(regions)
+        except Exception as e:
+            logging.error("Error loading alarm regions from %s: %s" % (ALARM_REGIONS_FILE, e))
+            return
+        self.alarm_regions = regions
+        filepath = os.path.join(os.getcwd(), "alarms", "ir_cam_alarms_%s.csv" % time.strftime("%Y%m%d_%H%M%S"))
+        self.alarm_log = AlarmLog(filepath)
+        logging.info("Watching %d alarm regions, events go to %s" % (len(regions), filepath))
+        
     #validation function for value entry widgets  
     def validate(self, action, index, value_if_allowed,
                         prior_value, text, validation_type, trigger_type, widget_name):
@@ -109,6 +179,25 @@ class IRCamApp(tk.Tk):
         self.load_capture_button = tk.Button(self, text="Load Capture", command=self.load_capture_data)
         self.load_capture_button.grid(row=row, column=0, columnspan=2, sticky="ew", padx=padx, pady=pady)
                         
+        row += 1
+        
+        #playback speed of loaded recordings
+        self.playback_speed_label = tk.Label(self, text="Playback Speed")
+        self.playback_speed_label.grid(row=row, column=0, padx=padx, pady=pady)
+        self.playback_speed_var = tk.StringVar()
+        self.playback_speed_var.set(PLAYBACK_SPEED_DEFAULT)
+        self.playback_speed_dropdown = ttk.Combobox(self, textvariable=self.playback_speed_var, state="readonly")
+        self.playback_speed_dropdown["values"] = list(playback_speeds.keys())
+        self.playback_speed_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        self.playback_speed_dropdown.bind("<<ComboboxSelected>>", self._on_playback_speed)
+        
+        row += 1
+        
+        #scrub through loaded recordings
+        self.playback_position_var = tk.IntVar()
+        self.playback_scale = tk.Scale(self, variable=self.playback_position_var, from_=0, to=0, orient=tk.HORIZONTAL, showvalue=True, command=self._on_scrub)
+        self.playback_scale.grid(row=row, column=0, columnspan=2, sticky="ew", padx=padx, pady=pady)
+        
         row += 1
 
         self.port_button = tk.Button(self, text="Connect", command=self.connect)
@@ -116,6 +205,30 @@ class IRCamApp(tk.Tk):
         
         row += 1
         
+        #connect another camera on the selected port while connected
+        self.add_camera_button = tk.Button(self, text="Add Camera", command=self.add_camera, state="disabled")
+        self.add_camera_button.grid(row=row, column=0, columnspan=2, sticky="ew", padx=padx, pady=pady)
+        
+        row += 1
+        
+        #camera whose settings the widgets below show and change
+        self.camera_label = tk.Label(self, text="Camera")
+        self.camera_label.grid(row=row, column=0, padx=padx, pady=pady)
+        self.camera_var = tk.StringVar()
+        self.camera_dropdown = ttk.Combobox(self, textvariable=self.camera_var, state="readonly")
+        self.camera_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        self.camera_dropdown.bind("<<ComboboxSelected>>", self._on_camera_selected)
+        
+        row += 1
+        
+        #receive status, frame rate and frame to screen latency
+        self.status_var = tk.StringVar()
+        self.status_var.set("Disconnected")
+        self.status_label = tk.Label(self, textvariable=self.status_var)
+        self.status_label.grid(row=row, column=0, columnspan=2, padx=padx, pady=pady)
+        
+        row += 1
+        
         self.port_label = tk.Label(self, text="Serial Port")
         self.port_label.grid(row=row, column=0, padx=padx, pady=pady)
         
@@ -139,6 +252,26 @@ class IRCamApp(tk.Tk):
         
         row += 1
         
+        #sensor refresh rate, sent to the sensor with the baudrate while connected
+        self.sample_rate_label = tk.Label(self, text="Sample Rate")
+        self.sample_rate_label.grid(row=row, column=0, padx=padx, pady=pady)
+        
+        self.sample_rate_var = tk.StringVar()
+        self.sample_rate_var.set(self.sample_rate)
+        self.sample_rate_dropdown = ttk.Combobox(self, textvariable=self.sample_rate_var, state="readonly")
+        self.sample_rate_dropdown["values"] = list(sample_rates.keys())
+        self.sample_rate_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        
+        row += 1
+        
+        #pick the baudrate for the sample rate and step it up when lines get lost
+        self.auto_link_var = tk.BooleanVar()
+        self.auto_link_var.set(self.auto_link)
+        self.auto_link_checkbox = tk.Checkbutton(self, text="Auto Baudrate", variable=self.auto_link_var)
+        self.auto_link_checkbox.grid(row=row, column=0, padx=padx, pady=pady)
+        
+        row += 1
+        
         #Pause button
         self.paused_var = tk.BooleanVar()
         self.pause_button = tk.Button(self, text="Pause", command=lambda: self.paused_var.set(not self.paused_var.get()))
@@ -170,6 +303,17 @@ class IRCamApp(tk.Tk):
         
         row += 1
         
+        #display frame rate limit
+        self.display_fps_label = tk.Label(self, text="Display FPS")
+        self.display_fps_label.grid(row=row, column=0)
+        self.display_fps_var = tk.IntVar()
+        self.display_fps_var.set(self.scheduler.target_fps)
+        self.display_fps_dropdown = ttk.Combobox(self, textvariable=self.display_fps_var, state="readonly")
+        self.display_fps_dropdown["values"] = display_fps_options
+        self.display_fps_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        
+        row += 1
+        
         #display interpolation chooser
         self.display_interpolation_label = tk.Label(self, text="Display Interpolation")
         self.display_interpolation_label.grid(row=row, column=0)
@@ -181,6 +325,17 @@ class IRCamApp(tk.Tk):
         
         row += 1
         
+        #colorization chooser, color map before or after rescaling
+        self.colorization_label = tk.Label(self, text="Colorization")
+        self.colorization_label.grid(row=row, column=0)
+        self.colorization_var = tk.StringVar()
+        self.colorization_var.set(COLORIZATION_DEFAULT)
+        self.colorization_dropdown = ttk.Combobox(self, textvariable=self.colorization_var, state="readonly")
+        self.colorization_dropdown["values"] = colorizations
+        self.colorization_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        
+        row += 1
+        
         #display autorange checkboxes for min and max
         self.display_min_temp_autorange_var = tk.BooleanVar()
         self.display_min_temp_autorange_checkbox = tk.Checkbutton(self, text="Min Temp Auto", variable=self.display_min_temp_autorange_var)
@@ -227,6 +382,28 @@ class IRCamApp(tk.Tk):
         
         row += 1
         
+        #Temperature filter kernel
+        self.filter_kernel_label = tk.Label(self, text="Filter Kernel")
+        self.filter_kernel_label.grid(row=row, column=0, padx=padx, pady=pady)
+        self.filter_kernel_var = tk.StringVar()
+        self.filter_kernel_var.set(FILTER_KERNEL_DEFAULT)
+        self.filter_kernel_dropdown = ttk.Combobox(self, textvariable=self.filter_kernel_var, state="readonly")
+        self.filter_kernel_dropdown["values"] = filter_kernels
+        self.filter_kernel_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        
+        row += 1
+        
+        #live frame or a rolling stat map of every pixel
+        self.stat_view_label = tk.Label(self, text="Stat View")
+        self.stat_view_label.grid(row=row, column=0, padx=padx, pady=pady)
+        self.stat_view_var = tk.StringVar()
+        self.stat_view_var.set(STAT_VIEW_DEFAULT)
+        self.stat_view_dropdown = ttk.Combobox(self, textvariable=self.stat_view_var, state="readonly")
+        self.stat_view_dropdown["values"] = stat_views
+        self.stat_view_dropdown.grid(row=row, column=1, padx=padx, pady=pady)
+        
+        row += 1
+        
         #Temperature contour tolerance
         self.contour_tolerance_label = tk.Label(self, text="Contour Tolerance %")
         self.contour_tolerance_label.grid(row=row, column=0, padx=padx, pady=pady)
@@ -247,22 +424,99 @@ class IRCamApp(tk.Tk):
         self.show_contours_checkbox = tk.Checkbutton(self, text="Show Contours", variable=self.show_contours_var)
         self.show_contours_checkbox.grid(row=row, column=1, padx=padx, pady=pady)
         self.show_contours_var.set(SHOW_CONTOURS_DEFAULT)
+        
+        row += 1
+        #show the tracked hotspots with their ids and trails
+        self.show_hotspots_var = tk.BooleanVar()
+        self.show_hotspots_checkbox = tk.Checkbutton(self, text="Show Hotspots", variable=self.show_hotspots_var)
+        self.show_hotspots_checkbox.grid(row=row, column=0, padx=padx, pady=pady)
+        self.show_hotspots_var.set(SHOW_HOTSPOTS_DEFAULT)
+        
+        row += 1
+        
+        #number of consecutive frames in a burst capture
+        self.capture_burst_label = tk.Label(self, text="Burst Capture Frames")
+        self.capture_burst_label.grid(row=row, column=0, padx=padx, pady=pady)
+        self.capture_burst_var = tk.IntVar()
+        self.capture_burst_var.set(CAPTURE_BURST_DEFAULT)
+        self.capture_burst_entry = tk.Entry(self, textvariable=self.capture_burst_var, validate = 'key', validatecommand = vcmd)
+        self.capture_burst_entry.grid(row=row, column=1, padx=padx, pady=pady)
                 
         self.update_serial_ports()
         
     def load_capture_data(self):
         folderpath = os.path.join(os.getcwd(), "capture")
-        filepath = filedialog.askopenfilename(initialdir=folderpath, title="Select file", filetypes=(("CSV data files", "*.csv"), ("all files", "*.*")))
+        filepath = filedialog.askopenfilename(initialdir=folderpath, title="Select file", filetypes=(("CSV data files", "*.csv"), ("Recordings", "*" + RECORDING_EXTENSION), ("all files", "*.*")))
         if not filepath:
             return
+        if filepath.endswith(RECORDING_EXTENSION):
+            self.load_recording(filepath)
+            return
+        self.stop_playback()
         #load csv data
         self.loaded_data = np.loadtxt(filepath, delimiter=",")
         self.refresh_loaded_data()
         
+    def load_recording(self, filepath):
+        try:
+            recording = Recording(filepath)
+        except Exception as e:
+            logging.error("Error loading recording: %s" % e)
+            return
+        self.stop_playback()
+        self.loaded_data = None
+        self.player = FramePlayer(recording, speed=playback_speeds[self.playback_speed_var.get()])
+        self.playback_scale.config(to=len(recording) - 1)
+        logging.info("Playing %d frames, %.1f s from %s" % (len(recording), recording.duration(), filepath))
+        self.refresh_playback()
+        
+    def stop_playback(self):
+        if self.playback_after_id is not None:
+            self.after_cancel(self.playback_after_id)
+            self.playback_after_id = None
+        self.player = None
+        self.hotspots.reset()
+        self.burst_remaining = 0
+        
+    #show the frame that is due and come back when the next one is
+    def refresh_playback(self):
+        self.playback_after_id = None
+        if self.player is None:
+            return
+        self.player.set_paused(self.paused_var.get())
+        index = self.player.current_index()
+        #a burst takes the frames in a row, the player is held back to the next one
+        if self.burst_remaining > 0 and self.burst_sequence is not None and index > self.burst_sequence + 1:
+            index = self.burst_sequence + 1
+            self.player.seek(index)
+        self.playback_position_var.set(index)
+        start = time.perf_counter()
+        self._display_data(self.player.recording.frame(index), self.player.recording.timestamp(index), index)
+        self.scheduler.tick(start, time.perf_counter() - start)
+        if self.player is None:
+            return
+        
+        #keep refreshing a paused or finished recording so the display keys still work
+        #frames due faster than the display rate are skipped by the player
+        delay = self.player.time_to_next()
+        if delay is None:
+            delay = 0.1
+        delay = max(delay, self.scheduler.time_to_next())
+        self.playback_after_id = self.after(max(1, min(int(delay * 1000), 100)), self.refresh_playback)
+        
+    def _on_scrub(self, value):
+        if self.player is not None and int(value) != self.player.position:
+            self.player.seek(int(value))
+            
+    def _on_playback_speed(self, event=None):
+        if self.player is not None:
+            self.player.set_speed(playback_speeds[self.playback_speed_var.get()])
+        
     def refresh_loaded_data(self):
         if self.loaded_data is None:
             return
-        self._display_data(self.loaded_data)
+        #a capture is one still frame, shown again and again at the same time
+        self._display_data(self.loaded_data, 0, 0)
         self.after(100, self.refresh_loaded_data)                
         
     def update_serial_ports(self):
@@ -274,199 +528,498 @@ class IRCamApp(tk.Tk):
     
     def connect(self):
         self.request_disconnect = False
-        port = self.port_var.get()       
-        self.ir_serial_reader = IRSerialReader(port, self.baudrate)
+        self.timer.reset()
+        self.scheduler.reset()
+        self.last_ticks = 0
+        if not self.add_camera():
+            return
         self.port_button.config(text="Disconnect", command=self.disconnect)
-        self.baudrate_dropdown.config(state="disabled")
-        self.port_dropdown.config(state="disabled")
-        self._read_data()
+        self.add_camera_button.config(state="normal")
+        
+        #the readers only set a flag, the Tk main loop polls it, so a busy display never holds up a serial read
+        self.frame_signal.clear()
+        self.frame_poll_after_id = self.after(FRAME_POLL_MS, self._poll_frames)
+        
+        self.status_after_id = self.after(STATUS_INTERVAL_MS, self._update_status)
+        
+    #connect another sensor on the selected port, shown as another tile in the same window
+    def add_camera(self):
+        port = self.port_var.get()
+        if any(camera.port == port for camera in self.cameras):
+            logging.warning("Camera on %s is already connected" % port)
+            return False
+        
+        self.save_camera_settings()
+        camera = Camera(port, self.baudrate_var.get(), self.line_decoder, self.render_settings(), self.filter.noise_threshold, self.filter_kernel_var.get(),
+                        self.sample_rate_var.get(), self.auto_link_var.get(), self.frame_policy,
+                        self.reader_mode, self.alarm_regions, self.alarm_log)
+        camera.reader.frame_callback = self._signal_frame
+        self.cameras.append(camera)
+        self.update_camera_list()
+        self.select_camera(len(self.cameras) - 1)
+        logging.info("Connected camera %d on %s" % (len(self.cameras) - 1, port))
+        return True
         
     def disconnect(self):
         self.request_disconnect = True
-        
-    def _read_data(self):
+        self._close_cameras()
+        cv.destroyAllWindows()
+        self.port_button.config(text="Connect", command=self.connect)
+        self.add_camera_button.config(state="disabled")
+        self.port_dropdown.config(state="readonly")
+        self.status_var.set("Disconnected")
+    
+    def selected_camera(self):
+        if not self.cameras:
+            return None
+        return self.cameras[min(self.selected_camera_index, len(self.cameras) - 1)]
+    
+    def update_camera_list(self):
+        self.camera_dropdown["values"] = ["%d: %s" % (index, camera.port) for index, camera in enumerate(self.cameras)]
+        
+    #keep the settings of the camera being edited before the widgets show another one
+    def save_camera_settings(self):
+        camera = self.selected_camera()
+        if camera is not None:
+            camera.settings = self.render_settings()
+    
+    #show the settings of a camera in the widgets, they then apply to that camera
+    def select_camera(self, index, save=True):
+        if save:
+            self.save_camera_settings()
+        self.selected_camera_index = index
+        camera = self.selected_camera()
+        if camera is None:
+            self.camera_var.set("")
+            return
+        self.camera_var.set(self.camera_dropdown["values"][index])
+        
+        settings = camera.settings
+        self.color_map_var.set(settings.color_map)
+        self.display_interpolation_var.set(settings.display_interpolation)
+        self.colorization_var.set(settings.colorization)
+        self.display_min_temp_autorange_var.set(settings.min_temp_autorange)
+        self.display_max_temp_autorange_var.set(settings.max_temp_autorange)
+        self.display_min_temp_manual_var.set(settings.min_temp_manual)
+        self.display_max_temp_manual_var.set(settings.max_temp_manual)
+        self.display_range_headroom_var.set(settings.display_range_headroom)
+        self.show_scale_ticks_var.set(settings.show_scale_ticks)
+        self.show_contours_var.set(settings.show_contours)
+        self.contour_tolerance_var.set(settings.contour_tolerance)
+        self.show_hotspots_var.set(settings.show_hotspots)
+        self.filter_noise_threshold_var.set(camera.filter.noise_threshold)
+        self.filter_kernel_var.set(camera.filter.kernel_name)
+        self.stat_view_var.set(camera.stat_view)
+        self._show_link(camera)
+        
+    def _on_camera_selected(self, event=None):
+        self.select_camera(self.camera_dropdown.current())
+        
+    #click on a tile to edit the settings of its camera
+    def _on_mouse(self, event, x, y, flags, param):
+        if event != cv.EVENT_LBUTTONDOWN or len(self.cameras) < 2:
+            return
+        columns, rows = tile_grid(len(self.cameras))
+        index = (y * rows // self.display_resolution[1]) * columns + x * columns // self.display_resolution[0]
+        if index < len(self.cameras):
+            self.select_camera(index)
+    
+    def _close_cameras(self):
+        self.stop_recording()
+        while self.cameras:
+            self._close_camera(self.cameras[-1])
+        if self.frame_poll_after_id is not None:
+            self.after_cancel(self.frame_poll_after_id)
+            self.frame_poll_after_id = None
+        if self.render_after_id is not None:
+            self.after_cancel(self.render_after_id)
+            self.render_after_id = None
+        self.pending_cameras = []
+        if self.status_after_id is not None:
+            self.after_cancel(self.status_after_id)
+            self.status_after_id = None
+        
+    def _close_camera(self, camera):
+        if camera.recorder is not None:
+            self._stop_camera_recording(camera)
+        selected = camera is self.selected_camera()
+        index = self.cameras.index(camera)
+        self.cameras.remove(camera)
+        if camera in self.pending_cameras:
+            self.pending_cameras.remove(camera)
+        reader = camera.reader
+        reader.frame_callback = None
+        reader.request_disconnect.set()
+        reader.join()
+        logging.info("Frames from %s: %s" % (camera.port, reader.frames.stats()))
+        logging.info("Counters from %s: %s" % (camera.port, reader.timer.counters))
+        self.update_camera_list()
+        if index < self.selected_camera_index:
+            self.selected_camera_index -= 1
+        self.selected_camera_index = min(self.selected_camera_index, max(len(self.cameras) - 1, 0))
+        #the widgets still show the closed camera, load the next one without keeping them
+        self.select_camera(self.selected_camera_index, save=not selected)
+        
+    #record every frame from every camera to the recordings folder, one file per camera
+    def start_recording(self):
+        if not self.cameras or self.recording():
+            return
+        folderpath = os.path.join(os.getcwd(), "recordings")
+        os.makedirs(folderpath, exist_ok=True)
+        timestamp = time.strftime("%Y%m%d_%H%M%S")
+        for index, camera in enumerate(self.cameras):
+            filepath = os.path.join(folderpath, "ir_cam_%s%s%s" % (timestamp, self.camera_suffix(index), RECORDING_EXTENSION))
+            camera.recorder = FrameRecorder(filepath)
+            camera.reader.frame_listeners.append(camera.recorder.add_frame)
+            logging.info("Recording %s to %s" % (camera.port, filepath))
+        
+    def stop_recording(self):
+        for camera in self.cameras:
+            if camera.recorder is not None:
+                self._stop_camera_recording(camera)
+                
+    def _stop_camera_recording(self, camera):
+        camera.reader.frame_listeners.remove(camera.recorder.add_frame)
+        camera.recorder.stop()
+        logging.info("Recorded %s to %s" % (camera.recorder.stats(), camera.recorder.path))
+        camera.recorder = None
+        
+    def recording(self):
+        return any(camera.recorder is not None for camera in self.cameras)
+        
+    #file name suffix of a camera, none with a single camera so the names stay as they were
+    def camera_suffix(self, index):
+        if len(self.cameras) < 2:
+            return ""
+        return "_cam%d" % index
+        
+    #called from the reader threads, never blocks, the frames arriving before the next poll share one wakeup
+    def _signal_frame(self):
+        self.frame_signal.set()
+        
+    #take the frames signalled since the last poll
+    def _poll_frames(self):
+        self.frame_poll_after_id = None
         if self.request_disconnect:
-            self.ir_serial_reader.stop()
-            self.ir_serial_reader = None
-            cv.destroyAllWindows()
-            self.port_button.config(text="Connect", command=self.connect)
-            self.baudrate_dropdown.config(state="readonly")
-            self.port_dropdown.config(state="readonly")
+            return
+        if self.frame_signal.is_set():
+            self.frame_signal.clear()
+            self._read_data()
+        self.frame_poll_after_id = self.after(FRAME_POLL_MS, self._poll_frames)
+        
+    #filter every new frame of every camera and schedule the display, never waits for a frame
+    #a poll for frames already taken finds nothing and returns
+    def _read_data(self, event=None):
+        if self.request_disconnect or not self.cameras:
             return
         
-        if not self.ir_serial_reader.is_alive():
+        start = time.perf_counter()
+        self._update_filter(self.selected_camera().filter)
+        self.selected_camera().stat_view = self.stat_view_var.get()
+        paused = self.paused_var.get()
+        updated = False
+        for camera in self.cameras:
+            count = camera.update(paused)
+            if count:
+                self.timer.count("frames filtered", count)
+                if camera not in self.pending_cameras:
+                    self.pending_cameras.append(camera)
+                updated = True
+        if not updated:
             return
+        self.timer.lap("filter", start)
         
-        data = self.ir_serial_reader.rx_queue.get(10)
-        if data is not None:
-            self.loaded_data = None
-            self._process_data(data)                    
-
-        self.after(10, self._read_data)
-
-
-    def _process_data(self, data):
-        data = np.array(data, dtype=np.float32)
-        self._display_data(data)
-    
-    
-    def input_pixel_to_output_pixel(self, x, y):
-        #convert input pixel to output pixel
-        #input pixel is 32x24
-        #output pixel is self.display_resolution
-        output_x = int((x+0.5) * self.display_resolution[0] / 32)
-        output_y = int((y+0.5) * self.display_resolution[1] / 24)
-        return output_x, output_y
-
-    def input_pixels_to_output_pixels(self, temp_pos):
-        out_px = (temp_pos + 0.5) * self.display_resolution[1] / 24
-        out_px = np.round(out_px).astype(np.int64)
-        return out_px
-    
-    def get_display_range(self, min_temp, max_temp):
-        display_min_range = self.display_min_temp_manual_var.get()
-        display_max_range = self.display_max_temp_manual_var.get()
-
-        display_range_headroom = self.display_range_headroom_var.get()
-
-        if self.display_min_temp_autorange_var.get():
-            display_min_range = min_temp - display_range_headroom
-
-        if self.display_max_temp_autorange_var.get():
-            display_max_range = max_temp + display_range_headroom
+        self._schedule_render()
+        
+    #draw now if a display tick is due, otherwise once at the next tick
+    def _schedule_render(self):
+        if self.render_after_id is not None:
+            return
+        try:
+            self.scheduler.target_fps = self.display_fps_var.get()
+        except tk.TclError:
+            pass
+        delay = self.scheduler.time_to_next()
+        if delay > 0:
+            self.render_after_id = self.after(max(1, int(delay * 1000)), self._render_tick)
+        else:
+            self._render_tick()
+        
+    #draw the newest frame of every camera that has one
+    def _render_tick(self):
+        self.render_after_id = None
+        updated = self.pending_cameras
+        self.pending_cameras = []
+        if self.request_disconnect or not updated:
+            return
+        
+        tick_start = start = time.perf_counter()
+        self.loaded_data = None
+        self.stop_playback()
+        self.display_resolution = display_resolutions[self.display_resolution_var.get()]
+        
+        self._render_cameras(updated)
+        self._save_bursts()
+        start = self.timer.lap("render", start)
+        
+        rgb = self._compose_tiles()
+        if rgb is None:
+            return
+        skipped = sum(camera.frames_skipped for camera in self.cameras)
+        captures = [(self.camera_suffix(index), camera.rgb, camera.data) for index, camera in enumerate(self.cameras) if camera.rgb is not None]
+        self._show(rgb, self.selected_camera().debug_images, captures, updated, start)
+        self.timer.count("frames skipped", sum(camera.frames_skipped for camera in self.cameras) - skipped)
+        self.scheduler.tick(tick_start, time.perf_counter() - tick_start)
+        
+    #render the cameras with a new frame, and any whose tile no longer fits the grid, on the render pool
+    #the tiles together always fill the display resolution, so the pixels rendered do not grow with the camera count
+    def _render_cameras(self, updated):
+        width, height = self.display_resolution
+        columns, rows = tile_grid(len(self.cameras))
+        tile_size = (width // columns, height // rows)
+        
+        selected = self.selected_camera()
+        selected.settings = self.render_settings()
+        
+        jobs = []
+        rendered_cameras = []
+        for camera in self.cameras:
+            if camera.data is None:
+                continue
+            stale = camera.rgb is None or camera.rgb.shape[1::-1] != tile_size
+            if camera not in updated and not stale:
+                continue
+            jobs.append((camera.data, self._tile_settings(camera, selected, tile_size)))
+            rendered_cameras.append(camera)
+            
+        for camera, (rgb, debug_images) in zip(rendered_cameras, self.render_pool.render(jobs)):
+            camera.rgb = rgb
+            camera.debug_images = debug_images
+            
+    #render settings of a camera's tile, the same for its burst frames
+    def _tile_settings(self, camera, selected, tile_size):
+        settings = camera.settings._replace(show_help=self.show_help and camera is selected, debug=self.debug)
+        if settings.show_hotspots:
+            settings = settings._replace(hotspots=camera.hotspots.overlay())
+        if len(self.cameras) > 1:
+            settings = settings._replace(display_resolution="%dx%d" % tile_size)
+        return settings
+            
+    #render and save the burst frames the cameras took since the last tick, drawn like their tiles
+    def _save_bursts(self):
+        width, height = self.display_resolution
+        columns, rows = tile_grid(len(self.cameras))
+        tile_size = (width // columns, height // rows)
+        selected = self.selected_camera()
+        for index, camera in enumerate(self.cameras):
+            frames = camera.burst_frames
+            if not frames:
+                continue
+            camera.burst_frames = []
+            settings = self._tile_settings(camera, selected, tile_size)
+            images = self.render_pool.render([(data, settings) for number, data in frames])
+            for (number, data), (rgb, debug_images) in zip(frames, images):
+                self.capture_writer.submit(self.capture_folder(), "%s_%03d%s" % (self.burst_basename, number, self.camera_suffix(index)), rgb, data)
+            
+    #one image with the tiles of all cameras, the selected one framed
+    def _compose_tiles(self):
+        if len(self.cameras) == 1:
+            return self.cameras[0].rgb
+        
+        width, height = self.display_resolution
+        columns, rows = tile_grid(len(self.cameras))
+        tile_width, tile_height = width // columns, height // rows
+        if self.mosaic is None or self.mosaic.shape[1::-1] != (width, height):
+            self.mosaic = np.zeros((height, width, 3), dtype=np.uint8)
+        self.mosaic[:] = 0
+        
+        for index, camera in enumerate(self.cameras):
+            if camera.rgb is None:
+                continue
+            row, column = divmod(index, columns)
+            tile = self.mosaic[row * tile_height:(row + 1) * tile_height, column * tile_width:(column + 1) * tile_width]
+            tile[:] = camera.rgb
+            if index == self.selected_camera_index:
+                cv.rectangle(tile, (0, 0), (tile_width - 1, tile_height - 1), (255, 255, 255), 2)
+        return self.mosaic
+        
+    #report the frame rate and latency of every camera, detect a stalled or unplugged sensor
+    def _update_status(self):
+        if not self.cameras:
+            return
+        
+        for camera in list(self.cameras):
+            if not camera.reader.is_alive():
+                logging.error("Serial reader on %s stopped" % camera.port)
+                if len(self.cameras) == 1:
+                    self.disconnect()
+                    self.status_var.set("Connection lost")
+                    return
+                self._close_camera(camera)
+        
+        self._update_link()
+        
+        now = time.perf_counter()
+        statuses = []
+        for camera in self.cameras:
+            stats = camera.reader.frames.stats()
+            frame_rate = (stats["produced"] - camera.last_frames_produced) * 1000 / STATUS_INTERVAL_MS
+            camera.last_frames_produced = stats["produced"]
+            
+            status = None
+            if now - camera.last_frame_time > STALL_TIMEOUT_DEFAULT:
+                status = "No data for %.0f s" % (now - camera.last_frame_time)
+            elif len(camera.latencies):
+                latencies = np.array(camera.latencies) * 1000
+                status = "%.1f fps, latency %.0f ms (max %.0f ms), dropped %d" % (frame_rate, np.mean(latencies), np.max(latencies), stats["dropped"])
+                if camera.recorder is not None:
+                    status += ", REC %d frames" % camera.recorder.frames_written
+            if status is not None and camera.frames_skipped:
+                status += ", skipped %d" % camera.frames_skipped
+            partial = camera.reader.timer.counters.get("frames partial", 0)
+            if status is not None and partial:
+                status += ", partial %d" % partial
+            alarms = camera.alarms.active_names()
+            if status is not None and alarms:
+                status += ", ALARM %s" % ", ".join(alarms)
+            if status is not None and camera.link.message:
+                status += ", %s" % camera.link.message
+            if status is not None and len(self.cameras) > 1:
+                status = "%s: %s" % (camera.port, status)
+            if status is not None:
+                statuses.append(status)
+                
+        #display rate, lower than the limit when drawing can not keep up
+        display_rate = (self.scheduler.ticks - self.last_ticks) * 1000 / STATUS_INTERVAL_MS
+        self.last_ticks = self.scheduler.ticks
+        statuses.append("display %.1f fps (limit %.0f fps)" % (display_rate, self.scheduler.fps()))
         
-        display_range = display_max_range - display_min_range
-        return display_range, display_min_range, display_max_range
+        if statuses:
+            self.status_var.set("\n".join(statuses))
+        
+        self.status_after_id = self.after(STATUS_INTERVAL_MS, self._update_status)
+
 
+    #send changed link settings to the selected camera, let every camera tune its link
+    def _update_link(self):
+        selected = self.selected_camera()
+        try:
+            selected.link.set(self.sample_rate_var.get(), self.baudrate_var.get(), self.auto_link_var.get())
+        except (tk.TclError, KeyError):
+            pass
+        for camera in self.cameras:
+            if camera.link.check() and camera is selected:
+                self._show_link(camera)
+        #the baudrate the tuner picked for the sample rate
+        self._show_link(selected)
     
-    def normalize_temperature_data(self, data, min_temp, max_temp):
-        normalized = (data - min_temp) / (max_temp - min_temp)
-        return normalized
+    def _show_link(self, camera):
+        self.baudrate_var.set(camera.link.baudrate)
+        self.sample_rate_var.set(camera.link.sample_rate)
+        self.auto_link_var.set(camera.link.auto)
     
-    def temperature_to_scale_normalized(self, normalized_temp, display_range, display_max_range):
-        normalized_scale = display_range / 23
-        display_scale_temp = (display_max_range - normalized_temp) / normalized_scale
-        return display_scale_temp
+    def capture_folder(self):
+        return os.path.join(os.getcwd(), "capture")
     
-    def draw_hotspot(self, position, rgb, fg=(255, 255, 255), bg=(0, 0, 0)):
-        xres = rgb.shape[1]
-        circle_size = int(xres*0.005) + 4
-        cv.circle(rgb, position, circle_size, bg, 4)
-        cv.circle(rgb, position, circle_size, fg, 2)
+    #log the captures the writer has finished since the last frame
+    def report_captures(self):
+        for basename, error in self.capture_writer.poll_results():
+            if error is None:
+                logging.info("Captured %s" % basename)
+            else:
+                logging.error("Error capturing %s: %s" % (basename, error))
     
-    def _display_data(self, data):
+    #write the stage timings to the capture folder for offline analysis
+    def export_stats(self):
+        folderpath = self.capture_folder()
+        os.makedirs(folderpath, exist_ok=True)
+        filepath = os.path.join(folderpath, "ir_cam_timing_%s.json" % time.strftime("%Y%m%d_%H%M%S"))
+        extra = {"render_settings": self.render_settings()._asdict(), "cameras": []}
+        for camera in self.cameras:
+            extra["cameras"].append({
+                "port": camera.port,
+                "frames": camera.reader.frames.stats(),
+                "summary": camera.reader.timer.summary(),
+                "counters": dict(camera.reader.timer.counters),
+            })
         try:
-            data = data.reshape(24, 32)            
+            self.timer.export(filepath, extra)
+            logging.info("Saved stage timing to %s" % filepath)
         except Exception as e:
-            logging.warning("Error reshaping data: %s" % e)
-            return
-
+            logging.error("Error saving stage timing: %s" % e)
+            
+    #apply the filter widgets to the filter of the selected camera or of the loaded data
+    def _update_filter(self, temperature_filter):
+        temperature_filter.set_kernel(self.filter_kernel_var.get())
         try:
             noise_threshold = self.filter_noise_threshold_var.get()
             if noise_threshold > 0 and noise_threshold < 1000:
-                self.filter.noise_threshold = noise_threshold
+                temperature_filter.noise_threshold = noise_threshold
         except:
             pass
+    
+    #show loaded captures and recordings, always full window
+    #timestamp is the recorded time of the frame, the hotspots are tracked on it so playback speed and seeking do not matter
+    #sequence is the frame number, a burst saves each frame once
+    def _display_data(self, data, timestamp, sequence):
+        start = time.perf_counter()
+        try:
+            data = data.reshape(24, 32)            
+        except Exception as e:
+            logging.warning("Error reshaping data: %s" % e)
+            return
+
+        self._update_filter(self.filter)
         
         #filter new data for every frame, even when paused
-        data = self.filter.filter(data)
+        filtered = self.filter.filter(data)
+        if not self.paused_var.get():
+            self.hotspots.update(timestamp, filtered)
+        start = self.timer.lap("filter", start)
         
         #update display resolution
         display_resolution_var = self.display_resolution_var.get()
         self.display_resolution = display_resolutions[display_resolution_var]
                 
-        #reverse the x axis
-        data = np.fliplr(data)
-        
-        if self.paused_var.get():
-            data = self.last_data
-        
-        self.last_data = data
-        
-        min_temp = np.min(data)
-        max_temp = np.max(data)
-        
-        display_range, display_min_range, display_max_range = self.get_display_range(min_temp, max_temp)
-        
-        normalized = self.normalize_temperature_data(data, display_min_range, display_max_range)
-
-        #limit the range to 0-1
-        normalized = np.clip(normalized, 0, 1)        
-        
-        #convert array to CV_8UC1
-        cv_normalized = np.array(normalized * 255, dtype=np.uint8)
-        
-        color_map_str = self.color_map_var.get()
-        color_map = color_maps[color_map_str]
-        rgb = cv.applyColorMap(cv_normalized, color_map)
-        
-        #rescale the image to self.display_resolution_var
-        display_interpolation = display_interpolations[self.display_interpolation_var.get()]
-        rgb = cv.resize(rgb, self.display_resolution, interpolation=display_interpolation)
-
-        #find index of min and max temp
-        min_index = np.unravel_index(np.argmin(data), data.shape)
-        max_index = np.unravel_index(np.argmax(data), data.shape)
-
-        #swapaxis on the index
-        min_index = min_index[::-1]
-        max_index = max_index[::-1]
-        
-        min_pixel_position = self.input_pixel_to_output_pixel(*min_index)
-        max_pixel_position = self.input_pixel_to_output_pixel(*max_index)
-
-        #Make temperature scale
-        temp_scale_width_px = int(20 * self.display_resolution[0] / 640)
-        temp_scale_size = (temp_scale_width_px, self.display_resolution[1])
-        temp_scale = self.make_temp_scale(color_map, display_interpolation, temp_scale_size)
-                
-        #add the temperature scale to the left side of the image
-        rgb[:, :temp_scale_width_px] = temp_scale
-        
-        min_temp_normalized_pos = self.temperature_to_scale_normalized(min_temp, display_range, display_max_range)
-        max_temp_normalized_pos = self.temperature_to_scale_normalized(max_temp, display_range, display_max_range)
-        
-        min_temp_position = self.input_pixel_to_output_pixel(x=0, y=min_temp_normalized_pos)
-        max_temp_position = self.input_pixel_to_output_pixel(x=0, y=max_temp_normalized_pos)
-        
-        #print min and max temp
-        text_size = 0.5
-        text_y_offset = 5
-        text_xpos = temp_scale_width_px+10
-        
-        if self.show_scale_ticks_var.get():
-            self.draw_ticks(rgb, display_min_range, display_max_range, temp_scale_width_px, text_xpos, text_y_offset, text_size)
-
-        self.draw_hotspot(min_temp_position, rgb, fg=(0, 0, 0), bg=(255, 255, 255))
-        self.draw_hotspot(max_temp_position, rgb, fg=(255, 255, 255), bg=(0, 0, 0))
-
-        cv.putText(rgb, "%.1f" % max_temp, (text_xpos, max_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
-        cv.putText(rgb, "%.1f" % max_temp, (text_xpos, max_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)
-
-        cv.putText(rgb, "%.1f" % min_temp, (text_xpos, min_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
-        cv.putText(rgb, "%.1f" % min_temp, (text_xpos, min_temp_position[1]+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)
-
-        
-        if self.show_help:
-            #draw help table on the image
-            help_x = 150
-            help_y = 20
-            help_line_height = 20
-            for line in help_table:
-                cv.putText(rgb, line[0], (help_x, help_y), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-                cv.putText(rgb, line[1], (help_x + 100, help_y), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
-                help_y += help_line_height     
-        
-
-        #draw min and max pixel circles on the image
-        self.draw_hotspot(min_pixel_position, rgb, fg=(0, 0, 0), bg=(255, 255, 255))
-        self.draw_hotspot(max_pixel_position, rgb, fg=(255, 255, 255), bg=(0, 0, 0))
-
-                        
-        if self.show_contours_var.get():
-            self.draw_contours(data, max_temp, min_temp, max_pixel_position, min_pixel_position, rgb)
-        
-        if not self.debug:
+        #reverse the x axis, copied as the filter reuses its buffer
+        if not self.paused_var.get():
+            np.copyto(self.last_data, np.fliplr(filtered))
+        
+        data = self.last_data
+        
+        settings = self.render_settings()
+        if settings.show_hotspots:
+            settings = settings._replace(hotspots=self.hotspots.overlay())
+        rgb, debug_images = self.render_pool.render([(data, settings)])[0]
+        start = self.timer.lap("render", start)
+        
+        self._show(rgb, debug_images, [("", rgb, data)], [], start)
+        
+        #nothing new to save while paused or when the same frame is shown again
+        if self.burst_remaining > 0 and not self.paused_var.get() and sequence != self.burst_sequence:
+            self.capture_writer.submit(self.capture_folder(), "%s_%03d" % (self.burst_basename, self.burst_index), rgb, data.copy())
+            self.burst_index += 1
+            self.burst_remaining -= 1
+            self.burst_sequence = sequence
+        
+    #show the image, take captures and handle the display keys
+    #captures are (file name suffix, image, data) for every camera, the data is copied as its buffer is reused
+    def _show(self, rgb, debug_images, captures, shown_cameras, start):
+        if self.debug:
+            #stage timings, the percentiles are worked out again every status interval
+            if self.stats_rows is None or start - self.stats_time > STATUS_INTERVAL_MS / 1000:
+                self.stats_rows = self.timer.table()
+                camera = self.selected_camera()
+                if camera is not None:
+                    self.stats_rows += camera.reader.timer.table()[1:]
+                    self.stats_rows += camera.hotspots.table()
+                self.stats_time = start
+            self.render_pool.renderer.draw_stats(rgb, self.stats_rows)
+            
+            #show the high and low temperature pixels
+            for name, image in debug_images.items():
+                cv.imshow(name, image)
+        else:
             try:
                 cv.destroyWindow("High Temperatures")
             except:
@@ -475,19 +1028,23 @@ class IRCamApp(tk.Tk):
                 cv.destroyWindow("Low Temperatures")
             except:
                 pass
-
-        #If not in help mode show the help hint at the bottom
-        if not self.show_help:
-            cv.putText(rgb, "H for help", (self.display_resolution[0]-100, self.display_resolution[1] - 10), cv.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 0), 2)
             
-        #If debugging then show it at the bottom
-        if self.debug:
-            cv.putText(rgb, "Debug mode", (self.display_resolution[0]-100, self.display_resolution[1] - 30), cv.FONT_HERSHEY_SIMPLEX, 0.5, (255, 0, 255), 2)
-            
-        
         #Use cv to show the image
         cv.imshow("IR Camera", rgb)
-        key = cv.waitKey(50)
+        if len(self.cameras) > 1:
+            cv.setMouseCallback("IR Camera", self._on_mouse)
+        start = self.timer.lap("imshow", start)
+        self.timer.count("frames rendered")
+        
+        #frame to screen latency, from the frame being published by the reader to it being shown
+        for camera in shown_cameras:
+            camera.shown()
+        
+        self.report_captures()
+        
+        #only poll the keys, the scheduler paces the display
+        key = cv.waitKey(1)
+        self.timer.lap("waitKey", start)
         
         #capitalize the key
         
@@ -496,17 +1053,24 @@ class IRCamApp(tk.Tk):
             #close the app
             self.on_closing()
         elif key == ord("c") or key == ord("C"):
-            #capture the image to the capture folder with timestamp
-            folderpath = os.path.join(os.getcwd(), "capture")
-            os.makedirs(folderpath, exist_ok=True)
+            #capture the image and data to the capture folder with timestamp, written in the background
             timestamp = time.strftime("%Y%m%d_%H%M%S")
-            filename = "ir_cam_%s.png" % timestamp
-            filepath = os.path.join(folderpath, filename)
-            cv.imwrite(filepath, rgb)
-            #write the data to a csv file in the same folder
-            data_filename = "ir_cam_%s.csv" % timestamp
-            data_filepath = os.path.join(folderpath, data_filename)
-            np.savetxt(data_filepath, data, delimiter=",", fmt="%.2f")
+            for suffix, capture_rgb, capture_data in captures:
+                self.capture_writer.submit(self.capture_folder(), "ir_cam_%s%s" % (timestamp, suffix), capture_rgb, capture_data.copy())
+        elif key == ord("v") or key == ord("V"):
+            #capture the next frames as a burst
+            try:
+                count = max(int(self.capture_burst_var.get()), 0)
+            except (tk.TclError, ValueError):
+                count = CAPTURE_BURST_DEFAULT
+            self.burst_basename = "ir_cam_%s" % time.strftime("%Y%m%d_%H%M%S")
+            self.burst_index = 0
+            self.burst_sequence = None
+            if self.cameras:
+                for camera in self.cameras:
+                    camera.start_burst(count)
+            else:
+                self.burst_remaining = count
         elif key == ord("p") or key == ord(" ") or key == ord("P"):
             #pause the display
             self.paused_var.set(not self.paused_var.get())
@@ -529,127 +1093,75 @@ class IRCamApp(tk.Tk):
             self.show_help = not self.show_help
         elif key == ord("b") or key == ord("B"):
             self.debug = not self.debug
+        elif key == ord("s") or key == ord("S"):
+            self.export_stats()
+        elif key == ord("o") or key == ord("O"):
+            self.show_hotspots_var.set(not self.show_hotspots_var.get())
         elif key == ord("k") or key == ord("K"):
             self.show_scale_ticks_var.set(not self.show_scale_ticks_var.get())
+        elif key == ord("r") or key == ord("R"):
+            #start or stop recording the session
+            if not self.recording():
+                self.start_recording()
+            else:
+                self.stop_recording()
+        elif key == ord("n") or key == ord("N"):
+            #edit the settings of the next camera
+            if self.cameras:
+                self.select_camera((self.selected_camera_index + 1) % len(self.cameras))
         
 
-    def make_temp_scale(self, color_map, display_interpolation, temp_scale_size):
-        #make the a color temperature scale from 255 to 0
-        temp_scale = np.linspace(start=255, stop=0, num=24).T
-        
-        #convert the scale to CV_8UC1
-        temp_scale = np.array(temp_scale, dtype=np.uint8)
-        
-        #rescale the temperature scale to the display resolution
-        temp_scale = cv.resize(temp_scale, (temp_scale_size[0], temp_scale_size[1]), interpolation=display_interpolation)
-        
-        #convert the temperature scale to a color map
-        temp_scale = cv.applyColorMap(temp_scale, color_map)
-
-        return temp_scale
-    
-    
-    def draw_contours(self, data, max_temp, min_temp, max_pixel_position, min_pixel_position, rgb):
-        temp_range = max_temp - min_temp
-        
-        contour_tolerance = self.contour_tolerance_var.get()
-        contour_tolerance = np.clip(contour_tolerance, 0, 100)
-        contour_tolerance *= 0.01
-        
-        #data with temperature above 90% of the range
-        high_temperatures = data > (max_temp - contour_tolerance * temp_range)
-        
-        #data with temperature below 10% of the range
-        low_temperatures = data < (min_temp + contour_tolerance * temp_range)
-        
-        #convert the data to CV_8UC1
-        high_temperatures = np.array(high_temperatures * 255, dtype=np.uint8)
-        low_temperatures = np.array(low_temperatures * 255, dtype=np.uint8)
-        
-        #scale the high and low temperature pixels to the display resolution
-        display_interpolation = display_interpolations[self.display_interpolation_var.get()]
-        high_temperatures = cv.resize(high_temperatures, self.display_resolution, interpolation=display_interpolation)
-        low_temperatures = cv.resize(low_temperatures, self.display_resolution, interpolation=display_interpolation)
-
-        blur_size = int(self.display_resolution[0] * 0.02)
-        if blur_size % 2 == 0:
-            blur_size += 1
-
-        #gaussian blur the high and low temperature pixels
-        high_temperatures = cv.GaussianBlur(high_temperatures, (blur_size, blur_size), 0)
-        low_temperatures = cv.GaussianBlur(low_temperatures, (blur_size, blur_size), 0)
-                                
-        #make contours of the high and low temperature pixels
-        high_contours, _ = cv.findContours(high_temperatures, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
-        low_contours, _ = cv.findContours(low_temperatures, cv.RETR_EXTERNAL, cv.CHAIN_APPROX_SIMPLE)
-
-        #choose contours containing the max and min pixel
-        high_contours = [c for c in high_contours if cv.pointPolygonTest(c, max_pixel_position, False) >= 0]
-        low_contours = [c for c in low_contours if cv.pointPolygonTest(c, min_pixel_position, False) >= 0]
-        
-        #draw the contours on the image
-        cv.drawContours(rgb, high_contours, -1, (255, 255, 255), 2)
-        cv.drawContours(rgb, low_contours, -1, (0, 0, 0), 2)
-        
-        if self.debug:
-            #show the high and low temperature pixels
-            cv.imshow("High Temperatures", high_temperatures)
-            cv.imshow("Low Temperatures", low_temperatures)
-
-    def draw_ticks(self, rgb, display_min_range, display_max_range, temp_scale_width_px, text_xpos, text_y_offset, text_size):
-        display_range = display_max_range - display_min_range
-        
-        #Find the nearest decade to the temperatue range
-        decade = 5 ** int(np.log(display_range)/np.log(5))
-        
-        #Floor the min display range to the nearest decade
-        display_min_tick = np.floor(display_min_range / decade) * decade
-        
-        #Ceil the max display range to the nearest decade
-        display_max_tick = np.ceil(display_max_range / decade) * decade
-
-        #make a range of ticks from min to max with decade spacing
-        num_ticks = int((display_max_tick - display_min_tick) / decade)
-        tick_temperatures = np.linspace(display_min_tick, display_max_tick, num_ticks+1)
-            
-        #Find the tick temperature locations normalized to the temperature input scale 0-1
-#            tick_temperatures_normalized = self.normalize_temperature_data(tick_temperatures, display_min_range, display_max_range)
-                    
-        # Convert temperature input scale to display output scale
-        tick_scale_positions = self.temperature_to_scale_normalized(tick_temperatures, display_range, display_max_range)
-
-        #Convert the display scale positions to pixel positions
-        # tick_scale_positions = [self.input_pixel_to_output_pixel(x=0, y=pos) for pos in tick_scale_positions]
-        tick_positions_px = self.input_pixels_to_output_pixels(tick_scale_positions)
-        
-        if decade < 1:
-            format = "%.1f"
-        else:
-            format = "%.0f"
-        
-        #Draw the ticks on the image
-        for tick_position, tick_temperature in zip(tick_positions_px, tick_temperatures):
-            cv.line(rgb, (0, tick_position), (temp_scale_width_px, tick_position), (255, 255, 255), 3)
-            cv.putText(rgb, format % tick_temperature, (text_xpos+10, tick_position+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (255, 255, 255), 3)
-            cv.putText(rgb, format % tick_temperature, (text_xpos+10, tick_position+text_y_offset), cv.FONT_HERSHEY_SIMPLEX, text_size, (0, 0, 0), 2)            
-            
 def main():
     config = configparser.ConfigParser()
     #add config for last used port
     config.add_section("Serial")
     config.set("Serial", "port", "")
+    config.set("Serial", "line_decoder", LINE_DECODER_DEFAULT)
+    config.set("Serial", "frame_policy", FRAME_POLICY_DEFAULT)
+    config.set("Serial", "reader", READER_MODE_DEFAULT)
+    config.set("Serial", "baudrate", str(BAUDRATE_DEFAULT))
+    config.set("Serial", "sample_rate", SAMPLE_RATE_DEFAULT)
+    config.set("Serial", "auto_baudrate", str(AUTO_LINK_DEFAULT))
     config.add_section("Display")
     config.set("Display", "color_map", "Jet")
+    config.set("Display", "display_fps", str(DISPLAY_FPS_DEFAULT))
+    config.set("Display", "range_quantum", str(DISPLAY_RANGE_QUANTUM_DEFAULT))
     
     config.read("ir_cam.ini")
     port = config.get("Serial", "port")
     color_map = config.get("Display", "color_map")
+    line_decoder = config.get("Serial", "line_decoder")
+    frame_policy = config.get("Serial", "frame_policy")
+    reader_mode = config.get("Serial", "reader")
+    display_fps = config.getint("Display", "display_fps")
+    range_quantum = config.getfloat("Display", "range_quantum")
+    baudrate = config.getint("Serial", "baudrate")
+    sample_rate = config.get("Serial", "sample_rate")
+    auto_link = config.getboolean("Serial", "auto_baudrate")
+    if sample_rate not in sample_rates:
+        logging.warning("Unknown sample rate %s, using %s" % (sample_rate, SAMPLE_RATE_DEFAULT))
+        sample_rate = SAMPLE_RATE_DEFAULT
+    if line_decoder not in line_decoders:
+        logging.warning("Unknown line decoder %s, using %s" % (line_decoder, LINE_DECODER_DEFAULT))
+        line_decoder = LINE_DECODER_DEFAULT
+    if frame_policy not in frame_policies:
+        logging.warning("Unknown frame policy %s, using %s" % (frame_policy, FRAME_POLICY_DEFAULT))
+        frame_policy = FRAME_POLICY_DEFAULT
+    if reader_mode not in reader_modes:
+        logging.warning("Unknown reader %s, using %s" % (reader_mode, READER_MODE_DEFAULT))
+        reader_mode = READER_MODE_DEFAULT
     
-    app = IRCamApp(port=port, color_map=color_map)    
+    app = IRCamApp(port=port, color_map=color_map, line_decoder=line_decoder, display_fps=display_fps,
+                   baudrate=baudrate, sample_rate=sample_rate, auto_link=auto_link, frame_policy=frame_policy,
+                   reader_mode=reader_mode, range_quantum=range_quantum)
     app.mainloop()
     
     config.set("Serial", "port", app.port_var.get())
     config.set("Display", "color_map", app.color_map_var.get())
+    config.set("Display", "display_fps", str(app.display_fps_var.get()))
+    config.set("Serial", "baudrate", str(app.baudrate_var.get()))
+    config.set("Serial", "sample_rate", app.sample_rate_var.get())
+    config.set("Serial", "auto_baudrate", str(app.auto_link_var.get()))
     
     with open("ir_cam.ini", "w") as f:
         config.write(f)
@@ -1,85 +1,148 @@
 import serial
 from threading import Thread, Event
-from queue import Queue
-import msgpack
-import serial
+from queue import Queue, Empty
 import numpy as np
 import logging
+import time
+
+from line_decoder import BatchLineDecoder, MsgpackLineDecoder, LINES_PER_FRAME, PIXELS_PER_LINE
+from frame_assembler import FrameAssembler
+from frame_ring import FrameRing
+from stage_timer import StageTimer
+from link_control import command_packet
+from constants import BAUDRATE_SWITCH_DELAY, FRAME_POLICY_DEFAULT
 
 class IRSerialReader(Thread):
-    def __init__(self, port, baudrate):
+    def __init__(self, port, baudrate, decoder="msgpack", ring_capacity=4, timer=None, frame_policy=FRAME_POLICY_DEFAULT, frames=None):
         Thread.__init__(self)
         self.port = port
         self.baudrate = baudrate
+        self.decoder = decoder
         self.request_disconnect = Event()
-        self.unpacker = msgpack.Unpacker()
-        self.frame_counter = 0
-        self.line_counter = -1
-        self.frame = np.zeros((24, 32), dtype=np.float32)
+        if decoder == "batch":
+            self.line_decoder = BatchLineDecoder()
+        else:
+            self.line_decoder = MsgpackLineDecoder()
+        #decoder counters already added to the timer
+        self.resyncs = 0
+        self.bytes_discarded = 0
+        self.frame_callback = None
+        self.frame_listeners = []
         self.ser = None
-        self.data = None
-        self.rx_queue = Queue(2)
+        #why the reader stopped, None while it runs or after a normal stop
+        self.error = None
+        #control commands to the sensor, written by the reader thread between reads
+        self.commands = Queue()
+        #the ring can be given, e.g. a SharedFrameRing when the reader runs in its own process
+        self.frames = frames if frames is not None else FrameRing(ring_capacity, shape=(LINES_PER_FRAME, PIXELS_PER_LINE))
+        #the read and decode stages, and the line and frame counters
+        self.timer = timer if timer is not None else StageTimer()
+        self.assembler = FrameAssembler(self._emit_frame, frame_policy, timer=self.timer)
         
         self.start()
         
     def run(self):
         try:
-            self.ser = serial.Serial(self.port, self.baudrate, timeout=0.1, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS)
+            self.ser = serial.serial_for_url(self.port, self.baudrate, timeout=0.1, parity=serial.PARITY_NONE, stopbits=serial.STOPBITS_ONE, bytesize=serial.EIGHTBITS)
         except Exception as e:
             logging.error("Error connecting: %s" % e)
+            self.error = "Error connecting: %s" % e
             return
         
         self.ser.flushInput()
         
         while not self.request_disconnect.is_set():
+            if not self.commands.empty():
+                self._send_commands()
+
             try:
-                str_data = self.ser.read(1000)
+                read_size = 1000
+                if self.decoder == "batch":
+                    #take everything already waiting so the decoder works on whole chunks
+                    read_size = max(read_size, self.ser.in_waiting)
+                start = time.perf_counter()
+                str_data = self.ser.read(read_size)
+                start = self.timer.lap("read", start)
+                self.timer.count("bytes read", len(str_data))
+            except serial.SerialException as e:
+                #the port is gone, e.g. the sensor was unplugged
+                logging.error("Error reading data: %s" % e)
+                self.error = "Error reading data: %s" % e
+                break
             except Exception as e:
                 logging.error("Error reading data: %s" % e)
                 continue
 
             try:
-                self.unpacker.feed(str_data)
+                frame_counts, line_counts, pixels = self.line_decoder.feed(str_data)
+                self._count_resyncs()
+                self.assembler.add(frame_counts, line_counts, pixels)
             except Exception as e:
-                logging.warning("Error feeding data: %s" % e)
-                continue
+                #drop the chunk and start again at the next line, one bad chunk must not stop the camera
+                logging.error("Error decoding data: %s" % e)
+                self.timer.count("decode errors")
+                self.line_decoder.reset()
+            self.timer.lap("decode", start)
 
-            unpacked = None
-            try:
-                while(1):
-                    unpacked = self.unpacker.unpack()
-                    frame_count = unpacked[0]
-                    line_count = unpacked[1]
-                    temperature_line = np.array(unpacked[2:], dtype=np.float32)
-                    temperature_line *= 0.01
-                    self.frame[line_count] = temperature_line
+        self.ser.close()
 
-                    if line_count != self.line_counter + 1:
-                        logging.warning("Missing line: %d of frame %d" % (line_count, self.frame_counter) )
+    #count the garbage the line decoder skipped since the last read
+    def _count_resyncs(self):
+        resyncs = self.line_decoder.resyncs - self.resyncs
+        discarded = self.line_decoder.bytes_discarded - self.bytes_discarded
+        if resyncs:
+            self.timer.count("resyncs", resyncs)
+            logging.warning("Resynced %d times, %d bytes discarded" % (resyncs, discarded))
+        if discarded:
+            self.timer.count("bytes discarded", discarded)
+        self.resyncs = self.line_decoder.resyncs
+        self.bytes_discarded = self.line_decoder.bytes_discarded
 
-                    self.line_counter = line_count
+    #called by the assembler with every frame that passes the frame policy
+    def _emit_frame(self, frame_count, raw, mask):
+        frame = self.frames.write_slot()
+        np.multiply(raw, 0.01, out=frame)
+        sequence = self.frames.publish(mask=mask)
+        self._frame_ready(sequence, frame)
 
-                    if line_count == 23:
-                        self.data = self.frame.flatten()
-                        self.frame_counter = frame_count + 1
-                        self.line_counter = -1
-                        self.rx_queue.put_nowait(self.data)
-                        break
-                    # elif frame_count != self.frame_counter:
-                    #     self.frame_counter = frame_count
-                    #     self.line_counter = line_count
-                    #     self.data = self.frame.flatten()
-                    #     self.rx_queue.put_nowait(self.data)
-                    #     break                
+    #signal the consumer that a new frame is in the ring, called from the reader thread
+    #listeners get every frame and must copy it before returning, the buffer is reused
+    def _frame_ready(self, sequence, frame):
+        for listener in list(self.frame_listeners):
+            listener(sequence, frame)
 
-                    self.frame_counter = frame_count
+        frame_callback = self.frame_callback
+        if frame_callback is not None and not self.request_disconnect.is_set():
+            frame_callback()
 
+    #queue a control command for the sensor, see link_control.py
+    def send_command(self, name, value):
+        self.commands.put((name, value))
+
+    #switch the sensor and then the port to another baudrate
+    def set_baudrate(self, baudrate):
+        self.commands.put(("baud", baudrate))
+
+    def _send_commands(self):
+        while True:
+            try:
+                name, value = self.commands.get_nowait()
+            except Empty:
+                return
+            try:
+                self.ser.write(command_packet(name, value))
+                self.ser.flush()
+                if name == "baud":
+                    #give the sensor time to switch, the bytes sent meanwhile are lost either way
+                    time.sleep(BAUDRATE_SWITCH_DELAY)
+                    self.ser.baudrate = value
+                    self.baudrate = value
+                    self.ser.reset_input_buffer()
+                    self.line_decoder.reset()
+                    self.assembler.reset()
             except Exception as e:
-                # logging.warning("Error unpacking data: %s" % e)
-                pass
+                logging.error("Error sending %s %s: %s" % (name, value, e))
 
-        self.ser.close()
-        
     def stop(self):
         self.request_disconnect.set()
         self.join()
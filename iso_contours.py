@@ -0,0 +1,99 @@
+import numpy as np
+import cv2 as cv
+
+#marching squares, the corners of a cell are numbered 1 top left, 2 top right, 4 bottom right, 8 bottom left
+#and its edges 0 top, 1 right, 2 bottom, 3 left
+#segments for every corner case as pairs of edges, the saddle cases 5 and 10 are resolved with the cell center
+segment_edges = {
+    1: [(3, 0)],
+    2: [(0, 1)],
+    3: [(3, 1)],
+    4: [(1, 2)],
+    6: [(0, 2)],
+    7: [(3, 2)],
+    8: [(3, 2)],
+    9: [(0, 2)],
+    11: [(1, 2)],
+    12: [(3, 1)],
+    13: [(0, 1)],
+    14: [(3, 0)],
+}
+#saddle cases with the center inside join the inside corners, otherwise they are cut off
+saddle_edges = {
+    (5, True): [(0, 1), (3, 2)],
+    (5, False): [(3, 0), (1, 2)],
+    (10, True): [(3, 0), (1, 2)],
+    (10, False): [(0, 1), (3, 2)],
+}
+
+#up to two segments for every case and center, -1 for none, indexed by case * 2 + center inside
+segment_table = np.full((32, 2, 2), -1, dtype=np.int64)
+for cell_case, edges in segment_edges.items():
+    segment_table[cell_case * 2, 0] = edges[0]
+    segment_table[cell_case * 2 + 1, 0] = edges[0]
+for (cell_case, center), edges in saddle_edges.items():
+    segment_table[cell_case * 2 + center, :] = edges
+
+
+#line segments where a small grid crosses the level, as an (n, 2, 2) array of (x, y) points in grid coordinates
+#the crossing points are interpolated linearly along the cell edges
+def iso_segments(field, level):
+    inside = field > level
+    case = (inside[:-1, :-1] * 1) | (inside[:-1, 1:] * 2) | (inside[1:, 1:] * 4) | (inside[1:, :-1] * 8)
+    rows, cols = np.nonzero((case != 0) & (case != 15))
+    if rows.size == 0:
+        return np.zeros((0, 2, 2), dtype=np.float32)
+
+    top_left = field[rows, cols]
+    top_right = field[rows, cols + 1]
+    bottom_right = field[rows + 1, cols + 1]
+    bottom_left = field[rows + 1, cols]
+    case = case[rows, cols]
+
+    #crossing point on every edge of the cells, only the crossed edges are used
+    with np.errstate(divide="ignore", invalid="ignore"):
+        points = np.empty((rows.size, 4, 2), dtype=np.float32)
+        points[:, 0, 0] = cols + (level - top_left) / (top_right - top_left)
+        points[:, 0, 1] = rows
+        points[:, 1, 0] = cols + 1
+        points[:, 1, 1] = rows + (level - top_right) / (bottom_right - top_right)
+        points[:, 2, 0] = cols + (level - bottom_left) / (bottom_right - bottom_left)
+        points[:, 2, 1] = rows + 1
+        points[:, 3, 0] = cols
+        points[:, 3, 1] = rows + (level - top_left) / (bottom_left - top_left)
+
+    center_inside = (top_left + top_right + bottom_right + bottom_left) / 4 > level
+
+    #first and second segment of every cell, looked up by case and center
+    key = case * 2 + center_inside
+    first = segment_table[key, 0]
+    second = segment_table[key, 1]
+    has_second = np.flatnonzero(second[:, 0] >= 0)
+    cells = np.concatenate([np.arange(rows.size), has_second])
+    edges = np.concatenate([first, second[has_second]])
+
+    segments = np.empty((cells.size, 2, 2), dtype=np.float32)
+    segments[:, 0] = points[cells, edges[:, 0]]
+    segments[:, 1] = points[cells, edges[:, 1]]
+    return segments
+
+
+#smooth outline of a region of a sensor frame, in sensor pixel coordinates
+#the mask is upsampled and blurred a little to round the corners, then cut at a level below one half
+#so the outline sits just outside the pixels of the region, like the blurred mask it replaces
+#a ring of zeros around the smoothed mask closes the outline along the frame edges
+#returns the segments and the smoothed mask
+def region_outline(mask, upsample=4, sigma=0.35, level=0.15):
+    size = (mask.shape[1] * upsample, mask.shape[0] * upsample)
+    smoothed = cv.resize(mask.astype(np.float32), size, interpolation=cv.INTER_LINEAR)
+    smoothed = cv.GaussianBlur(smoothed, (0, 0), sigma * upsample, borderType=cv.BORDER_REPLICATE)
+    padded = np.zeros((size[1] + 2, size[0] + 2), dtype=np.float32)
+    padded[1:-1, 1:-1] = smoothed
+
+    segments = iso_segments(padded, level)
+
+    #from upsampled pixels back to sensor pixels, without the padding
+    segments -= 0.5
+    segments /= upsample
+    segments -= 0.5
+    return segments, smoothed
@@ -0,0 +1,282 @@
+import numpy as np
+import msgpack
+
+#Each line packet from the sensor is a msgpack array of 34 ints:
+#[frame count, line count, x0 , x1, x2, ...., x31]
+#34 elements is encoded as an array16 header
+LINE_HEADER = b"\xdc\x00\x22"
+PIXELS_PER_LINE = 32
+LINES_PER_FRAME = 24
+#no line packet is longer, an unpacker waiting for more is stuck in a corrupt length
+MAX_LINE_PACKET_BYTES = 3 + 9 + 9 + PIXELS_PER_LINE * 9
+
+#every pixel is a 16 bit value with a one byte type tag in front of it
+INT16_TAG = 0xd1
+UINT16_TAG = 0xcd
+
+#msgpack type tags the frame count may use and the size of the value following the tag
+#a positive fixint carries its value in the tag itself
+frame_count_tags = {0xcc: 1, 0xcd: 2, 0xce: 4}
+MAX_FRAME_COUNT = 0xffffffff
+
+pixel_dtype = np.dtype([("tag", "u1"), ("value", ">i2")])
+
+
+#numpy record type of a whole line packet for a given frame count encoding
+def line_packet_dtype(frame_count_size):
+    fields = [("header", "S3"), ("frame_tag", "u1")]
+    if frame_count_size:
+        fields.append(("frame_value", ">u%d" % frame_count_size))
+    fields += [("line", "u1"), ("pixels", pixel_dtype, (PIXELS_PER_LINE,))]
+    return np.dtype(fields)
+
+
+line_packet_dtypes = {size: line_packet_dtype(size) for size in (0, 1, 2, 4)}
+
+
+#class to decode whole chunks of serial data into line packets without going through msgpack objects
+#consecutive packets are mapped as numpy records directly on top of the received bytes
+#only the fixed layout is accepted: every pixel must be packed as a 16 bit int (tag 0xd1 or 0xcd)
+class BatchLineDecoder():
+    def __init__(self):
+        self.pending = b""
+        self.lines_decoded = 0
+        self.bytes_discarded = 0
+        #times bytes were skipped to find the next packet after being in step
+        self.resyncs = 0
+        self.in_sync = True
+
+    #forget a partial packet, e.g. after the baudrate changed
+    def reset(self):
+        self.pending = b""
+        self.in_sync = True
+
+    def _discard(self, count):
+        if count == 0:
+            return
+        self.bytes_discarded += count
+        if self.in_sync:
+            self.resyncs += 1
+            self.in_sync = False
+
+    #feed a chunk of serial data, returns the frame counts, line counts and raw int16 pixels
+    #of every complete line packet found, in stream order
+    #the pixels are a read only view on the received data, copy them out before keeping them
+    def feed(self, data):
+        buffer = self.pending + data
+        runs = []
+        pos = 0
+
+        while True:
+            start = buffer.find(LINE_HEADER, pos)
+            if start < 0:
+                #the tail could be the start of a header
+                start = max(len(buffer) - len(LINE_HEADER) + 1, pos)
+                self._discard(start - pos)
+                pos = start
+                break
+
+            self._discard(start - pos)
+            pos = start
+
+            if start + len(LINE_HEADER) >= len(buffer):
+                break
+
+            frame_tag = buffer[start + len(LINE_HEADER)]
+            if frame_tag < 0x80:
+                frame_count_size = 0
+            elif frame_tag in frame_count_tags:
+                frame_count_size = frame_count_tags[frame_tag]
+            else:
+                pos = start + 1
+                self._discard(1)
+                continue
+
+            packet_dtype = line_packet_dtypes[frame_count_size]
+            count = (len(buffer) - start) // packet_dtype.itemsize
+            if count == 0:
+                break
+
+            packets = np.frombuffer(buffer, dtype=packet_dtype, count=count, offset=start)
+            valid = self._valid_packets(packets, frame_tag, frame_count_size)
+            run = count if valid.all() else int(np.argmin(valid))
+            if run == 0:
+                pos = start + 1
+                self._discard(1)
+                continue
+
+            runs.append((packets[:run], frame_count_size))
+            self.in_sync = True
+            pos = start + run * packet_dtype.itemsize
+
+        self.pending = buffer[pos:]
+
+        if not runs:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), np.zeros((0, PIXELS_PER_LINE), dtype=np.int16)
+
+        frame_counts = [self._frame_counts(packets, size) for packets, size in runs]
+        line_counts = [packets["line"] for packets, size in runs]
+        pixels = [packets["pixels"]["value"] for packets, size in runs]
+        self.lines_decoded += sum(len(lines) for lines in line_counts)
+
+        if len(runs) == 1:
+            return frame_counts[0], line_counts[0], pixels[0]
+        return np.concatenate(frame_counts), np.concatenate(line_counts), np.concatenate(pixels)
+
+    def _valid_packets(self, packets, frame_tag, frame_count_size):
+        valid = packets["header"] == LINE_HEADER
+        if frame_count_size:
+            valid &= packets["frame_tag"] == frame_tag
+        else:
+            valid &= packets["frame_tag"] < 0x80
+        valid &= packets["line"] < LINES_PER_FRAME
+        tags = packets["pixels"]["tag"]
+        valid &= ((tags == INT16_TAG) | (tags == UINT16_TAG)).all(axis=1)
+        return valid
+
+    def _frame_counts(self, packets, frame_count_size):
+        if frame_count_size:
+            return packets["frame_value"].astype(np.int64)
+        return packets["frame_tag"].astype(np.int64)
+
+
+#a line whose frame count and pixels are ints the sensor can send, the frame count is at most 32 bits,
+#every pixel is a 16 bit int
+def _valid_line(line):
+    if type(line[0]) is not int or not 0 <= line[0] <= MAX_FRAME_COUNT:
+        return False
+    return all(type(value) is int and -32768 <= value < 65536 for value in line[2:])
+
+
+#class to decode line packets with the msgpack unpacker, any integer encoding of the values is accepted
+#returns the same arrays as BatchLineDecoder.feed
+#the unpacker is iterated, so running out of data ends the loop without an exception
+#after corrupt bytes or an object that is not a line the decoder skips to the next line header,
+#the bytes since the end of the last good packet are kept for that
+class MsgpackLineDecoder():
+    def __init__(self):
+        self.lines_decoded = 0
+        self.bytes_discarded = 0
+        self.resyncs = 0
+        self.reset()
+
+    def reset(self):
+        #a corrupt length can not make the unpacker wait for megabytes of data
+        self.unpacker = msgpack.Unpacker(max_array_len=LINES_PER_FRAME * PIXELS_PER_LINE, max_map_len=16,
+                                         max_str_len=256, max_bin_len=256, max_ext_len=256)
+        #the received bytes from the end of the last good packet, and the unpacker position at their start
+        self.pending = b""
+        self.pending_start = 0
+
+    def feed(self, data):
+        self.pending += data
+        self.unpacker.feed(data)
+        lines = []
+        while True:
+            good_end = self.unpacker.tell()
+            try:
+                for unpacked in self.unpacker:
+                    if type(unpacked) is not list or len(unpacked) != PIXELS_PER_LINE + 2 or type(unpacked[1]) is not int or not 0 <= unpacked[1] < LINES_PER_FRAME:
+                        break
+                    lines.append(unpacked)
+                    good_end = self.unpacker.tell()
+                else:
+                    #the limits of the unpacker do not stop it from waiting for a bin or str of gigabytes
+                    if len(self.pending) - (good_end - self.pending_start) <= MAX_LINE_PACKET_BYTES:
+                        break
+            except (ValueError, msgpack.UnpackException):
+                #corrupt bytes, e.g. a reserved type byte
+                pass
+            self._resync(good_end)
+
+        self.pending = self.pending[good_end - self.pending_start:]
+        self.pending_start = good_end
+        if not lines:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint8), np.zeros((0, PIXELS_PER_LINE), dtype=np.int16)
+
+        try:
+            values = np.array(lines, dtype=np.int64)
+        except (ValueError, TypeError, OverflowError):
+            #a corrupt value that is not an int or does not fit in 64 bits, rare enough to sort out line by line
+            values = np.array([line for line in lines if _valid_line(line)], dtype=np.int64).reshape(-1, PIXELS_PER_LINE + 2)
+        values = values[((values[:, 0] >= 0) & (values[:, 0] <= MAX_FRAME_COUNT) &
+                         ((values[:, 2:] >= -32768) & (values[:, 2:] < 65536)).all(axis=1))]
+        #a line with a corrupt value is skipped like corrupt bytes
+        self.resyncs += len(lines) - len(values)
+        self.lines_decoded += len(values)
+        return values[:, 0], values[:, 1].astype(np.uint8), values[:, 2:].astype(np.int16)
+
+    #start again at the first line header after the bad packet at unpacker position start
+    def _resync(self, start):
+        self.resyncs += 1
+        buffer = self.pending[start - self.pending_start:]
+        header = buffer.find(LINE_HEADER, 1)
+        if header < 0:
+            #the tail could be the start of a header
+            header = max(len(buffer) - len(LINE_HEADER) + 1, 1)
+        self.bytes_discarded += header
+        buffer = buffer[header:]
+        self.reset()
+        self.pending = buffer
+        self.unpacker.feed(buffer)
+
+
+#pack a line in the fixed layout, the inverse of BatchLineDecoder.feed
+def pack_line(frame_count, line_count, pixels):
+    packet = np.zeros(1, dtype=line_packet_dtypes[4])
+    packet["header"] = LINE_HEADER
+    packet["frame_tag"] = 0xce
+    packet["frame_value"] = frame_count & 0xffffffff
+    packet["line"] = line_count
+    packet["pixels"]["tag"] = INT16_TAG
+    packet["pixels"]["value"] = pixels
+    return packet.tobytes()
+
+
+#pack the 24 lines of a frame at once, the same bytes as pack_line for every line
+def pack_frame(frame_count, frame):
+    packets = np.zeros(LINES_PER_FRAME, dtype=line_packet_dtypes[4])
+    packets["header"] = LINE_HEADER
+    packets["frame_tag"] = 0xce
+    packets["frame_value"] = frame_count & 0xffffffff
+    packets["line"] = np.arange(LINES_PER_FRAME)
+    packets["pixels"]["tag"] = INT16_TAG
+    packets["pixels"]["value"] = frame
+    return packets.tobytes()
+
+
+if __name__ == "__main__":
+    #measure the decoding throughput in lines per second against the msgpack unpacker
+    import time
+    import msgpack
+
+    num_frames = 2000
+    rng = np.random.default_rng(0)
+    frames = rng.integers(1500, 4000, size=(num_frames, LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+    stream = b"".join(pack_line(f, l, frames[f, l]) for f in range(num_frames) for l in range(LINES_PER_FRAME))
+    num_lines = num_frames * LINES_PER_FRAME
+
+    for chunk_size in (1000, 4000, 16000):
+        chunks = [stream[i:i+chunk_size] for i in range(0, len(stream), chunk_size)]
+
+        decoder = BatchLineDecoder()
+        frame_raw = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.int16)
+        start = time.perf_counter()
+        for chunk in chunks:
+            frame_counts, line_counts, pixels = decoder.feed(chunk)
+            frame_raw[line_counts] = pixels
+        batch_time = time.perf_counter() - start
+        assert decoder.lines_decoded == num_lines
+
+        unpacker = msgpack.Unpacker()
+        frame = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.float32)
+        start = time.perf_counter()
+        for chunk in chunks:
+            unpacker.feed(chunk)
+            for unpacked in unpacker:
+                temperature_line = np.array(unpacked[2:], dtype=np.float32)
+                temperature_line *= 0.01
+                frame[unpacked[1]] = temperature_line
+        msgpack_time = time.perf_counter() - start
+
+        print("%5d byte reads: msgpack %8.0f lines/s, batch %8.0f lines/s" % (chunk_size, num_lines / msgpack_time, num_lines / batch_time))
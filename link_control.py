@@ -0,0 +1,137 @@
+import logging
+import msgpack
+
+from constants import *
+from line_decoder import LINES_PER_FRAME, PIXELS_PER_LINE
+
+#Control commands to the sensor, msgpack arrays like the lines it sends:
+#["rate", code]      set the MLX90640 refresh rate, code as in sample_rates
+#["baud", baudrate]  switch the serial link, the device switches when it has the command, the host right after sending it
+#the device does not answer, the lines arriving afterwards show whether it worked
+#the device is taken to send one frame per refresh
+
+#bytes of a line packet on the wire: array header, frame count up to a uint32, line count, 32 int16 with their tags
+LINE_PACKET_BYTES = 3 + 5 + 1 + PIXELS_PER_LINE * 3
+#start and stop bit around every byte
+BITS_PER_BYTE = 10
+
+
+def command_packet(name, value):
+    return msgpack.packb([name, value])
+
+
+def sample_rate_hz(sample_rate):
+    return float(sample_rate.split()[0])
+
+
+#frames per second a baudrate carries at full load
+def link_frame_rate(baudrate):
+    return baudrate / (BITS_PER_BYTE * LINE_PACKET_BYTES * LINES_PER_FRAME)
+
+
+def link_fits(sample_rate, baudrate, max_load=LINK_MAX_LOAD):
+    return sample_rate_hz(sample_rate) <= link_frame_rate(baudrate) * max_load
+
+
+#lowest baudrate that carries a sample rate, None when none does
+def lowest_baudrate(sample_rate, max_load=LINK_MAX_LOAD):
+    for baudrate in sorted(baudrates):
+        if link_fits(sample_rate, baudrate, max_load):
+            return baudrate
+    return None
+
+
+#fastest sample rate a baudrate carries
+def highest_sample_rate(baudrate, max_load=LINK_MAX_LOAD):
+    fitting = [sample_rate for sample_rate in sample_rates if link_fits(sample_rate, baudrate, max_load)]
+    return max(fitting, key=sample_rate_hz, default=min(sample_rates, key=sample_rate_hz))
+
+
+#class to set the sample rate and baudrate of one sensor through its reader and to keep the link from losing lines
+#with auto on, the sample rate runs at the lowest baudrate that carries it, or the fastest rate the fastest baudrate carries
+#when lines still get lost, check steps the baudrate up and, at the fastest baudrate, the sample rate down
+class LinkTuner():
+    def __init__(self, reader, sample_rate=SAMPLE_RATE_DEFAULT, auto=AUTO_LINK_DEFAULT):
+        self.reader = reader
+        #the sensor is taken to run at the configured rate and the port's baudrate, nothing is sent for those,
+        #boards whose firmware does not know the commands keep working as long as the user changes nothing
+        self.sample_rate = sample_rate
+        self.baudrate = reader.baudrate
+        self.requested = sample_rate
+        self.auto = auto
+        self.message = ""
+        self.last_lines = None
+        self.last_missed = None
+        if auto:
+            self._tune(sample_rate)
+        else:
+            self._check_fit()
+
+    #apply the settings chosen by the user, nothing is sent when they did not change
+    def set(self, sample_rate, baudrate, auto):
+        if (sample_rate, baudrate, auto) == (self.requested, self.baudrate, self.auto):
+            return
+        self.auto = auto
+        if auto:
+            self._tune(sample_rate)
+            return
+        self.requested = sample_rate
+        self._apply(sample_rate, baudrate)
+
+    #the lowest baudrate that carries the sample rate, or the fastest rate the fastest baudrate carries
+    def _tune(self, sample_rate):
+        baudrate = lowest_baudrate(sample_rate)
+        if baudrate is None:
+            baudrate = max(baudrates)
+            sample_rate = highest_sample_rate(baudrate)
+        self.requested = sample_rate
+        self._apply(sample_rate, baudrate)
+
+    def _apply(self, sample_rate, baudrate):
+        if sample_rate != self.sample_rate:
+            self.reader.send_command("rate", sample_rates[sample_rate])
+            self.sample_rate = sample_rate
+        if baudrate != self.baudrate:
+            self.reader.set_baudrate(baudrate)
+            self.baudrate = baudrate
+        logging.info("Link on %s: %s at %d baud" % (self.reader.port, sample_rate, baudrate))
+        self._check_fit()
+        #the lines lost while switching do not count
+        self.last_lines = None
+
+    #warn when the baudrate cannot carry the sample rate
+    def _check_fit(self):
+        self.message = ""
+        if not link_fits(self.sample_rate, self.baudrate):
+            needed = lowest_baudrate(self.sample_rate)
+            self.message = "%d baud carries %.1f fps, %s needs %s" % (self.baudrate, link_frame_rate(self.baudrate) * LINK_MAX_LOAD, self.sample_rate,
+                                                                     "%d baud" % needed if needed else "a faster link")
+            logging.warning(self.message)
+
+    #called now and then, returns True when the settings were changed
+    def check(self):
+        counters = self.reader.timer.counters
+        lines = counters.get("lines received", 0)
+        missed = counters.get("lines missed", 0)
+        if self.last_lines is None or lines < self.last_lines:
+            self.last_lines, self.last_missed = lines, missed
+            return False
+        received = lines - self.last_lines
+        lost = missed - self.last_missed
+        self.last_lines, self.last_missed = lines, missed
+        if not self.auto or received < LINES_PER_FRAME or lost <= received * LINK_LOSS_LIMIT:
+            return False
+
+        #next faster baudrate, or a slower sample rate when the link is already at the fastest
+        faster = [baudrate for baudrate in sorted(baudrates) if baudrate > self.baudrate]
+        slower = sorted((sample_rate for sample_rate in sample_rates if sample_rate_hz(sample_rate) < sample_rate_hz(self.sample_rate)), key=sample_rate_hz)
+        logging.warning("Link on %s lost %d of %d lines" % (self.reader.port, lost, received))
+        if faster:
+            self._apply(self.sample_rate, faster[0])
+        elif slower:
+            self.requested = slower[-1]
+            self._apply(slower[-1], self.baudrate)
+        else:
+            return False
+        self.message = "lines lost, now %s at %d baud" % (self.sample_rate, self.baudrate)
+        return True
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import numpy as np
+
+
+#prerendered overlay drawn on top of the frame
+#only the touched pixels are kept, as flat indices into the frame for the width it was made for
+#opaque pixels are copied, anti-aliased edge pixels are blended with their transparency per channel
+#so text comes out the same as when it is drawn straight onto the frame
+class OverlayLayer():
+    def __init__(self, opaque_indices, opaque_color, blend_indices, blend_color, blend_transparency):
+        self.opaque_indices = opaque_indices
+        self.opaque_color = opaque_color
+        self.blend_indices = blend_indices
+        self.blend_color = blend_color
+        self.blend_transparency = blend_transparency
+
+    def composite(self, rgb):
+        pixels = rgb.reshape(-1, 3)
+        pixels[self.opaque_indices] = self.opaque_color
+
+        if self.blend_indices.size:
+            blended = pixels[self.blend_indices].astype(np.uint16)
+            blended *= self.blend_transparency
+            blended += 127
+            blended //= 255
+            blended += self.blend_color
+            pixels[self.blend_indices] = blended
+
+
+#draw an overlay once onto two canvases, black and white
+#untouched pixels differ by 255, opaque pixels come out the same on both
+#the canvas can be narrower than the frame, image_width is the width of the frame it is composited on
+def make_overlay_layer(size, draw, image_width=None):
+    width, height = size
+    if image_width is None:
+        image_width = width
+
+    black = np.zeros((height, width, 3), dtype=np.uint8)
+    white = np.full((height, width, 3), 255, dtype=np.uint8)
+    draw(black)
+    draw(white)
+    transparency = white - black
+
+    touched = (transparency[:, :, 0] & transparency[:, :, 1] & transparency[:, :, 2]) != 255
+    opaque = (transparency[:, :, 0] | transparency[:, :, 1] | transparency[:, :, 2]) == 0
+
+    opaque_rows, opaque_cols = np.nonzero(opaque)
+    blend_rows, blend_cols = np.nonzero(touched & ~opaque)
+
+    return OverlayLayer(opaque_rows * image_width + opaque_cols,
+                        black[opaque_rows, opaque_cols],
+                        blend_rows * image_width + blend_cols,
+                        black[blend_rows, blend_cols].astype(np.uint16),
+                        transparency[blend_rows, blend_cols].astype(np.uint16))
+
+
+#bounded least recently used cache of rendered layers
+class LayerCache():
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.layers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    #return the layer for the key, make it with factory() if it is not cached
+    def get(self, key, factory):
+        layer = self.layers.get(key)
+        if layer is not None:
+            self.layers.move_to_end(key)
+            self.hits += 1
+            return layer
+
+        self.misses += 1
+        layer = factory()
+        self.layers[key] = layer
+        if len(self.layers) > self.maxsize:
+            self.layers.popitem(last=False)
+        return layer
+
+    def clear(self):
+        self.layers.clear()
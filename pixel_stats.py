@@ -0,0 +1,213 @@
+import numpy as np
+
+from constants import *
+
+
+#class for per pixel mean, standard deviation, min and max over a sliding time window
+#the window is split into buckets, every frame only updates the bucket being filled and a finished bucket
+#is added to running totals while the bucket that left the window is taken out, so a frame costs the same for any window
+#min and max use the van Herk/Gil-Werman scheme over the buckets: the window is the end of the previous block of buckets,
+#kept as suffix minima and maxima computed once per block, and the start of the current block, kept as running prefix values
+#the stats cover the whole buckets of the window and the bucket being filled, so up to one bucket more than the window
+class RollingStats():
+    def __init__(self, shape, window, buckets=ROLLING_STATS_BUCKETS):
+        self.shape = tuple(shape)
+        self.window = window
+        self.buckets = buckets
+        self.bucket_time = window / buckets
+        stack = (buckets,) + self.shape
+
+        #finished buckets by position in the block, the current block overwrites the previous one as it leaves the window
+        self.counts = np.zeros(stack, dtype=np.float64)
+        self.sums = np.zeros(stack, dtype=np.float64)
+        self.squares = np.zeros(stack, dtype=np.float64)
+        self.mins = np.zeros(stack, dtype=np.float32)
+        self.maxs = np.zeros(stack, dtype=np.float32)
+        #totals of the finished buckets in the window
+        self.total_count = np.zeros(self.shape, dtype=np.float64)
+        self.total_sum = np.zeros(self.shape, dtype=np.float64)
+        self.total_square = np.zeros(self.shape, dtype=np.float64)
+        #min and max of the previous block from every position to its end, and of the current block so far
+        self.suffix_min = np.zeros(stack, dtype=np.float32)
+        self.suffix_max = np.zeros(stack, dtype=np.float32)
+        self.prefix_min = np.zeros(self.shape, dtype=np.float32)
+        self.prefix_max = np.zeros(self.shape, dtype=np.float32)
+        #the bucket being filled
+        self.bucket_count = np.zeros(self.shape, dtype=np.float64)
+        self.bucket_sum = np.zeros(self.shape, dtype=np.float64)
+        self.bucket_square = np.zeros(self.shape, dtype=np.float64)
+        self.bucket_min = np.zeros(self.shape, dtype=np.float32)
+        self.bucket_max = np.zeros(self.shape, dtype=np.float32)
+        self.delta = np.zeros(self.shape, dtype=np.float64)
+        self.scratch = np.zeros(self.shape, dtype=np.float64)
+        self.reset()
+
+    def reset(self):
+        for array in (self.counts, self.sums, self.squares, self.total_count, self.total_sum, self.total_square):
+            array[:] = 0
+        for array in (self.mins, self.suffix_min, self.prefix_min):
+            array[:] = np.inf
+        for array in (self.maxs, self.suffix_max, self.prefix_max):
+            array[:] = -np.inf
+        self._clear_bucket()
+        #position of the bucket being filled in its block, and its number counted from time 0
+        self.position = 0
+        self.bucket_index = None
+        #sums are kept relative to the first frame, squares of small deviations lose no precision
+        self.reference = None
+
+    #add a frame taken at a time in seconds, with a mask of the rows it really has
+    def add(self, timestamp, frame, mask=None):
+        index = int(timestamp // self.bucket_time)
+        if self.bucket_index is None or index < self.bucket_index or index - self.bucket_index > self.buckets:
+            #first frame, or a clock jump that leaves nothing of the window
+            self.reset()
+            self.reference = float(np.mean(frame))
+        else:
+            for _ in range(index - self.bucket_index):
+                self._finish_bucket()
+        self.bucket_index = index
+
+        np.subtract(frame, self.reference, out=self.delta)
+        if mask is None or mask.all():
+            self.bucket_count += 1
+            self.bucket_sum += self.delta
+            np.multiply(self.delta, self.delta, out=self.scratch)
+            self.bucket_square += self.scratch
+            np.minimum(self.bucket_min, frame, out=self.bucket_min)
+            np.maximum(self.bucket_max, frame, out=self.bucket_max)
+        else:
+            rows = mask[:, np.newaxis]
+            np.add(self.bucket_count, 1, out=self.bucket_count, where=rows)
+            np.add(self.bucket_sum, self.delta, out=self.bucket_sum, where=rows)
+            np.multiply(self.delta, self.delta, out=self.scratch)
+            np.add(self.bucket_square, self.scratch, out=self.bucket_square, where=rows)
+            np.minimum(self.bucket_min, frame, out=self.bucket_min, where=rows)
+            np.maximum(self.bucket_max, frame, out=self.bucket_max, where=rows)
+
+    def _finish_bucket(self):
+        position = self.position
+        #the bucket at this position of the previous block leaves the window
+        self.total_count += self.bucket_count - self.counts[position]
+        self.total_sum += self.bucket_sum - self.sums[position]
+        self.total_square += self.bucket_square - self.squares[position]
+        self.counts[position] = self.bucket_count
+        self.sums[position] = self.bucket_sum
+        self.squares[position] = self.bucket_square
+        self.mins[position] = self.bucket_min
+        self.maxs[position] = self.bucket_max
+        np.minimum(self.prefix_min, self.bucket_min, out=self.prefix_min)
+        np.maximum(self.prefix_max, self.bucket_max, out=self.prefix_max)
+        self._clear_bucket()
+
+        self.position += 1
+        if self.position == self.buckets:
+            #the block is complete, once per block so a frame pays for one bucket of it
+            self.suffix_min[:] = np.minimum.accumulate(self.mins[::-1], axis=0)[::-1]
+            self.suffix_max[:] = np.maximum.accumulate(self.maxs[::-1], axis=0)[::-1]
+            self.prefix_min[:] = np.inf
+            self.prefix_max[:] = -np.inf
+            self.position = 0
+            #start the totals again from the buckets, the running sums would slowly collect rounding errors
+            np.sum(self.counts, axis=0, out=self.total_count)
+            np.sum(self.sums, axis=0, out=self.total_sum)
+            np.sum(self.squares, axis=0, out=self.total_square)
+
+    def _clear_bucket(self):
+        self.bucket_count[:] = 0
+        self.bucket_sum[:] = 0
+        self.bucket_square[:] = 0
+        self.bucket_min[:] = np.inf
+        self.bucket_max[:] = -np.inf
+
+    #number of frames per pixel in the window
+    def count(self, out=None):
+        return np.add(self.total_count, self.bucket_count, out=out, casting="unsafe")
+
+    #the stat maps, pixels without a frame in the window are NaN
+    def mean(self, out=None):
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float32)
+        count = self.total_count + self.bucket_count
+        out[:] = np.nan
+        np.divide(self.total_sum + self.bucket_sum, count, out=self.scratch, where=count > 0)
+        np.add(self.scratch, self.reference if self.reference is not None else 0, out=out, where=count > 0, casting="unsafe")
+        return out
+
+    def std(self, out=None):
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float32)
+        count = self.total_count + self.bucket_count
+        out[:] = np.nan
+        valid = count > 0
+        mean = np.divide(self.total_sum + self.bucket_sum, count, where=valid, out=np.zeros(self.shape))
+        variance = np.divide(self.total_square + self.bucket_square, count, where=valid, out=np.zeros(self.shape)) - mean * mean
+        np.sqrt(np.maximum(variance, 0), out=out, where=valid, casting="unsafe")
+        return out
+
+    def min(self, out=None):
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float32)
+        np.minimum(self.suffix_min[self.position], self.prefix_min, out=out)
+        np.minimum(out, self.bucket_min, out=out)
+        out[np.isinf(out)] = np.nan
+        return out
+
+    def max(self, out=None):
+        if out is None:
+            out = np.empty(self.shape, dtype=np.float32)
+        np.maximum(self.suffix_max[self.position], self.prefix_max, out=out)
+        np.maximum(out, self.bucket_max, out=out)
+        out[np.isinf(out)] = np.nan
+        return out
+
+
+#class with the rolling stats of one sensor over several windows, names as in stat_windows
+#a view is a stat and a window, e.g. "Max 10 min", as listed in stat_views
+class PixelStats():
+    def __init__(self, shape=(24, 32), windows=stat_windows, buckets=ROLLING_STATS_BUCKETS):
+        self.windows = {name: RollingStats(shape, seconds, buckets) for name, seconds in windows.items()}
+
+    def add(self, timestamp, frame, mask=None):
+        for stats in self.windows.values():
+            stats.add(timestamp, frame, mask)
+
+    def reset(self):
+        for stats in self.windows.values():
+            stats.reset()
+
+    #the stat map of a view, None for a view that is not a stat
+    def view(self, name, out=None):
+        stat, _, window = name.partition(" ")
+        stats = self.windows.get(window)
+        if stats is None or stat not in ("Mean", "Std", "Min", "Max"):
+            return None
+        return getattr(stats, stat.lower())(out)
+
+
+if __name__ == "__main__":
+    #per frame cost and a check against numpy over the same frames
+    import time
+
+    rng = np.random.default_rng(0)
+    rate = 16
+    frames = (25 + rng.normal(0, 1, (rate * 60, 24, 32))).astype(np.float32)
+    for seconds in (10, 600):
+        stats = RollingStats((24, 32), seconds)
+        start = time.perf_counter()
+        for index, frame in enumerate(frames):
+            stats.add(index / rate, frame)
+        elapsed = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(100):
+            stats.mean(), stats.std(), stats.min(), stats.max()
+        query = (time.perf_counter() - start) / 100
+
+        #the window covers its whole buckets and the one being filled
+        first = (int(len(frames) / rate // stats.bucket_time) - stats.buckets) * stats.bucket_time * rate
+        window = frames[max(int(np.ceil(first)), 0):]
+        error = max(float(np.max(np.abs(stats.mean() - window.mean(axis=0)))),
+                    float(np.max(np.abs(stats.std() - window.std(axis=0)))),
+                    float(np.max(np.abs(stats.min() - window.min(axis=0)))),
+                    float(np.max(np.abs(stats.max() - window.max(axis=0)))))
+        print("%4d s window: %.1f us per frame, %.1f us for all four maps, max error %.2e over %d frames" % (seconds, elapsed / len(frames) * 1e6, query * 1e6, error, len(window)))
@@ -0,0 +1,191 @@
+import logging
+import multiprocessing
+import time
+from queue import Empty
+from threading import Thread, Event
+import numpy as np
+
+from constants import *
+from frame_ring import SharedFrameRing
+from line_decoder import LINES_PER_FRAME, PIXELS_PER_LINE
+from stage_timer import StageTimer
+
+
+#StageTimer showing the stage summary and counters reported by the reader process
+class ReportedTimer(StageTimer):
+    def __init__(self, window=STAGE_TIMING_WINDOW):
+        StageTimer.__init__(self, window)
+        self.reported_summary = []
+
+    def update(self, report):
+        with self.lock:
+            self.counters = report["counters"]
+            self.reported_summary = report["summary"]
+
+    def summary(self, percentiles=(50, 95, 99)):
+        return self.reported_summary
+
+
+#runs in the reader process: an IRSerialReader publishing into the shared ring, commands in and reports out
+def run_reader_process(port, baudrate, decoder, frame_policy, ring_name, ring_capacity, lock, commands, reports, frame_ready, stop):
+    from ir_serial_reader import IRSerialReader
+
+    frames = SharedFrameRing(ring_capacity, shape=(LINES_PER_FRAME, PIXELS_PER_LINE), name=ring_name, lock=lock)
+    reader = IRSerialReader(port, baudrate, decoder=decoder, frame_policy=frame_policy, frames=frames)
+    reader.frame_callback = frame_ready.set
+    next_report = 0
+    try:
+        while reader.is_alive() and not stop.is_set():
+            try:
+                name, value = commands.get(timeout=0.05)
+                if name == "baud":
+                    reader.set_baudrate(value)
+                else:
+                    reader.send_command(name, value)
+            except Empty:
+                pass
+            if time.perf_counter() >= next_report:
+                reports.put(_report(reader))
+                next_report = time.perf_counter() + PROCESS_READER_REPORT_INTERVAL
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.frame_callback = None
+        reader.stop()
+        reports.put(_report(reader))
+        frames.close()
+
+
+def _report(reader):
+    return {
+        "time": time.time(),
+        "reader alive": reader.is_alive(),
+        "error": reader.error,
+        "baudrate": reader.baudrate,
+        "counters": dict(reader.timer.counters),
+        "summary": reader.timer.summary(),
+    }
+
+
+#class with the interface of IRSerialReader that runs the serial reader and line decoder in another process
+#the frames come back through a SharedFrameRing, consumers copy them out of the shared block like from a FrameRing
+#this thread waits for the frames of the process to call frame_callback and the frame listeners,
+#forwards the control commands and takes the counters and stage timings the process reports
+#listeners get every frame still in the ring, the ones overwritten before this thread read them are counted
+class ProcessReader(Thread):
+    def __init__(self, port, baudrate, decoder="msgpack", ring_capacity=4, timer=None, frame_policy=FRAME_POLICY_DEFAULT):
+        Thread.__init__(self)
+        self.port = port
+        self.baudrate = baudrate
+        self.decoder = decoder
+        self.request_disconnect = Event()
+        self.frame_callback = None
+        self.frame_listeners = []
+        self.timer = timer if timer is not None else ReportedTimer()
+        self.error = None
+        self.frame = np.zeros((LINES_PER_FRAME, PIXELS_PER_LINE), dtype=np.float32)
+        self.next_sequence = 0
+        self.listener_frames_missed = 0
+        self.last_report = None
+
+        #spawn, a forked copy of the app would carry its Tk and render threads' state
+        context = multiprocessing.get_context("spawn")
+        self.frames = SharedFrameRing(ring_capacity, shape=(LINES_PER_FRAME, PIXELS_PER_LINE), lock=context.Lock())
+        self.commands = context.Queue()
+        self.reports = context.Queue()
+        self.frame_ready = context.Event()
+        self.stop_process = context.Event()
+        self.process = context.Process(target=run_reader_process, name="IRSerialReader %s" % port, daemon=True,
+                                       args=(port, baudrate, decoder, frame_policy, self.frames.name, ring_capacity, self.frames.lock,
+                                             self.commands, self.reports, self.frame_ready, self.stop_process))
+        self.process.start()
+
+        self.start()
+
+    def run(self):
+        try:
+            while not self.request_disconnect.is_set():
+                if self.frame_ready.wait(0.1):
+                    self.frame_ready.clear()
+                    self._frames_ready()
+                self._take_reports()
+                if not self.process.is_alive():
+                    break
+        finally:
+            self._stop_process()
+        #the last frames published before the process stopped
+        self._frames_ready()
+        self.frames.close(unlink=True)
+        if self.error is None and self.process.exitcode:
+            self.error = "Reader process exited with code %d" % self.process.exitcode
+        if self.error is not None:
+            logging.error("Reader on %s: %s" % (self.port, self.error))
+
+    def _frames_ready(self):
+        if self.frame_listeners:
+            while self.next_sequence <= self.frames.sequence:
+                frame = self.frames.read(self.next_sequence, out=self.frame)
+                self.next_sequence += 1
+                if frame is None:
+                    self.listener_frames_missed += 1
+                    continue
+                for listener in list(self.frame_listeners):
+                    listener(frame[0], self.frame)
+        else:
+            self.next_sequence = self.frames.sequence + 1
+
+        frame_callback = self.frame_callback
+        if frame_callback is not None and not self.request_disconnect.is_set():
+            frame_callback()
+
+    def _take_reports(self):
+        while True:
+            try:
+                report = self.reports.get_nowait()
+            except Empty:
+                return
+            self.last_report = report
+            self.error = report["error"]
+            self.baudrate = report["baudrate"]
+            self.timer.update(report)
+
+    def _stop_process(self):
+        self.stop_process.set()
+        deadline = time.perf_counter() + PROCESS_READER_STOP_TIMEOUT
+        #keep taking reports, a process with a full queue does not exit
+        while self.process.is_alive() and time.perf_counter() < deadline:
+            self._take_reports()
+            self.process.join(0.05)
+        if self.process.is_alive():
+            logging.warning("Reader process on %s did not stop, terminating it" % self.port)
+            self.process.terminate()
+            self.process.join()
+        self._take_reports()
+
+    #queue a control command for the sensor, see link_control.py
+    def send_command(self, name, value):
+        self.commands.put((name, value))
+
+    #switch the sensor and then the port to another baudrate
+    def set_baudrate(self, baudrate):
+        self.commands.put(("baud", baudrate))
+
+    #state of the reader process and the frames lost on the way
+    def health(self):
+        counters = self.timer.counters
+        return {
+            "process alive": self.process.is_alive(),
+            "pid": self.process.pid,
+            "exit code": self.process.exitcode,
+            "reader alive": self.last_report is not None and self.last_report["reader alive"],
+            "report age": time.time() - self.last_report["time"] if self.last_report is not None else None,
+            "error": self.error,
+            "lines missed": counters.get("lines missed", 0),
+            "frames lost": counters.get("frames lost", 0),
+            "frames dropped": self.frames.stats()["dropped"],
+            "listener frames missed": self.listener_frames_missed,
+        }
+
+    def stop(self):
+        self.request_disconnect.set()
+        self.join()
@@ -0,0 +1,54 @@
+from threading import Thread
+from queue import Queue
+
+from frame_renderer import FrameRenderer
+
+
+#class to render the frames of several cameras at once
+#every worker has its own FrameRenderer and overlay cache, the caller renders the first frame itself
+#resize, color map and drawing in OpenCV release the GIL, so the frames render in parallel
+class RenderPool():
+    def __init__(self, num_workers=2, timer=None):
+        self.renderer = FrameRenderer(timer=timer)
+        self.jobs = Queue()
+        self.workers = [Thread(target=self._work, args=(FrameRenderer(timer=timer),), daemon=True) for i in range(num_workers)]
+        for worker in self.workers:
+            worker.start()
+
+    #render a list of (data, settings), returns a list of (rgb, debug_images) in the same order
+    def render(self, jobs):
+        if not jobs:
+            return []
+
+        results = Queue()
+        for index, (data, settings) in enumerate(jobs[1:], 1):
+            self.jobs.put((index, data, settings, results))
+
+        rendered = [None] * len(jobs)
+        data, settings = jobs[0]
+        rendered[0] = (self.renderer.render(data, settings), self.renderer.debug_images)
+
+        for i in range(len(jobs) - 1):
+            index, result = results.get()
+            if isinstance(result, Exception):
+                raise result
+            rendered[index] = result
+        return rendered
+
+    def stop(self):
+        for worker in self.workers:
+            self.jobs.put(None)
+        for worker in self.workers:
+            worker.join()
+
+    def _work(self, renderer):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            index, data, settings, results = job
+            try:
+                rgb = renderer.render(data, settings)
+                results.put((index, (rgb, renderer.debug_images)))
+            except Exception as e:
+                results.put((index, e))
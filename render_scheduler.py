@@ -0,0 +1,43 @@
+import time
+
+from constants import *
+
+
+#class to pace the display independently of the sensor rate
+#frames are filtered as they arrive and the display draws only the newest one on every tick
+#the tick interval is 1 / target_fps, stretched while drawing takes more than busy_fraction of it
+#so a slow display resolution lowers the frame rate instead of starving the Tk loop
+class RenderScheduler():
+    def __init__(self, target_fps=DISPLAY_FPS_DEFAULT, busy_fraction=RENDER_BUSY_FRACTION, smoothing=0.1):
+        self.target_fps = target_fps
+        self.busy_fraction = busy_fraction
+        self.smoothing = smoothing
+        self.render_time = 0.0
+        self.last_tick = None
+        self.ticks = 0
+
+    #seconds between ticks
+    def interval(self):
+        return max(1 / self.target_fps, self.render_time / self.busy_fraction)
+
+    def fps(self):
+        return 1 / self.interval()
+
+    #seconds until the next tick is due, 0 when it is due now
+    def time_to_next(self, now=None):
+        if self.last_tick is None:
+            return 0
+        if now is None:
+            now = time.perf_counter()
+        return max(self.last_tick + self.interval() - now, 0)
+
+    #a tick starting now that took duration seconds to draw
+    def tick(self, start, duration):
+        self.last_tick = start
+        self.ticks += 1
+        self.render_time += self.smoothing * (duration - self.render_time)
+
+    def reset(self):
+        self.render_time = 0.0
+        self.last_tick = None
+        self.ticks = 0
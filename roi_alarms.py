@@ -0,0 +1,205 @@
+from threading import Thread
+from queue import Queue
+import csv
+import json
+import logging
+import os
+import time
+import numpy as np
+import cv2 as cv
+
+from constants import *
+
+#Alarm regions, a JSON list of objects in sensor coordinates: x is the column 0-31, y the row 0-23 of the frame
+#as the sensor sends it, the display shows it mirrored
+#   {"name": "bearing", "rect": [x, y, width, height], "stat": "max", "above": 60}
+#   {"name": "connector", "polygon": [[x, y], [x, y], ...], "stat": "mean", "above": 45, "below": 5,
+#    "hysteresis": 1, "debounce": 3}
+#stat is mean, max or min of the region, above and below are the thresholds, either may be left out
+#an alarm is raised after the stat is past a threshold for debounce frames in a row
+#and cleared after it is back by more than the hysteresis for debounce frames in a row
+
+region_stats = ["mean", "max", "min"]
+
+
+#pixel mask of a region, a polygon covers the pixels whose centers are inside it or on its edge
+def region_mask(region, shape=(24, 32)):
+    mask = np.zeros(shape, dtype=np.uint8)
+    if "rect" in region:
+        x, y, width, height = region["rect"]
+        mask[max(y, 0):y + height, max(x, 0):x + width] = 1
+    elif "polygon" in region:
+        #fixed point with 4 fractional bits, pixel centers are on whole coordinates
+        points = np.rint(np.array(region["polygon"], dtype=np.float64) * 16).astype(np.int32)
+        cv.fillPoly(mask, [points], 1, lineType=cv.LINE_8, shift=4)
+    else:
+        raise ValueError("Region %s has no rect or polygon" % region.get("name"))
+    if not mask.any():
+        raise ValueError("Region %s has no pixels" % region.get("name"))
+    return mask.astype(bool)
+
+
+def load_regions(path):
+    with open(path) as f:
+        regions = json.load(f)
+    for index, region in enumerate(regions):
+        region.setdefault("name", "region %d" % index)
+        if region.get("stat", "max") not in region_stats:
+            raise ValueError("Region %s has unknown stat %s" % (region["name"], region["stat"]))
+    return regions
+
+
+#class to evaluate threshold alarms on regions of every frame
+#the regions are compiled once into one array of pixel indices per stat, sorted by region,
+#a frame takes one gather and one reduceat per stat in use, so the cost grows with the pixels covered and not with the regions
+#the alarm state of all regions is updated with array operations as well
+class AlarmEngine():
+    def __init__(self, regions, log=None, source="", shape=(24, 32)):
+        self.regions = regions
+        self.log = log
+        self.source = source
+        self.names = [region["name"] for region in regions]
+        count = len(regions)
+
+        masks = [region_mask(region, shape) for region in regions]
+        self.stat = np.array([region_stats.index(region.get("stat", "max")) for region in regions], dtype=np.int64)
+        #(stat, region indices, pixel indices of those regions one after another, start of every region, pixels per region)
+        self.groups = []
+        for stat in range(len(region_stats)):
+            indices = np.flatnonzero(self.stat == stat)
+            if len(indices) == 0:
+                continue
+            sizes = np.array([np.count_nonzero(masks[index]) for index in indices], dtype=np.int64)
+            pixels = np.concatenate([np.flatnonzero(masks[index]) for index in indices])
+            starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+            self.groups.append((stat, indices, pixels, starts, sizes))
+        self.pixel_count = sum(len(group[2]) for group in self.groups)
+        self.above = np.array([region.get("above", np.nan) for region in regions], dtype=np.float64)
+        self.below = np.array([region.get("below", np.nan) for region in regions], dtype=np.float64)
+        self.hysteresis = np.array([region.get("hysteresis", ALARM_HYSTERESIS_DEFAULT) for region in regions], dtype=np.float64)
+        self.debounce = np.array([region.get("debounce", ALARM_DEBOUNCE_DEFAULT) for region in regions], dtype=np.int64)
+        #the clear levels, NaN compares false so a missing threshold never trips
+        self.above_clear = self.above - self.hysteresis
+        self.below_clear = self.below + self.hysteresis
+
+        self.value = np.zeros(count, dtype=np.float64)
+        self.active = np.zeros(count, dtype=bool)
+        self.raise_count = np.zeros(count, dtype=np.int64)
+        self.clear_count = np.zeros(count, dtype=np.int64)
+        self.frames = 0
+        self.events = 0
+
+    #frame listener for IRSerialReader, the frame is in DegC
+    def add_frame(self, sequence, frame):
+        if len(self.names) == 0:
+            return
+        frame = np.ravel(frame)
+        for stat, indices, pixels, starts, sizes in self.groups:
+            values = frame[pixels]
+            if stat == 0:
+                self.value[indices] = np.add.reduceat(values, starts, dtype=np.float64) / sizes
+            elif stat == 1:
+                self.value[indices] = np.maximum.reduceat(values, starts)
+            else:
+                self.value[indices] = np.minimum.reduceat(values, starts)
+        self.frames += 1
+
+        with np.errstate(invalid="ignore"):
+            tripped = (self.value > self.above) | (self.value < self.below)
+            back = ~((self.value > self.above_clear) | (self.value < self.below_clear))
+        self.raise_count = np.where(tripped & ~self.active, self.raise_count + 1, 0)
+        self.clear_count = np.where(back & self.active, self.clear_count + 1, 0)
+        raised = self.raise_count >= self.debounce
+        cleared = self.clear_count >= self.debounce
+        if raised.any() or cleared.any():
+            self.active |= raised
+            self.active &= ~cleared
+            self.raise_count[raised] = 0
+            self.clear_count[cleared] = 0
+            self._report(np.flatnonzero(raised), "raised", sequence)
+            self._report(np.flatnonzero(cleared), "cleared", sequence)
+
+    def _report(self, indices, state, sequence):
+        now = time.time()
+        for index in indices:
+            region = self.regions[index]
+            self.events += 1
+            event = (now, self.source, sequence, region["name"], state, region_stats[self.stat[index]], float(self.value[index]),
+                     region.get("above", ""), region.get("below", ""))
+            if self.log is not None:
+                self.log.add(event)
+
+    #names of the regions in alarm
+    def active_names(self):
+        return [self.names[index] for index in np.flatnonzero(self.active)]
+
+
+#class to write the alarm events to a CSV file in a background thread, add never waits on the disk
+class AlarmLog(Thread):
+    columns = ["time", "source", "sequence", "region", "state", "stat", "value", "above", "below"]
+
+    def __init__(self, path):
+        Thread.__init__(self, daemon=True)
+        self.path = path
+        self.events = Queue()
+        self.events_written = 0
+
+        self.start()
+
+    def add(self, event):
+        self.events.put(event)
+
+    def run(self):
+        folderpath = os.path.dirname(self.path)
+        if folderpath:
+            os.makedirs(folderpath, exist_ok=True)
+        new = not os.path.exists(self.path)
+        #region names come from the JSON file, the csv module quotes commas, quotes and newlines in them
+        with open(self.path, "a", newline="") as f:
+            writer = csv.writer(f)
+            if new:
+                writer.writerow(self.columns)
+            while True:
+                event = self.events.get()
+                if event is None:
+                    return
+                #everything queued meanwhile goes out in one write
+                events = [event]
+                while not self.events.empty():
+                    event = self.events.get()
+                    if event is None:
+                        break
+                    events.append(event)
+                for now, source, sequence, name, state, stat, value, above, below in events:
+                    logging.warning("Alarm %s %s on %s: %s %.2f" % (name, state, source, stat, value))
+                    writer.writerow([time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)), source, sequence,
+                                     name, state, stat, "%.2f" % value, above, below])
+                self.events_written += len(events)
+                f.flush()
+                if event is None:
+                    return
+
+    #write everything already queued and stop
+    def stop(self):
+        self.events.put(None)
+        self.join()
+
+
+if __name__ == "__main__":
+    #per frame cost for a growing number of regions
+    rng = np.random.default_rng(0)
+    frames = (25 + rng.normal(0, 1, (2000, 24, 32))).astype(np.float32)
+    for count in (1, 10, 100, 500):
+        regions = []
+        for index in range(count):
+            x, y = int(rng.integers(0, 28)), int(rng.integers(0, 20))
+            if index % 2:
+                regions.append({"rect": [x, y, 4, 4], "stat": "max", "above": 28})
+            else:
+                regions.append({"polygon": [[x, y], [x + 4, y], [x + 2, y + 4]], "stat": "mean", "above": 26, "below": 20})
+        engine = AlarmEngine([dict(region, name="region %d" % index) for index, region in enumerate(regions)])
+        start = time.perf_counter()
+        for sequence, frame in enumerate(frames):
+            engine.add_frame(sequence, frame)
+        elapsed = time.perf_counter() - start
+        print("%3d regions, %5d pixels: %.1f us per frame, %d events" % (count, engine.pixel_count, elapsed / len(frames) * 1e6, engine.events))
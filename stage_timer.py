@@ -0,0 +1,106 @@
+import time
+from threading import Lock
+import json
+import bisect
+import numpy as np
+
+#histogram bin edges in seconds, 8 bins per decade from 1 us to 10 s
+histogram_edges = list(10.0 ** (np.arange(0, 57) / 8 - 6))
+
+
+#timing of one stage: the last durations for rolling percentiles and a log spaced histogram since the start
+class StageStats():
+    def __init__(self, window):
+        self.samples = np.zeros(window, dtype=np.float64)
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(histogram_edges) + 1)
+
+    def add(self, duration):
+        self.samples[self.position] = duration
+        self.position = (self.position + 1) % len(self.samples)
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        self.histogram[bisect.bisect(histogram_edges, duration)] += 1
+
+    #durations in the window, oldest first
+    def window(self):
+        if self.count < len(self.samples):
+            return self.samples[:self.count]
+        return np.roll(self.samples, -self.position)
+
+
+#class to collect the durations of the hot path stages and event counters
+#one timer can be shared by several threads, e.g. the render workers, adding a sample takes a short lock
+class StageTimer():
+    def __init__(self, window=500):
+        self.window = window
+        self.stages = {}
+        self.counters = {}
+        self.start_time = time.time()
+        self.lock = Lock()
+
+    def add(self, stage, duration):
+        with self.lock:
+            stats = self.stages.get(stage)
+            if stats is None:
+                stats = self.stages[stage] = StageStats(self.window)
+            stats.add(duration)
+
+    #time a stage from start, a perf_counter value, to now and return now for the next stage
+    def lap(self, stage, start):
+        now = time.perf_counter()
+        self.add(stage, now - start)
+        return now
+
+    def count(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + n
+
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+            self.start_time = time.time()
+
+    #percentiles over the rolling window in ms, one dict per stage
+    def summary(self, percentiles=(50, 95, 99)):
+        summary = []
+        for stage, stats in list(self.stages.items()):
+            if stats.count == 0:
+                continue
+            window = stats.window() * 1000
+            values = np.percentile(window, percentiles)
+            entry = {"stage": stage, "count": stats.count, "mean_ms": float(np.mean(window)), "max_ms": stats.max * 1000}
+            for percentile, value in zip(percentiles, values):
+                entry["p%d_ms" % percentile] = float(value)
+            summary.append(entry)
+        return summary
+
+    #rows of text cells for the debug overlay, like help_table
+    def table(self):
+        rows = [["stage ms", "p50", "p95", "p99", "max"]]
+        for entry in self.summary():
+            rows.append([entry["stage"]] + ["%.2f" % entry[key] for key in ("p50_ms", "p95_ms", "p99_ms", "max_ms")])
+        for counter, value in sorted(self.counters.items()):
+            rows.append([counter, "%d" % value])
+        return rows
+
+    #write the summary, counters, histograms and the raw window of every stage to a JSON file
+    def export(self, path, extra=None):
+        report = {
+            "start_time": self.start_time,
+            "export_time": time.time(),
+            "summary": self.summary(),
+            "counters": dict(self.counters),
+            "histogram_edges_s": histogram_edges,
+            "stages": {stage: {"histogram": list(stats.histogram), "window_s": stats.window().tolist()} for stage, stats in list(self.stages.items())},
+        }
+        if extra is not None:
+            report.update(extra)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
@@ -0,0 +1,162 @@
+import numpy as np
+
+from constants import *
+
+
+#per pixel adaptive filtering, the gain goes to 1 for changes well above the noise threshold
+class AdaptiveKernel():
+    def __init__(self, shape):
+        self.delta = np.zeros(shape, dtype=np.float32)
+        self.gain = np.zeros(shape, dtype=np.float32)
+        self.scratch = np.zeros(shape, dtype=np.float32)
+
+    def reset(self, filtered, noise_threshold):
+        pass
+
+    def step(self, data, filtered, noise_threshold):
+        np.subtract(data, filtered, self.delta)
+        np.square(self.delta, self.gain)
+        np.add(self.gain, noise_threshold**2, self.scratch)
+        np.divide(self.gain, self.scratch, self.gain)
+        np.multiply(self.gain, self.delta, self.gain)
+        np.add(filtered, self.gain, filtered)
+
+
+#exponential moving average with a fixed weight for the new frame
+class EMAKernel():
+    def __init__(self, shape, alpha=FILTER_EMA_ALPHA):
+        self.alpha = alpha
+        self.delta = np.zeros(shape, dtype=np.float32)
+
+    def reset(self, filtered, noise_threshold):
+        pass
+
+    def step(self, data, filtered, noise_threshold):
+        np.subtract(data, filtered, self.delta)
+        np.multiply(self.delta, self.alpha, self.delta)
+        np.add(filtered, self.delta, filtered)
+
+
+#median of the last frames per pixel, removes single frame spikes without smearing steps
+#the median is taken with a sorting network of minimum and maximum, np.median would copy the history every frame
+class MedianKernel():
+    def __init__(self, shape, window=FILTER_MEDIAN_WINDOW):
+        window = window | 1
+        self.history = np.zeros((window,) + tuple(shape), dtype=np.float32)
+        self.sorted = np.zeros_like(self.history)
+        self.scratch = np.zeros(shape, dtype=np.float32)
+        self.position = 0
+
+    def reset(self, filtered, noise_threshold):
+        self.history[:] = filtered
+        self.position = 0
+
+    def step(self, data, filtered, noise_threshold):
+        np.copyto(self.history[self.position], data, casting="same_kind")
+        self.position = (self.position + 1) % len(self.history)
+
+        #odd-even transposition sort, the middle row ends up as the median
+        sorted = self.sorted
+        np.copyto(sorted, self.history)
+        for round in range(len(sorted)):
+            for i in range(round % 2, len(sorted) - 1, 2):
+                np.minimum(sorted[i], sorted[i + 1], out=self.scratch)
+                np.maximum(sorted[i], sorted[i + 1], out=sorted[i + 1])
+                np.copyto(sorted[i], self.scratch)
+        np.copyto(filtered, sorted[len(sorted) // 2])
+
+
+#scalar Kalman filter per pixel, the temperature is modelled as a random walk
+#the measurement noise is the noise threshold squared, the process noise is how much a pixel may drift per frame
+class KalmanKernel():
+    def __init__(self, shape, process_noise=FILTER_KALMAN_PROCESS_NOISE):
+        self.process_noise = process_noise
+        self.variance = np.zeros(shape, dtype=np.float32)
+        self.gain = np.zeros(shape, dtype=np.float32)
+        self.delta = np.zeros(shape, dtype=np.float32)
+
+    def reset(self, filtered, noise_threshold):
+        self.variance[:] = noise_threshold**2
+
+    def step(self, data, filtered, noise_threshold):
+        #predict
+        np.add(self.variance, self.process_noise, self.variance)
+
+        #update
+        np.add(self.variance, noise_threshold**2, self.gain)
+        np.divide(self.variance, self.gain, self.gain)
+        np.subtract(data, filtered, self.delta)
+        np.multiply(self.delta, self.gain, self.delta)
+        np.add(filtered, self.delta, filtered)
+        np.subtract(1, self.gain, self.gain)
+        np.multiply(self.variance, self.gain, self.variance)
+
+
+#no filtering, the frame is copied as it is
+class NoKernel():
+    def __init__(self, shape):
+        pass
+
+    def reset(self, filtered, noise_threshold):
+        pass
+
+    def step(self, data, filtered, noise_threshold):
+        np.copyto(filtered, data, casting="same_kind")
+
+
+filter_kernel_classes = {
+    "Adaptive": AdaptiveKernel,
+    "EMA": EMAKernel,
+    "Median": MedianKernel,
+    "Kalman": KalmanKernel,
+    "None": NoKernel,
+}
+
+
+#class to filter the temperature frames over time with a selectable kernel
+#every kernel works in place on buffers made when it is selected, nothing is allocated per frame
+#filter returns the same buffer every frame, callers that keep a frame must copy it
+class TemperatureFilter():
+    def __init__(self, shape, noise_threshold=1.5, kernel=FILTER_KERNEL_DEFAULT):
+        self.shape = tuple(shape)
+        self.filtered = np.zeros(shape, dtype=np.float32)
+        self.noise_threshold = noise_threshold
+        self.initialized = False
+        self.kernel_name = None
+        self.kernel = None
+        self.set_kernel(kernel)
+
+    #switch kernel, the new one carries on from the current output
+    def set_kernel(self, name):
+        if name == self.kernel_name:
+            return
+        self.kernel = filter_kernel_classes[name](self.shape)
+        self.kernel_name = name
+        if self.initialized:
+            self.kernel.reset(self.filtered, self.noise_threshold)
+
+    def filter(self, data):
+        #start from the first frame rather than from zero
+        if not self.initialized:
+            np.copyto(self.filtered, data, casting="same_kind")
+            self.kernel.reset(self.filtered, self.noise_threshold)
+            self.initialized = True
+            return self.filtered
+
+        self.kernel.step(data, self.filtered, self.noise_threshold)
+        return self.filtered
+
+
+if __name__ == "__main__":
+    #per frame cost of every kernel
+    import time
+
+    rng = np.random.default_rng(0)
+    frames = (25 + rng.normal(0, 1, (2000, 24, 32))).astype(np.float32)
+    for name in filter_kernel_classes:
+        temperature_filter = TemperatureFilter((24, 32), FILTER_NOISE_DEFAULT, name)
+        temperature_filter.filter(frames[0])
+        start = time.perf_counter()
+        for frame in frames:
+            temperature_filter.filter(frame)
+        print("%-10s %6.1f us/frame" % (name, (time.perf_counter() - start) * 1e6 / len(frames)))
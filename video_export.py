@@ -0,0 +1,224 @@
+#Export a recording or a folder of captures to a video, drawn like the live view
+#   python video_export.py recordings/ir_cam_20240101_120000.irrec
+#   python video_export.py capture --fps 4 --range 20 40 --contours -o captures.mp4
+#Recordings are filtered in order like playback in the app, captures are the filtered frames the app saved
+#The frames are rendered by a pool of processes, each with its own FrameRenderer, into slots of a shared memory block
+#and written in order by this process, so the rendering scales with the cores and only the temperatures cross the pipe
+
+import argparse
+import configparser
+import glob
+import logging
+import multiprocessing
+import os
+import time
+from collections import deque
+from multiprocessing import shared_memory
+import numpy as np
+import cv2 as cv
+
+from constants import *
+from frame_renderer import FrameRenderer, RenderSettings, resolution_size
+from frame_player import Recording
+from frame_recorder import RECORDING_EXTENSION
+from temperature_filter import TemperatureFilter
+from hotspot_tracker import HotspotTracker
+from stage_timer import StageTimer
+
+#config logging to terminal
+logging.basicConfig(level=logging.INFO)
+
+
+#(timestamp, frame) of a recording in sensor orientation, filtered in order as the filter depends on the frames before
+def recording_frames(path, kernel=FILTER_KERNEL_DEFAULT, noise_threshold=FILTER_NOISE_DEFAULT):
+    recording = Recording(path)
+    temperature_filter = TemperatureFilter((24, 32), noise_threshold, kernel)
+    frame = np.empty((24, 32), dtype=np.float32)
+    for n in range(len(recording)):
+        yield recording.timestamp(n), temperature_filter.filter(recording.frame(n, out=frame))
+
+
+#(timestamp, frame) of the captures in a folder, in the order of their names, which start with the capture time
+#the captures are saved as shown, mirrored back here so both sources come in sensor orientation
+def capture_frames(folderpath, pattern=EXPORT_CAPTURE_PATTERN, fps=EXPORT_FPS_DEFAULT):
+    for n, filepath in enumerate(sorted(glob.glob(os.path.join(folderpath, pattern)))):
+        yield n / fps, np.fliplr(np.loadtxt(filepath, delimiter=",", dtype=np.float32).reshape(24, 32))
+
+
+#frames per second of a recording, to play the video at the speed it was recorded
+#rounded, some codecs cannot turn a rate with many digits into their time base
+def recording_fps(path):
+    recording = Recording(path)
+    if len(recording) < 2 or recording.duration() <= 0:
+        return EXPORT_FPS_DEFAULT
+    return round((len(recording) - 1) / recording.duration(), 2)
+
+
+#one render process per core, on a single core the pool only adds the copies and renders in this process instead
+def default_workers():
+    cores = os.cpu_count() or 1
+    return cores if cores > 1 else 0
+
+
+#state of a render process: its renderer and the image slots in the shared block
+_worker = {}
+
+def _start_worker(name, shape, slots):
+    block = shared_memory.SharedMemory(name=name)
+    _worker["block"] = block
+    _worker["images"] = np.ndarray((slots,) + shape, dtype=np.uint8, buffer=block.buf)
+    _worker["renderer"] = FrameRenderer()
+
+def _render_to_slot(job):
+    slot, data, settings = job
+    _worker["images"][slot] = _worker["renderer"].render(data, settings)
+    return slot
+
+
+#class to render frames in order into a video file
+#up to frames_per_worker frames per process are in flight, frame n goes to slot n of the ring of slots,
+#its slot is free again once frame n - slots has been written, so memory does not grow with the length of the video
+#workers=0 renders in this process
+class VideoExporter():
+    def __init__(self, path, settings, fps=EXPORT_FPS_DEFAULT, workers=None, codec=EXPORT_CODEC_DEFAULT,
+                 frames_per_worker=EXPORT_FRAMES_PER_WORKER, show_hotspots=False):
+        self.path = path
+        self.settings = settings
+        self.fps = fps
+        self.workers = default_workers() if workers is None else workers
+        self.hotspots = HotspotTracker() if show_hotspots else None
+        self.timer = StageTimer()
+        width, height = resolution_size(settings.display_resolution)
+        self.shape = (height, width, 3)
+
+        self.writer = cv.VideoWriter(path, cv.VideoWriter_fourcc(*codec), fps, (width, height))
+        if not self.writer.isOpened():
+            raise IOError("Could not open %s for writing with codec %s" % (path, codec))
+
+        self.pool = None
+        self.block = None
+        if self.workers > 0:
+            self.slots = self.workers * frames_per_worker
+            self.block = shared_memory.SharedMemory(create=True, size=self.slots * int(np.prod(self.shape)))
+            self.images = np.ndarray((self.slots,) + self.shape, dtype=np.uint8, buffer=self.block.buf)
+            self.pool = multiprocessing.Pool(self.workers, initializer=_start_worker, initargs=(self.block.name, self.shape, self.slots))
+        else:
+            self.renderer = FrameRenderer(timer=self.timer)
+
+    #render and write (timestamp, frame) in sensor orientation, returns the number of frames written
+    def export(self, frames):
+        count = 0
+        pending = deque()
+        for timestamp, data in frames:
+            settings = self.settings
+            if self.hotspots is not None:
+                #tracking follows the frames in order, so it stays here and only its overlay goes to the workers
+                self.hotspots.update(timestamp, data)
+                settings = settings._replace(hotspots=self.hotspots.overlay())
+            #mirrored like the display, copied as the filter reuses its buffer
+            data = np.ascontiguousarray(np.fliplr(data))
+
+            if self.pool is None:
+                start = time.perf_counter()
+                rgb = self.renderer.render(data, settings)
+                start = self.timer.lap("render", start)
+                self.writer.write(rgb)
+                self.timer.lap("write", start)
+                count += 1
+                continue
+
+            if len(pending) == self.slots:
+                self._write(pending.popleft())
+            pending.append(self.pool.apply_async(_render_to_slot, ((count % self.slots, data, settings),)))
+            count += 1
+        while pending:
+            self._write(pending.popleft())
+        self.timer.count("frames written", count)
+        return count
+
+    def _write(self, result):
+        start = time.perf_counter()
+        slot = result.get()
+        start = self.timer.lap("wait", start)
+        self.writer.write(self.images[slot])
+        self.timer.lap("write", start)
+
+    def close(self):
+        self.writer.release()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self.block is not None:
+            self.images = None
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+#export a recording or a folder of captures, returns the frames written and the seconds it took
+def export_video(source, path, settings, fps=None, workers=None, codec=EXPORT_CODEC_DEFAULT, show_hotspots=False,
+                 kernel=FILTER_KERNEL_DEFAULT, noise_threshold=FILTER_NOISE_DEFAULT, pattern=EXPORT_CAPTURE_PATTERN):
+    if os.path.isdir(source):
+        fps = fps or EXPORT_FPS_DEFAULT
+        frames = capture_frames(source, pattern, fps)
+    else:
+        fps = fps or recording_fps(source)
+        frames = recording_frames(source, kernel, noise_threshold)
+
+    start = time.perf_counter()
+    exporter = VideoExporter(path, settings, fps, workers, codec, show_hotspots=show_hotspots)
+    try:
+        count = exporter.export(frames)
+    finally:
+        exporter.close()
+    return count, time.perf_counter() - start
+
+
+def main():
+    config = configparser.ConfigParser()
+    config.read("ir_cam.ini")
+    color_map = config.get("Display", "color_map", fallback="Jet")
+
+    parser = argparse.ArgumentParser(description="Export a recording or a folder of captures to a video")
+    parser.add_argument("source", help="recording (%s) or folder of captures" % RECORDING_EXTENSION)
+    parser.add_argument("-o", "--output", help="video file, by default the source with .mp4")
+    parser.add_argument("--fps", type=float, help="frame rate of the video, by default the recorded rate or %d for captures" % EXPORT_FPS_DEFAULT)
+    parser.add_argument("--codec", default=EXPORT_CODEC_DEFAULT, help="four character code of the video codec")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="render processes, 0 renders in this process")
+    parser.add_argument("--pattern", default=EXPORT_CAPTURE_PATTERN, help="file names of the captures in a folder")
+    parser.add_argument("--color-map", default=color_map, choices=list(color_maps))
+    parser.add_argument("--resolution", default=DISPLAY_RESOLUTION_DEFAULT, choices=list(display_resolutions))
+    parser.add_argument("--interpolation", default="Cubic", choices=list(display_interpolations))
+    parser.add_argument("--colorization", default=COLORIZATION_DEFAULT, choices=colorizations)
+    parser.add_argument("--range", type=float, nargs=2, metavar=("MIN", "MAX"), help="fixed temperature range instead of autorange")
+    parser.add_argument("--no-ticks", action="store_true", help="leave out the scale tick marks")
+    parser.add_argument("--contours", action="store_true", help="outline the hottest and coldest regions")
+    parser.add_argument("--contour-tolerance", type=float, default=CONTOUR_TOLERANCE_DEFAULT)
+    parser.add_argument("--hotspots", action="store_true", help="mark the tracked hotspots")
+    parser.add_argument("--filter-kernel", default=FILTER_KERNEL_DEFAULT, choices=filter_kernels, help="temporal filter for recordings")
+    parser.add_argument("--noise-threshold", type=float, default=FILTER_NOISE_DEFAULT)
+    args = parser.parse_args()
+
+    settings = RenderSettings(
+        color_map=args.color_map,
+        display_resolution=args.resolution,
+        display_interpolation=args.interpolation,
+        colorization=args.colorization,
+        show_scale_ticks=not args.no_ticks,
+        show_contours=args.contours,
+        contour_tolerance=args.contour_tolerance,
+        show_hotspots=args.hotspots,
+    )
+    if args.range:
+        settings = settings._replace(min_temp_autorange=False, max_temp_autorange=False,
+                                     min_temp_manual=args.range[0], max_temp_manual=args.range[1])
+    output = args.output or os.path.splitext(os.path.normpath(args.source))[0] + ".mp4"
+
+    count, elapsed = export_video(args.source, output, settings, args.fps, args.workers, args.codec, args.hotspots,
+                                  args.filter_kernel, args.noise_threshold, args.pattern)
+    logging.info("Wrote %d frames to %s in %.1f s, %.1f frames per second with %d workers" % (count, output, elapsed, count / max(elapsed, 1e-9), args.workers))
+
+
+if __name__ == "__main__":
+    main()